@@ -0,0 +1,105 @@
+import time
+from collections import Counter, defaultdict
+from gettext import gettext as _
+from logging import getLogger
+
+from aiohttp import web
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from pulpcore.content import app
+from pulpcore.plugin.models import Distribution, Remote
+
+from pulp_replica.app.models import ReplicatedRepository, RequestedPath
+
+log = getLogger(__name__)
+
+_counts = Counter()
+_flushed = time.monotonic()
+# The base paths whose requests are counted, None until they are loaded
+_base_paths = None
+
+
+def warmable_base_paths():
+    """
+    Return the base paths of the replicated distributions whose content is downloaded on demand.
+
+    Streamed content is never saved, so warming it would only download it again.
+    """
+    return set(
+        Distribution.objects.filter(
+            repository__in=ReplicatedRepository.objects.values("repository_id"),
+            repository__remote__policy=Remote.ON_DEMAND,
+        ).values_list("base_path", flat=True)
+    )
+
+
+def requested_path(path, base_paths):
+    """Return the (base_path, relative_path) of a content app path, or None if not counted."""
+    prefix = f"/{settings.CONTENT_PATH_PREFIX.strip('/')}/"
+    if not path.startswith(prefix):
+        return None
+    parts = path[len(prefix) :].split("/")
+    for i in range(len(parts) - 1, 0, -1):
+        base_path = "/".join(parts[:i])
+        if base_path in base_paths:
+            relative_path = "/".join(parts[i:])
+            return (base_path, relative_path) if relative_path else None
+    return None
+
+
+def save_counts(counts):
+    """
+    Add the request counts of this process to the saved ones, with one update per count and base
+    path, and return the base paths to count the requests of from now on.
+    """
+    RequestedPath.objects.bulk_create(
+        [
+            RequestedPath(base_path=base_path, relative_path=relative_path)
+            for base_path, relative_path in counts
+        ],
+        ignore_conflicts=True,
+    )
+    paths_by_count = defaultdict(list)
+    for (base_path, relative_path), count in counts.items():
+        paths_by_count[count, base_path].append(relative_path)
+    now = timezone.now()
+    for (count, base_path), relative_paths in paths_by_count.items():
+        RequestedPath.objects.filter(base_path=base_path, relative_path__in=relative_paths).update(
+            count=F("count") + count, last_requested=now, pulp_last_updated=now
+        )
+    return warmable_base_paths()
+
+
+@web.middleware
+async def count_requests(request, handler):
+    """
+    Count the content of replicated on_demand distributions served by path, saving the counts every
+    few seconds.
+    """
+    global _counts, _flushed, _base_paths
+
+    response = await handler(request)
+    if _base_paths is None or (
+        time.monotonic() - _flushed >= settings.REPLICATION_REQUEST_FLUSH_INTERVAL
+    ):
+        counts, _counts = _counts, Counter()
+        _flushed = time.monotonic()
+        if _base_paths is None:
+            # Requests are not counted while the base paths are loaded for the first time
+            _base_paths = set()
+        try:
+            _base_paths = await sync_to_async(save_counts)(counts)
+        except Exception as e:
+            # Losing some counts is better than failing to serve the content
+            log.warning(_("Failed to save the content request counts: {}").format(e))
+    if request.method == "GET" and response.status < 400:
+        path = requested_path(request.path, _base_paths)
+        if path:
+            _counts[path] += 1
+    return response
+
+
+app.middlewares.append(count_requests)
@@ -0,0 +1,265 @@
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from gettext import gettext as _
+
+from django.db import connection
+from django.db.models import F
+
+from pulpcore.plugin.constants import TASK_STATES
+from pulpcore.plugin.models import GroupProgressReport, ProgressReport, Task, TaskGroup
+
+try:
+    from opentelemetry import metrics as otel_metrics
+except ImportError:
+    otel_metrics = None
+
+# The code and message of the progress report recording the time spent in each phase, in ms
+PHASES = {
+    "connect": ("replicate.duration.connect", _("Loading the upstream API (ms)")),
+    "list": ("replicate.duration.list", _("Listing upstream distributions (ms)")),
+    "lookup": (
+        "replicate.duration.lookup",
+        _("Looking up upstream repositories and publications (ms)"),
+    ),
+    "upsert": ("replicate.duration.upsert", _("Updating remotes and repositories (ms)")),
+    "dispatch": ("replicate.duration.dispatch", _("Dispatching tasks (ms)")),
+    "distributions": ("replicate.duration.distributions", _("Updating distributions (ms)")),
+    "sync": ("replicate.duration.sync", _("Syncing repositories (ms)")),
+    "remove": ("replicate.duration.remove", _("Removing stale objects (ms)")),
+    "prefilter": (
+        "replicate.duration.prefilter",
+        _("Looking up the upstream artifacts present locally (ms)"),
+    ),
+    "warm": ("replicate.duration.warm", _("Downloading the most requested artifacts (ms)")),
+}
+
+# The code and message of the progress report recording each counter, the bytes_* counters in KiB
+# to fit in the progress reports
+COUNTERS = {
+    "api_calls": ("replicate.upstream.calls", _("Upstream API calls")),
+    "bytes_received": ("replicate.upstream.bytes", _("Data received from the upstream API (KiB)")),
+    "db_queries": ("replicate.db.queries", _("Database queries")),
+    "remotes_created": ("replicate.remotes.created", _("Created remotes")),
+    "remotes_updated": ("replicate.remotes.updated", _("Updated remotes")),
+    "remotes_unchanged": ("replicate.remotes.unchanged", _("Unchanged remotes")),
+    "repositories_created": ("replicate.repositories.created", _("Created repositories")),
+    "repositories_updated": ("replicate.repositories.updated", _("Updated repositories")),
+    "repositories_unchanged": ("replicate.repositories.unchanged", _("Unchanged repositories")),
+    "distributions_created": ("replicate.distributions.created", _("Created distributions")),
+    "distributions_updated": ("replicate.distributions.updated", _("Updated distributions")),
+    "distributions_unchanged": (
+        "replicate.distributions.unchanged",
+        _("Unchanged distributions"),
+    ),
+    "distributions_failed": ("replicate.distributions.failed", _("Failed distributions")),
+    "distributions_removed": ("replicate.distributions.removed", _("Removed distributions")),
+    "remotes_removed": ("replicate.remotes.removed", _("Removed remotes")),
+    "repositories_removed": ("replicate.repositories.removed", _("Removed repositories")),
+    "repositories_detached": ("replicate.repositories.detached", _("Detached repositories")),
+    "content_added": ("replicate.content.added", _("Content added by delta syncs")),
+    "content_removed": ("replicate.content.removed", _("Content removed by delta syncs")),
+    "full_syncs": ("replicate.syncs.full", _("Delta syncs replaced by full syncs")),
+    "artifacts_present": ("replicate.artifacts.present", _("Artifacts already present")),
+    "artifacts_missing": ("replicate.artifacts.missing", _("Artifacts to download")),
+    "bytes_saved": ("replicate.artifacts.bytes_saved", _("Data not downloaded (KiB)")),
+    "artifacts_warmed": ("replicate.warm.artifacts", _("Downloaded requested artifacts")),
+    "bytes_warmed": ("replicate.warm.bytes", _("Data of downloaded requested artifacts (KiB)")),
+    "artifacts_warm_failed": (
+        "replicate.warm.failed",
+        _("Requested artifacts that failed to download"),
+    ),
+    "chunks_dispatched": ("replicate.tasks.chunks", _("Dispatched reconcile tasks")),
+    "syncs_dispatched": ("replicate.tasks.syncs", _("Dispatched sync tasks")),
+    "syncs_in_progress": (
+        "replicate.tasks.syncs_in_progress",
+        _("Syncs not dispatched while a previous one is not finished"),
+    ),
+    "distribution_updates_dispatched": (
+        "replicate.tasks.distributions",
+        _("Dispatched distribution update tasks"),
+    ),
+    "removals_dispatched": ("replicate.tasks.removals", _("Dispatched stale object removals")),
+    "removals_skipped": (
+        "replicate.tasks.removals_skipped",
+        _("Stale object removals skipped as too large"),
+    ),
+}
+
+_instruments = {}
+_instruments_lock = threading.Lock()
+
+
+def get_instrument(kind, name, **kwargs):
+    """
+    Return the OpenTelemetry instrument called `name`, or None if opentelemetry is not installed.
+
+    Args:
+        kind (str): The name of the meter method creating the instrument, e.g. "create_counter".
+        name (str): The name of the metric.
+        kwargs: The unit and description of the instrument.
+    """
+    if otel_metrics is None:
+        return None
+    with _instruments_lock:
+        if name not in _instruments:
+            meter = otel_metrics.get_meter("pulp_replica")
+            _instruments[name] = getattr(meter, kind)(name, **kwargs)
+        return _instruments[name]
+
+
+def create_group_progress_reports(task_group):
+    """Create the group progress reports adding up the metrics of all tasks of a replication."""
+    GroupProgressReport.objects.bulk_create(
+        GroupProgressReport(message=message, code=code, done=0, task_group=task_group)
+        for code, message in (*PHASES.values(), *COUNTERS.values())
+    )
+
+
+class ReplicationMetrics:
+    """
+    Timers and counters of the phases of a replication task.
+
+    They are saved as progress reports of the task and added to the group progress reports of its
+    task group. If opentelemetry-api is installed, they are also emitted as the
+    "pulp_replica.replication.duration" histogram and "pulp_replica.replication.<counter>"
+    counters, for the OpenTelemetry or Prometheus exporter the workers are configured with.
+    """
+
+    def __init__(self):
+        self.durations = Counter()
+        self.counters = Counter()
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_tasks(cls, task_pks):
+        """
+        Return the metrics recorded as progress reports of some tasks, added up.
+
+        Args:
+            task_pks (list): The pks of the tasks.
+        """
+        metrics = cls()
+        phases = {code: phase for phase, (code, message) in PHASES.items()}
+        counters = {code: name for name, (code, message) in COUNTERS.items()}
+        for code, done in ProgressReport.objects.filter(
+            task__in=task_pks, code__in=[*phases, *counters]
+        ).values_list("code", "done"):
+            if code in phases:
+                metrics.durations[phases[code]] += done / 1000
+            elif counters[code].startswith("bytes_"):
+                metrics.counters[counters[code]] += done * 1024
+            else:
+                metrics.counters[counters[code]] += done
+        return metrics
+
+    def add(self, name, value=1):
+        """Add `value` to a counter."""
+        with self.lock:
+            self.counters[name] += value
+
+    @contextmanager
+    def timer(self, phase):
+        """Add the time spent in the block to a phase."""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - started
+            with self.lock:
+                self.durations[phase] += elapsed
+
+    def count_response(self, response, **kwargs):
+        """Count an upstream API call, as a response hook of a requests session."""
+        self.add("api_calls")
+        if kwargs.get("stream"):
+            # Reading a streamed response here would load all of it, its reader counts the bytes
+            return
+        self.add("bytes_received", len(response.content))
+
+    def count_query(self, execute, sql, params, many, context):
+        """Count a database query, as an execute wrapper of a database connection."""
+        self.add("db_queries")
+        return execute(sql, params, many, context)
+
+    @contextmanager
+    def collect(self, session=None):
+        """
+        Count the database queries of this thread, and the API calls of `session`, in the block.
+
+        :param session: requests.Session calling the upstream API
+        """
+        if session is not None:
+            session.hooks["response"].append(self.count_response)
+        try:
+            with connection.execute_wrapper(self.count_query):
+                yield self
+        finally:
+            if session is not None:
+                session.hooks["response"].remove(self.count_response)
+
+    def values(self):
+        """Return the (code, message, value) of the progress reports recording the metrics."""
+        values = [
+            (*PHASES[phase], round(seconds * 1000)) for phase, seconds in self.durations.items()
+        ]
+        values.extend(
+            (*COUNTERS[name], round(value / 1024) if name.startswith("bytes_") else value)
+            for name, value in self.counters.items()
+        )
+        return values
+
+    def save(self, app_label, combined=None):
+        """
+        Record the metrics on the current task and task group, and emit them.
+
+        Args:
+            app_label (str): The label of the plugin being replicated.
+            combined (ReplicationMetrics): Metrics of other tasks that were already saved. They
+                are added to the metrics recorded on the current task, but not added to the task
+                group or emitted again.
+        """
+        values = self.values()
+        task_values = values
+        if combined is not None:
+            totals = ReplicationMetrics()
+            totals.durations = self.durations + combined.durations
+            totals.counters = self.counters + combined.counters
+            task_values = totals.values()
+        task = Task.current()
+        ProgressReport.objects.bulk_create(
+            ProgressReport(
+                message=message,
+                code=code,
+                total=value,
+                done=value,
+                state=TASK_STATES.COMPLETED,
+                task=task,
+            )
+            for code, message, value in task_values
+        )
+        task_group = TaskGroup.current()
+        if task_group is not None:
+            for code, message, value in values:
+                GroupProgressReport.objects.filter(task_group=task_group, code=code).update(
+                    done=F("done") + value
+                )
+
+        histogram = get_instrument(
+            "create_histogram",
+            "pulp_replica.replication.duration",
+            unit="s",
+            description="Time spent in a phase of a replication",
+        )
+        if histogram is not None:
+            for phase, seconds in self.durations.items():
+                histogram.record(seconds, {"plugin": app_label, "phase": phase})
+            for name, value in self.counters.items():
+                counter = get_instrument(
+                    "create_counter",
+                    f"pulp_replica.replication.{name}",
+                    unit="By" if name.startswith("bytes_") else "1",
+                    description=COUNTERS[name][1],
+                )
+                counter.add(value, {"plugin": app_label})
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('replica', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='server',
+            name='max_concurrent_requests',
+            field=models.PositiveIntegerField(default=10),
+        ),
+    ]
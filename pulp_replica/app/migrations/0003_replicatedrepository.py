@@ -0,0 +1,30 @@
+from django.db import migrations, models
+import django.db.models.deletion
+import django_lifecycle.mixins
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0091_systemid'),
+        ('replica', '0002_server_max_concurrent_requests'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReplicatedRepository',
+            fields=[
+                ('pulp_id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('pulp_created', models.DateTimeField(auto_now_add=True)),
+                ('pulp_last_updated', models.DateTimeField(auto_now=True, null=True)),
+                ('upstream_content_href', models.TextField(null=True)),
+                ('repository', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.repository')),
+                ('server', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='replicated_repositories', to='replica.server')),
+            ],
+            options={
+                'abstract': False,
+            },
+            bases=(django_lifecycle.mixins.LifecycleModelMixin, models.Model),
+        ),
+    ]
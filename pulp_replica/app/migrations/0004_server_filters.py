@@ -0,0 +1,32 @@
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('replica', '0003_replicatedrepository'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='server',
+            name='base_path_filters',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.TextField(), null=True, size=None),
+        ),
+        migrations.AddField(
+            model_name='server',
+            name='name_regex',
+            field=models.TextField(null=True),
+        ),
+        migrations.AddField(
+            model_name='server',
+            name='plugin_types',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.TextField(), null=True, size=None),
+        ),
+        migrations.AddField(
+            model_name='server',
+            name='pulp_label_select',
+            field=models.TextField(null=True),
+        ),
+    ]
@@ -0,0 +1,30 @@
+from django.db import migrations, models
+import django.db.models.deletion
+import django_lifecycle.mixins
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('replica', '0004_server_filters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReplicationState',
+            fields=[
+                ('pulp_id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('pulp_created', models.DateTimeField(auto_now_add=True)),
+                ('pulp_last_updated', models.DateTimeField(auto_now=True, null=True)),
+                ('plugin', models.TextField()),
+                ('high_water_mark', models.DateTimeField(null=True)),
+                ('last_full_pass', models.DateTimeField(null=True)),
+                ('server', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='replication_states', to='replica.server')),
+            ],
+            options={
+                'unique_together': {('server', 'plugin')},
+            },
+            bases=(django_lifecycle.mixins.LifecycleModelMixin, models.Model),
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('replica', '0005_replicationstate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='server',
+            name='stale_policy',
+            field=models.TextField(choices=[('keep', 'Keep'), ('detach', 'Remove the distributions and remotes, keep the repositories'), ('delete', 'Remove the distributions, remotes and repositories')], default='detach'),
+        ),
+    ]
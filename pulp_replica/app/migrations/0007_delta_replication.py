@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('replica', '0006_server_stale_policy'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='replicatedrepository',
+            name='upstream_version_href',
+            field=models.TextField(null=True),
+        ),
+        migrations.AddField(
+            model_name='server',
+            name='delta_replication',
+            field=models.BooleanField(default=False),
+        ),
+    ]
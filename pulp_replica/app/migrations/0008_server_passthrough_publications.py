@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('replica', '0007_delta_replication'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='server',
+            name='passthrough_publications',
+            field=models.BooleanField(default=False),
+        ),
+    ]
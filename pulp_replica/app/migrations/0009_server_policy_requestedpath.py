@@ -0,0 +1,43 @@
+from django.db import migrations, models
+import django.utils.timezone
+import django_lifecycle.mixins
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('replica', '0008_server_passthrough_publications'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='server',
+            name='policy',
+            field=models.TextField(choices=[('immediate', 'When syncing, download all metadata and content now.'), ('on_demand', 'When syncing, download metadata, but do not download content now. Instead, download content as clients request it, and save it in Pulp to be served for future client requests.'), ('streamed', 'When syncing, download metadata, but do not download content now. Instead,download content as clients request it, but never save it in Pulp. This causes future requests for that same content to have to be downloaded again.')], default='immediate'),
+        ),
+        migrations.CreateModel(
+            name='RequestedPath',
+            fields=[
+                ('pulp_id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('pulp_created', models.DateTimeField(auto_now_add=True)),
+                ('pulp_last_updated', models.DateTimeField(auto_now=True, null=True)),
+                ('base_path', models.TextField()),
+                ('relative_path', models.TextField()),
+                ('count', models.BigIntegerField(default=0)),
+                ('last_requested', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'unique_together': {('base_path', 'relative_path')},
+            },
+            bases=(django_lifecycle.mixins.LifecycleModelMixin, models.Model),
+        ),
+        migrations.AddIndex(
+            model_name='requestedpath',
+            index=models.Index(fields=['base_path', 'count'], name='replica_path_count_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='requestedpath',
+            index=models.Index(fields=['last_requested'], name='replica_path_requested_idx'),
+        ),
+    ]
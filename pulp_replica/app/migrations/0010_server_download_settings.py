@@ -0,0 +1,41 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('replica', '0009_server_policy_requestedpath'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='server',
+            name='connect_timeout',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AddField(
+            model_name='server',
+            name='download_concurrency',
+            field=models.PositiveIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='server',
+            name='rate_limit',
+            field=models.IntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='server',
+            name='sock_connect_timeout',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AddField(
+            model_name='server',
+            name='sock_read_timeout',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AddField(
+            model_name='server',
+            name='total_timeout',
+            field=models.FloatField(null=True),
+        ),
+    ]
@@ -0,0 +1,51 @@
+from django.db import migrations, models
+import django.db.models.deletion
+import django_lifecycle.mixins
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('replica', '0010_server_download_settings'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='replicationstate',
+            name='checkpoint_full_pass',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='replicationstate',
+            name='checkpoint_high_water_mark',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name='replicationstate',
+            name='checkpoint_listed',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='replicationstate',
+            name='checkpoint_started',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.CreateModel(
+            name='ReplicationChunk',
+            fields=[
+                ('pulp_id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('pulp_created', models.DateTimeField(auto_now_add=True)),
+                ('pulp_last_updated', models.DateTimeField(auto_now=True, null=True)),
+                ('distributions', models.JSONField()),
+                ('entities', models.JSONField(default=dict)),
+                ('position', models.PositiveIntegerField(default=0)),
+                ('reconciled', models.BooleanField(default=False)),
+                ('state', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='replica.replicationstate')),
+            ],
+            options={
+                'abstract': False,
+            },
+            bases=(django_lifecycle.mixins.LifecycleModelMixin, models.Model),
+        ),
+    ]
@@ -0,0 +1,49 @@
+from django.db import migrations, models
+import django.db.models.deletion
+import django_lifecycle.mixins
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0091_systemid'),
+        ('replica', '0011_replication_checkpoints'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReplicationRecord',
+            fields=[
+                ('pulp_id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('pulp_created', models.DateTimeField(auto_now_add=True)),
+                ('pulp_last_updated', models.DateTimeField(auto_now=True, null=True)),
+                ('name', models.TextField()),
+                ('plugin', models.TextField()),
+                ('upstream_version_href', models.TextField(null=True)),
+                ('started', models.DateTimeField()),
+                ('duration', models.FloatField(default=0)),
+                ('delta', models.BooleanField(default=False)),
+                ('content_added', models.PositiveIntegerField(default=0)),
+                ('content_removed', models.PositiveIntegerField(default=0)),
+                ('artifacts_added', models.PositiveIntegerField(default=0)),
+                ('bytes_downloaded', models.BigIntegerField(default=0)),
+                ('result', models.TextField()),
+                ('server', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='records', to='replica.server')),
+                ('task', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.task')),
+            ],
+            bases=(django_lifecycle.mixins.LifecycleModelMixin, models.Model),
+        ),
+        migrations.AddIndex(
+            model_name='replicationrecord',
+            index=models.Index(fields=['server', 'name', 'started'], name='replica_record_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='replicationrecord',
+            index=models.Index(fields=['server', 'started'], name='replica_record_started_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='replicationrecord',
+            index=models.Index(fields=['server', 'duration'], name='replica_record_duration_idx'),
+        ),
+    ]
@@ -5,10 +5,17 @@ Check `Plugin Writer's Guide`_ for more details.
     https://docs.pulpproject.org/pulpcore/plugins/plugin-writer/index.html
 """
 
+import os
+import shutil
+from functools import partial
 from logging import getLogger
 
-from django.db import models
-from pulpcore.plugin.models import BaseModel, EncryptedTextField
+from django.conf import settings
+from django.contrib.postgres.fields import ArrayField
+from django.db import models, transaction
+from django.utils import timezone
+from django_lifecycle import BEFORE_DELETE, hook
+from pulpcore.plugin.models import BaseModel, EncryptedTextField, Remote
 
 
 class Server(BaseModel):
@@ -24,3 +31,238 @@ class Server(BaseModel):
 
     username = EncryptedTextField(null=True)
     password = EncryptedTextField(null=True)
+
+    # Concurrent API requests of each replication task, the upstream gets a multiple of it from
+    # the tasks running in parallel
+    max_concurrent_requests = models.PositiveIntegerField(default=10)
+
+    # Download settings of the replicated remotes, None uses the defaults of the remotes
+    download_concurrency = models.PositiveIntegerField(null=True)
+    rate_limit = models.IntegerField(null=True)
+    total_timeout = models.FloatField(null=True)
+    connect_timeout = models.FloatField(null=True)
+    sock_connect_timeout = models.FloatField(null=True)
+    sock_read_timeout = models.FloatField(null=True)
+
+    # The fields copied into the replicated remotes
+    REMOTE_FIELDS = (
+        "ca_cert",
+        "client_cert",
+        "client_key",
+        "tls_validation",
+        "download_concurrency",
+        "rate_limit",
+        "total_timeout",
+        "connect_timeout",
+        "sock_connect_timeout",
+        "sock_read_timeout",
+    )
+
+    # The download policy of the replicated remotes
+    policy = models.TextField(choices=Remote.POLICY_CHOICES, default=Remote.IMMEDIATE)
+
+    # Filters selecting the upstream distributions to replicate
+    base_path_filters = ArrayField(models.TextField(), null=True)
+    name_regex = models.TextField(null=True)
+    pulp_label_select = models.TextField(null=True)
+    plugin_types = ArrayField(models.TextField(), null=True)
+
+    # What happens to the local objects replicated from upstream distributions that are gone
+    KEEP = "keep"
+    DETACH = "detach"
+    DELETE = "delete"
+    STALE_POLICY_CHOICES = (
+        (KEEP, "Keep"),
+        (DETACH, "Remove the distributions and remotes, keep the repositories"),
+        (DELETE, "Remove the distributions, remotes and repositories"),
+    )
+    stale_policy = models.TextField(choices=STALE_POLICY_CHOICES, default=DETACH)
+
+    # Apply the content changes between upstream repository versions instead of full syncs
+    delta_replication = models.BooleanField(default=False)
+
+    # Publish the upstream metadata instead of generating it locally
+    passthrough_publications = models.BooleanField(default=False)
+
+    @property
+    def cache_dir(self):
+        """The directory caching data about the upstream server, e.g. its API schema."""
+        cache_dir = settings.REPLICATION_CACHE_DIR or os.path.join(settings.DEPLOY_ROOT, "replica")
+        return os.path.join(cache_dir, str(self.pk))
+
+    @hook(BEFORE_DELETE)
+    def _remove_cache_dir(self):
+        """Remove the data cached about the upstream server once it is deleted."""
+        transaction.on_commit(partial(shutil.rmtree, self.cache_dir, ignore_errors=True))
+
+
+class ReplicatedRepository(BaseModel):
+    """
+    A local repository replicated from a distribution of an upstream Pulp server.
+
+    Fields:
+        upstream_content_href (models.TextField): The upstream publication or repository version
+            the repository was last successfully synced from.
+        upstream_version_href (models.TextField): The upstream repository version the repository
+            was last successfully synced from, also when a publication of it was distributed.
+
+    Relations:
+        server (models.ForeignKey): The server the repository is replicated from.
+        repository (models.OneToOneField): The replicated repository.
+    """
+
+    server = models.ForeignKey(
+        Server, on_delete=models.CASCADE, related_name="replicated_repositories"
+    )
+    repository = models.OneToOneField("core.Repository", on_delete=models.CASCADE, related_name="+")
+    upstream_content_href = models.TextField(null=True)
+    upstream_version_href = models.TextField(null=True)
+
+
+class ReplicationState(BaseModel):
+    """
+    The state of the replication of one plugin type from an upstream Pulp server.
+
+    Fields:
+        plugin (models.TextField): The label of the replicated plugin.
+        high_water_mark (models.DateTimeField): The newest upstream `pulp_last_updated` of the
+            distributions and repositories when the last replication started.
+        last_full_pass (models.DateTimeField): When the last replication of all the upstream
+            distributions started.
+        checkpoint_started (models.DateTimeField): When the replication in progress started, or
+            None if no replication is in progress.
+        checkpoint_high_water_mark (models.DateTimeField): The upstream high water mark when the
+            replication in progress started.
+        checkpoint_full_pass (models.BooleanField): Whether the replication in progress replicates
+            all the upstream distributions.
+        checkpoint_listed (models.BooleanField): Whether all the upstream distributions of the
+            replication in progress were split into chunks.
+
+    Relations:
+        server (models.ForeignKey): The replicated server.
+    """
+
+    server = models.ForeignKey(Server, on_delete=models.CASCADE, related_name="replication_states")
+    plugin = models.TextField()
+    high_water_mark = models.DateTimeField(null=True)
+    last_full_pass = models.DateTimeField(null=True)
+
+    # The replication in progress, kept until it completes so that it can be resumed
+    checkpoint_started = models.DateTimeField(null=True)
+    checkpoint_high_water_mark = models.DateTimeField(null=True)
+    checkpoint_full_pass = models.BooleanField(default=False)
+    checkpoint_listed = models.BooleanField(default=False)
+
+    class Meta:
+        unique_together = ("server", "plugin")
+
+
+class ReplicationChunk(BaseModel):
+    """
+    A chunk of the upstream distributions of a replication in progress, reconciled by one task.
+
+    Fields:
+        distributions (models.JSONField): The upstream distributions of the chunk.
+        entities (models.JSONField): The upstream repositories and publications described by the
+            replication feed, keyed by href.
+        position (models.PositiveIntegerField): The number of distributions already reconciled.
+        reconciled (models.BooleanField): Whether all the distributions were reconciled.
+
+    Relations:
+        state (models.ForeignKey): The replication state of the server and plugin.
+    """
+
+    state = models.ForeignKey(ReplicationState, on_delete=models.CASCADE, related_name="chunks")
+    distributions = models.JSONField()
+    entities = models.JSONField(default=dict)
+    position = models.PositiveIntegerField(default=0)
+    reconciled = models.BooleanField(default=False)
+
+
+class ReplicationRecord(BaseModel):
+    """
+    The history of the syncs of a replicated distribution, one record per sync task.
+
+    Fields:
+        name (models.TextField): The name of the distribution and its repository.
+        plugin (models.TextField): The label of the plugin of the distribution.
+        upstream_version_href (models.TextField): The upstream repository version synced.
+        started (models.DateTimeField): When the sync started.
+        duration (models.FloatField): How long the sync took, in seconds.
+        delta (models.BooleanField): Whether the changes were applied as a delta.
+        content_added (models.PositiveIntegerField): The content added to the repository.
+        content_removed (models.PositiveIntegerField): The content removed from the repository.
+        artifacts_added (models.PositiveIntegerField): The artifacts downloaded by the sync.
+        bytes_downloaded (models.BigIntegerField): The size of the artifacts downloaded.
+        result (models.TextField): The state the sync finished in, "completed" or "failed".
+
+    Relations:
+        server (models.ForeignKey): The server the distribution is replicated from.
+        task (models.ForeignKey): The task that synced the repository.
+    """
+
+    server = models.ForeignKey(Server, on_delete=models.CASCADE, related_name="records")
+    task = models.ForeignKey("core.Task", on_delete=models.SET_NULL, null=True, related_name="+")
+    name = models.TextField()
+    plugin = models.TextField()
+    upstream_version_href = models.TextField(null=True)
+    started = models.DateTimeField()
+    duration = models.FloatField(default=0)
+    delta = models.BooleanField(default=False)
+    content_added = models.PositiveIntegerField(default=0)
+    content_removed = models.PositiveIntegerField(default=0)
+    artifacts_added = models.PositiveIntegerField(default=0)
+    bytes_downloaded = models.BigIntegerField(default=0)
+    result = models.TextField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["server", "name", "started"], name="replica_record_name_idx"),
+            models.Index(fields=["server", "started"], name="replica_record_started_idx"),
+            models.Index(fields=["server", "duration"], name="replica_record_duration_idx"),
+        ]
+
+
+class ReplicationPlan(BaseModel):
+    """
+    What replicating a server would do, as computed by a plan task.
+
+    Fields:
+        force (models.BooleanField): Whether the plan syncs all repositories, even if their
+            upstream content did not change.
+        summary (models.JSONField): The number of planned actions per plugin type.
+        diff (models.JSONField): The actions planned per upstream distribution, if requested.
+
+    Relations:
+        server (models.ForeignKey): The server the plan replicates.
+    """
+
+    server = models.ForeignKey(Server, on_delete=models.CASCADE, related_name="plans")
+    force = models.BooleanField(default=False)
+    summary = models.JSONField(default=dict)
+    diff = models.JSONField(null=True)
+
+
+class RequestedPath(BaseModel):
+    """
+    A path of a replicated distribution requested from the content app, counted to find the
+    content worth warming.
+
+    Fields:
+        base_path (models.TextField): The base path of the distribution serving the path.
+        relative_path (models.TextField): The requested path, relative to the base path.
+        count (models.BigIntegerField): How many times the path was served successfully.
+        last_requested (models.DateTimeField): When requests of the path were last saved.
+    """
+
+    base_path = models.TextField()
+    relative_path = models.TextField()
+    count = models.BigIntegerField(default=0)
+    last_requested = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        unique_together = ("base_path", "relative_path")
+        indexes = [
+            models.Index(fields=["base_path", "count"], name="replica_path_count_idx"),
+            models.Index(fields=["last_requested"], name="replica_path_requested_idx"),
+        ]
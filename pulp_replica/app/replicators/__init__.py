@@ -0,0 +1,75 @@
+"""
+Registry of the replicators, keyed by the label of the plugin whose distributions they replicate.
+
+Replicators are imported on first use, and only the ones whose Pulp plugin and pulp-cli plugin are
+both installed are enabled. This keeps pulp-glue and the plugins' tasks out of the startup of every
+API and worker process, and lets pulp-replica run without any particular plugin installed.
+"""
+
+from functools import lru_cache
+from gettext import gettext as _
+from importlib.util import find_spec
+
+from django.apps import apps
+from django.utils.module_loading import import_string
+
+_registry = {}
+
+
+def register_replicator(app_label, replicator, app_name, cli_module):
+    """
+    Register a replicator.
+
+    Args:
+        app_label (str): The label of the plugin whose distributions are replicated.
+        replicator (str): The import path of the plugin's Replicator subclass.
+        app_name (str): The Django app of the plugin, e.g. "pulp_file.app".
+        cli_module (str): The pulp-cli module providing the plugin's contexts.
+    """
+    _registry[app_label] = (replicator, app_name, cli_module)
+    get_replicator.cache_clear()
+
+
+def _is_importable(module):
+    try:
+        return find_spec(module) is not None
+    except ModuleNotFoundError:
+        return False
+
+
+def get_replicator_labels():
+    """Return the labels of the enabled replicators without importing them."""
+    return [
+        app_label
+        for app_label, (replicator, app_name, cli_module) in _registry.items()
+        if apps.is_installed(app_name) and _is_importable(cli_module)
+    ]
+
+
+def get_pulp_ctx(server):
+    """Return a context for calling the API of an upstream server, see `upstream.get_pulp_ctx`."""
+    # pulp-glue is only needed while replicating, keep it out of the startup of other processes
+    from pulp_replica.app.upstream import get_pulp_ctx
+
+    return get_pulp_ctx(server)
+
+
+@lru_cache(maxsize=None)
+def get_replicator(app_label):
+    """
+    Return the Replicator class for a plugin label, importing it on first use.
+
+    Raises:
+        LookupError: If no replicator is enabled for the plugin.
+    """
+    if app_label not in get_replicator_labels():
+        raise LookupError(_("No replicator is enabled for '{}'.").format(app_label))
+    return import_string(_registry[app_label][0])
+
+
+register_replicator(
+    "file", "pulp_replica.app.replicators.file.FileReplicator", "pulp_file.app", "pulpcore.cli.file"
+)
+register_replicator(
+    "rpm", "pulp_replica.app.replicators.rpm.RpmReplicator", "pulp_rpm.app", "pulpcore.cli.rpm"
+)
@@ -0,0 +1,916 @@
+import datetime
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor
+from fnmatch import fnmatchcase
+from functools import reduce
+from gettext import gettext as _
+from itertools import islice
+from logging import getLogger
+from operator import or_
+from urllib.parse import urljoin
+
+import requests
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+from pulp_replica.app.metrics import ReplicationMetrics
+from pulp_replica.app.models import ReplicatedRepository, Server
+from pulp_replica.app.tasks.distributing import is_up_to_date, update_distributions
+from pulp_replica.app.tasks.removing import remove_stale
+from pulp_replica.app.tasks.synchronizing import synchronize, synchronize_changes
+from pulp_replica.app.upstream import upstream_session
+from pulp_replica.app.utils import bulk_update_fields, locked_resources, update_fields
+
+from pulpcore.plugin.models import Artifact, ContentArtifact, Remote
+from pulpcore.plugin.tasking import dispatch
+from pulpcore.plugin.util import get_url
+
+log = getLogger(__name__)
+
+VERSION_HREF = re.compile(r"^(?P<repository>.*/)versions/(?P<number>\d+)/$")
+
+
+class Replicator:
+    def __init__(self, pulp_ctx, task_group, server):
+        """
+        Override this method with instances of plugin specific instances of Remote, Repository, and Distribution contexts.
+        :param pulp_ctx: PulpReplicaContext
+        :param task_group: TaskGroup the dispatched tasks are added to
+        :param server: Server being replicated
+        """
+        self.pulp_ctx = pulp_ctx
+        self.task_group = task_group
+        self.server = server
+        self.distribution_ctx = None
+        self.remote_ctx = None
+        self.repository_ctx = None
+        self.publication_ctx = None
+        self.remote_model = None
+        self.repository_model = None
+        self.distribution_model = None
+        self.distribution_serializer = None
+        self.app_label = None
+        self.serializer_name = None
+        self.sync_task = None
+        # Set when the url of a remote depends on the upstream repository or publication
+        self.needs_upstream_entities = False
+        self.upstream_entities = {}
+        # The upstream repositories and publications described by the replication feed
+        self.feed_entities = {}
+        # The upstream content types whose changes `apply_changes` can replicate
+        self.delta_content_types = ()
+        # The fields `artifact_checksum` needs, per upstream content type with artifacts
+        self.artifact_fields = {}
+        self.metrics = ReplicationMetrics()
+
+    @property
+    def session(self):
+        """The requests session of the upstream API calls."""
+        return upstream_session(self.pulp_ctx)
+
+    def upstream_filters(self):
+        """
+        Return the list filters that let the upstream skip distributions the server excludes.
+
+        The upstream can only narrow down the selection, `is_selected` makes the exact decision.
+        """
+        parameters = {}
+        if self.server.pulp_label_select:
+            parameters["pulp_label_select"] = self.server.pulp_label_select
+        if self.server.name_regex and not re.search(r"[|(]", self.server.name_regex):
+            # A literal prefix of an anchored expression, minus a quantified last character
+            prefix = re.match(r"\^([\w\-/ ]+)(?![*+?{])", self.server.name_regex)
+            if prefix:
+                parameters["name__startswith"] = prefix.group(1)
+        base_paths = self.server.base_path_filters
+        if base_paths:
+            if not any(re.search(r"[*?\[]", base_path) for base_path in base_paths):
+                parameters["base_path__in"] = base_paths
+            elif len(base_paths) == 1:
+                prefix = re.split(r"[*?\[]", base_paths[0])[0]
+                if prefix:
+                    parameters["base_path__contains"] = prefix
+        return parameters
+
+    def is_selected(self, upstream_distribution):
+        """Check whether the server's filters select an upstream distribution for replication."""
+        if self.server.base_path_filters and not any(
+            fnmatchcase(upstream_distribution["base_path"], base_path)
+            for base_path in self.server.base_path_filters
+        ):
+            return False
+        if self.server.name_regex and not re.search(
+            self.server.name_regex, upstream_distribution["name"]
+        ):
+            return False
+        return True
+
+    def list_upstream(self, entity_ctx, parameters=None, page_size=None):
+        """
+        Yield the upstream entities of a context one page at a time.
+
+        The next page is requested in the background while the caller works on the current one.
+        :param entity_ctx: Class of the context to list
+        :param parameters: Filters for the list query
+        :param page_size: Number of entities per page. Defaults to REPLICATION_PAGE_SIZE.
+        """
+        page_size = page_size or settings.REPLICATION_PAGE_SIZE
+        list_ctx = entity_ctx(self.pulp_ctx)
+        parameters = parameters or {}
+
+        def fetch_page(offset):
+            return list_ctx.call(
+                "list", parameters=dict(parameters, limit=page_size, offset=offset)
+            )
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            offset = 0
+            next_page = executor.submit(fetch_page, offset)
+            while next_page is not None:
+                with self.metrics.timer("list"):
+                    page = next_page.result()
+                offset += page_size
+                next_page = executor.submit(fetch_page, offset) if page["next"] else None
+                if page["results"]:
+                    yield page["results"]
+
+    def get_upstream_distributions(self, parameters=None, page_size=None):
+        """
+        Yield the upstream distributions selected by the server one page at a time.
+
+        :param parameters: Additional filters for the list query
+        :param page_size: Number of distributions per page. Defaults to REPLICATION_PAGE_SIZE.
+        """
+        if not parameters and not self.server.pulp_label_select:
+            response = self.open_feed()
+            if response is not None:
+                yield from self.read_feed(response, page_size)
+                return
+
+        self.feed_entities = {}
+        parameters = dict(self.upstream_filters(), **(parameters or {}))
+        for page in self.list_upstream(self.distribution_ctx, parameters, page_size):
+            distros = [distro for distro in page if self.is_selected(distro)]
+            if distros:
+                yield distros
+
+    def open_feed(self):
+        """
+        Request the replication feed of the upstream, if it runs pulp-replica too.
+
+        Returns the streamed response, or None if the upstream does not serve the feed.
+        """
+        url = urljoin(self.server.base_url, f"{self.server.api_root}api/v3/replica/feed/")
+        try:
+            response = self.session.get(
+                url,
+                params={"pulp_type": self.distribution_model.get_pulp_type()},
+                stream=True,
+                timeout=30,
+            )
+        except requests.RequestException:
+            return None
+        if response.status_code != 200:
+            response.close()
+            return None
+        return response
+
+    def read_feed(self, response, page_size=None):
+        """
+        Yield the selected upstream distributions of a replication feed one page at a time.
+
+        The repositories and publications the feed describes are kept for `upstream_entity`, so
+        they don't need to be looked up.
+        """
+        page_size = page_size or settings.REPLICATION_PAGE_SIZE
+        with response:
+            lines = (line for line in response.iter_lines() if line)
+            while True:
+                with self.metrics.timer("list"):
+                    page = list(islice(lines, page_size))
+                if not page:
+                    break
+                self.metrics.add("bytes_received", sum(len(line) + 1 for line in page))
+                distros = [json.loads(line) for line in page]
+                distros = [distro for distro in distros if self.is_selected(distro)]
+                if distros:
+                    self.feed_entities = {}
+                    for distro in distros:
+                        entity = {"manifest": distro["manifest"]}
+                        if distro["repository"]:
+                            entity.update(
+                                pulp_href=distro["repository"],
+                                latest_version_href=distro["latest_version_href"],
+                            )
+                        elif distro["publication"]:
+                            entity.update(
+                                pulp_href=distro["publication"],
+                                repository_version=distro["latest_version_href"],
+                            )
+                        else:
+                            continue
+                        self.feed_entities[entity["pulp_href"]] = entity
+                    yield distros
+
+    def has_list_filter(self, entity_ctx, name):
+        """Check whether the upstream can filter the list of an entity by `name`."""
+        api = self.pulp_ctx.api
+        operation_id = getattr(entity_ctx, "LIST_ID", None) or f"{entity_ctx.ID_PREFIX}_list"
+        if operation_id not in api.operations:
+            return False
+        method, path = api.operations[operation_id]
+        return any(
+            parameter["name"] == name
+            for parameter in api.api_spec["paths"][path][method].get("parameters", [])
+        )
+
+    def supports_incremental_replication(self):
+        """Check whether the upstream can list the distributions and repositories changed lately."""
+        return self.has_list_filter(
+            self.distribution_ctx, "pulp_last_updated__gte"
+        ) and self.has_list_filter(self.repository_ctx, "pulp_last_updated__gte")
+
+    def upstream_high_water_mark(self):
+        """Return the newest pulp_last_updated of the upstream distributions and repositories."""
+        marks = []
+        for entity_ctx in (self.distribution_ctx, self.repository_ctx):
+            with self.metrics.timer("list"):
+                page = entity_ctx(self.pulp_ctx).call(
+                    "list", parameters={"ordering": ["-pulp_last_updated"], "limit": 1}
+                )
+            marks.extend(
+                parse_datetime(entity["pulp_last_updated"])
+                for entity in page["results"]
+                if entity.get("pulp_last_updated")
+            )
+        return max(marks, default=None)
+
+    def get_changed_upstream_distributions(self, since, page_size=None):
+        """
+        Yield the selected upstream distributions that changed since `since` one page at a time.
+
+        Besides the distributions updated since then, this includes the distributions of the
+        replicated repositories whose upstream repository was updated since then.
+        """
+        since = since.astimezone(datetime.timezone.utc)
+        seen = set()
+        for distros in self.get_upstream_distributions(
+            {"pulp_last_updated__gte": since}, page_size
+        ):
+            seen.update(distro["name"] for distro in distros)
+            yield distros
+
+        repository_hrefs = [
+            repository["pulp_href"]
+            for page in self.list_upstream(
+                self.repository_ctx, {"pulp_last_updated__gte": since}, page_size
+            )
+            for repository in page
+        ]
+        page_size = page_size or settings.REPLICATION_PAGE_SIZE
+        replicated_repositories = ReplicatedRepository.objects.filter(
+            server=self.server, repository__pulp_type=self.repository_model.get_pulp_type()
+        )
+        names = set()
+        for i in range(0, len(repository_hrefs), page_size):
+            # The upstream content of a repository based distribution is a version of it
+            synced_from = reduce(
+                or_,
+                (
+                    Q(upstream_content_href__startswith=href)
+                    for href in repository_hrefs[i : i + page_size]
+                ),
+            )
+            names.update(
+                replicated_repositories.filter(synced_from).values_list(
+                    "repository__name", flat=True
+                )
+            )
+        names = sorted(names - seen)
+        for i in range(0, len(names), page_size):
+            yield from self.get_upstream_distributions({"name__in": names[i : i + page_size]})
+
+    def upstream_entity_ctx(self, upstream_distribution):
+        """
+        Return the context and href of the repository or publication served by a distribution.
+
+        Returns (None, None) if the distribution doesn't serve any content.
+        """
+        if upstream_distribution["repository"]:
+            return self.repository_ctx, upstream_distribution["repository"]
+        elif upstream_distribution["publication"]:
+            return self.publication_ctx, upstream_distribution["publication"]
+        return None, None
+
+    def prefetch_upstream_entities(self, upstream_distributions):
+        """
+        Look up the upstream repositories and publications of a batch of distributions.
+
+        The lookups run concurrently, at most `server.max_concurrent_requests` at a time in this
+        task, and the results are kept for `upstream_entity` until the next batch is prefetched.
+        The ones described by the replication feed are not looked up.
+        """
+        self.upstream_entities = dict(self.feed_entities)
+        if not self.needs_upstream_entities:
+            return
+
+        lookups = {}
+        for upstream_distribution in upstream_distributions:
+            entity_ctx, href = self.upstream_entity_ctx(upstream_distribution)
+            if href and href not in self.upstream_entities:
+                lookups[href] = entity_ctx
+
+        def lookup(item):
+            href, entity_ctx = item
+            return entity_ctx(self.pulp_ctx, href).entity
+
+        with self.metrics.timer("lookup"), ThreadPoolExecutor(
+            max_workers=self.server.max_concurrent_requests
+        ) as executor:
+            self.upstream_entities.update(zip(lookups, executor.map(lookup, lookups.items())))
+
+    def upstream_entity(self, upstream_distribution):
+        """Return the upstream repository or publication served by a distribution."""
+        entity_ctx, href = self.upstream_entity_ctx(upstream_distribution)
+        if not href:
+            return None
+        if href not in self.upstream_entities:
+            with self.metrics.timer("lookup"):
+                self.upstream_entities[href] = entity_ctx(self.pulp_ctx, href).entity
+        return self.upstream_entities[href]
+
+    def url(self, upstream_distribution):
+        return upstream_distribution["base_url"]
+
+    def upstream_content_href(self, upstream_distribution):
+        """Return the href of the upstream publication or repository version being distributed."""
+        if upstream_distribution["publication"]:
+            return upstream_distribution["publication"]
+        return self.upstream_entity(upstream_distribution)["latest_version_href"]
+
+    def upstream_version_href(self, upstream_distribution):
+        """Return the href of the upstream repository version being distributed."""
+        if upstream_distribution["publication"]:
+            return self.upstream_entity(upstream_distribution)["repository_version"]
+        return self.upstream_entity(upstream_distribution)["latest_version_href"]
+
+    def get_upstream(self, href, params=None):
+        """Return the response of the upstream API for an href, e.g. from a content summary."""
+        response = self.session.get(urljoin(self.server.base_url, href), params=params, timeout=30)
+        response.raise_for_status()
+        return response.json()
+
+    def iterate_upstream(self, href, params=None):
+        """Yield the entities listed by the upstream API for an href, following the next pages."""
+        page = self.get_upstream(href, dict(params or {}, limit=settings.REPLICATION_PAGE_SIZE))
+        yield from page["results"]
+        while page["next"]:
+            page = self.get_upstream(page["next"])
+            yield from page["results"]
+
+    def content_key(self, content):
+        """Return what identifies an upstream content unit, for computing the net changes."""
+        raise NotImplementedError("Each replicator supporting deltas must identify its content.")
+
+    def upstream_changes(self, old_version_href, new_version_href):
+        """
+        Return the content added and removed upstream between two repository versions.
+
+        The changes of the versions in between are combined into the net changes. Returns the added
+        and the removed upstream content keyed by `content_key`, the added content with its
+        "pulp_type", or None if the repository needs a
+        full sync instead: if the versions are not successive versions of the same repository, if
+        the old version was deleted upstream, if content types `apply_changes` can't handle
+        changed, or if more content changed than the new version holds.
+        """
+        old = VERSION_HREF.match(old_version_href or "")
+        new = VERSION_HREF.match(new_version_href or "")
+        if not old or not new or old["repository"] != new["repository"]:
+            return None
+        if int(new["number"]) <= int(old["number"]):
+            return None
+
+        versions = list(
+            self.iterate_upstream(
+                f"{new['repository']}versions/",
+                {"number__gte": old["number"], "number__lte": new["number"], "ordering": "number"},
+            )
+        )
+        # The changes of a deleted version are squashed into the next one
+        if len(versions) < 2 or versions[0]["pulp_href"] != old_version_href:
+            return None
+        if versions[-1]["pulp_href"] != new_version_href:
+            return None
+        changed = 0
+        for version in versions[1:]:
+            summary = version["content_summary"]
+            if not set(summary["added"]) | set(summary["removed"]) <= set(self.delta_content_types):
+                return None
+            changed += sum(
+                info["count"] for kind in ("added", "removed") for info in summary[kind].values()
+            )
+        if changed > sum(
+            info["count"] for info in versions[-1]["content_summary"]["present"].values()
+        ):
+            return None
+
+        added, removed = {}, {}
+        for version in versions[1:]:
+            summary = version["content_summary"]
+            for content_type in summary["removed"]:
+                for content in self.iterate_upstream(summary["removed"][content_type]["href"]):
+                    key = self.content_key(content)
+                    if added.pop(key, None) is None:
+                        removed[key] = content
+            for content_type in summary["added"]:
+                for content in self.iterate_upstream(summary["added"][content_type]["href"]):
+                    key = self.content_key(content)
+                    if removed.pop(key, None) is None:
+                        added[key] = dict(content, pulp_type=content_type)
+        return added, removed
+
+    def apply_changes(self, repository, added, removed, artifacts=None):
+        """
+        Create a repository version adding and removing the content changed upstream.
+
+        :param repository: The local repository
+        :param added: The upstream content added, keyed by `content_key`
+        :param removed: The upstream content removed, keyed by `content_key`
+        :param artifacts: The local artifacts of the added content, keyed by sha256
+        """
+        raise NotImplementedError("Each replicator supporting deltas must apply the changes.")
+
+    def artifact_checksum(self, content_type, content):
+        """Return the sha256 of the artifact of an upstream content unit, or None if unknown."""
+        return None
+
+    def upstream_checksums(self, version_href):
+        """Return the sha256 of the artifacts of the content in an upstream repository version."""
+        checksums = set()
+        present = self.get_upstream(version_href)["content_summary"]["present"]
+        for content_type, info in present.items():
+            if content_type not in self.artifact_fields:
+                continue
+            fields = ",".join(self.artifact_fields[content_type])
+            for content in self.iterate_upstream(info["href"], {"fields": fields}):
+                checksum = self.artifact_checksum(content_type, content)
+                if checksum:
+                    checksums.add(checksum)
+        return checksums
+
+    def prefilter_artifacts(self, checksums, repository_version=None):
+        """
+        Look up which of the artifacts with `checksums` the replica already has, in bulk.
+
+        Only the missing artifacts need to be downloaded. The present ones are counted, with their
+        size as the bytes saved, unless the content of `repository_version` already uses them: a
+        sync would not have downloaded those anyway. Returns the present artifacts keyed by sha256.
+
+        :param checksums: The sha256 of the artifacts of the upstream content being synced
+        :param repository_version: The local repository version being synced, if any
+        """
+        checksums = list(checksums)
+        artifacts = {}
+        local = set()
+        page_size = settings.REPLICATION_PAGE_SIZE
+        with self.metrics.timer("prefilter"):
+            for i in range(0, len(checksums), page_size):
+                page = checksums[i : i + page_size]
+                artifacts.update(
+                    (artifact.sha256, artifact)
+                    for artifact in Artifact.objects.filter(sha256__in=page)
+                )
+                if repository_version is not None:
+                    local.update(
+                        ContentArtifact.objects.filter(
+                            content__in=repository_version.content, artifact__sha256__in=page
+                        ).values_list("artifact__sha256", flat=True)
+                    )
+        saved = [artifact for sha256, artifact in artifacts.items() if sha256 not in local]
+        self.metrics.add("artifacts_present", len(saved))
+        self.metrics.add("artifacts_missing", len(checksums) - len(artifacts))
+        self.metrics.add("bytes_saved", sum(artifact.size for artifact in saved))
+        return artifacts
+
+    def local_objects(self, model, names):
+        """Return the local instances of `model` with one of `names`, keyed by name."""
+        return {instance.name: instance for instance in model.objects.filter(name__in=names)}
+
+    def remote_fields(self, upstream_distribution):
+        # The TLS and download settings of the server also apply to the downloads of the remotes
+        fields = {name: getattr(self.server, name) for name in Server.REMOTE_FIELDS}
+        return dict(url=self.url(upstream_distribution), policy=self.server.policy, **fields)
+
+    def create_or_update_remote(self, upstream_distribution, remote=None):
+        """
+        Create the remote for an upstream distribution or update the existing `remote` in memory.
+
+        Returns the remote and the names of the fields that need to be saved, or (None, []) if the
+        upstream distribution doesn't serve any content.
+        """
+        if not upstream_distribution["repository"] and not upstream_distribution["publication"]:
+            return None, []
+
+        fields = self.remote_fields(upstream_distribution)
+        if remote is None:
+            remote = self.remote_model(name=upstream_distribution["name"], **fields)
+            remote.save()
+            return remote, []
+        return remote, update_fields(remote, fields)
+
+    def repository_extra_fields(self, remote):
+        return {}
+
+    def create_or_update_repository(self, remote, repository=None):
+        """
+        Create the repository syncing from `remote` or update the existing `repository` in memory.
+
+        Returns the repository and the names of the fields that need to be saved.
+        """
+        fields = self.repository_extra_fields(remote)
+        if repository is None:
+            repository = self.repository_model(name=remote.name, remote=remote, **fields)
+            repository.save()
+            return repository, []
+        changed = update_fields(repository, dict(remote_id=remote.pk, **fields))
+        repository.remote = remote
+        return repository, changed
+
+    def distribution_data(self, upstream_distribution, repository=None):
+        """
+        Return the state of the local distribution for an upstream distribution.
+
+        The local distribution serves `repository`, or is detached from its content if None.
+        """
+        return {
+            "name": upstream_distribution["name"],
+            "base_path": upstream_distribution["base_path"],
+            "repository": get_url(repository) if repository else None,
+            "repository_pk": str(repository.pk) if repository else None,
+        }
+
+    def create_or_update_distributions(self, distributions):
+        """
+        Dispatch a single task applying all distribution changes of a batch.
+
+        The task holds the distributions lock once for the whole batch instead of once per
+        distribution.
+        """
+        with self.metrics.timer("dispatch"):
+            dispatch(
+                update_distributions,
+                task_group=self.task_group,
+                exclusive_resources=["/api/v3/distributions/"],
+                kwargs={
+                    "app_label": self.app_label,
+                    "serializer_name": self.serializer_name,
+                    "distributions": distributions,
+                },
+            )
+        self.metrics.add("distribution_updates_dispatched")
+
+    def get_replicated_repositories(self, repositories):
+        """
+        Return the ReplicatedRepository of each repository keyed by repository pk.
+
+        Missing ones are created. Repositories previously replicated from another server are
+        reassigned to this one and forget the upstream content they were synced from.
+        """
+        replicated = {
+            replicated_repository.repository_id: replicated_repository
+            for replicated_repository in ReplicatedRepository.objects.filter(
+                repository__in=repositories
+            )
+        }
+        changes = [
+            (
+                replicated_repository,
+                update_fields(
+                    replicated_repository,
+                    dict(
+                        server_id=self.server.pk,
+                        upstream_content_href=None,
+                        upstream_version_href=None,
+                    ),
+                ),
+            )
+            for replicated_repository in replicated.values()
+            if replicated_repository.server_id != self.server.pk
+        ]
+        bulk_update_fields(ReplicatedRepository, changes)
+
+        missing = [
+            ReplicatedRepository(server=self.server, repository=repository)
+            for repository in repositories
+            if repository.pk not in replicated
+        ]
+        ReplicatedRepository.objects.bulk_create(missing)
+        replicated.update(
+            (replicated_repository.repository_id, replicated_repository)
+            for replicated_repository in missing
+        )
+        return replicated
+
+    def plan(self, upstream_distributions, force=False):
+        """
+        Return what `replicate` would do with a batch of upstream distributions, without doing it.
+
+        Returns one dict per upstream distribution with its name and the actions replicating it
+        needs, e.g. {"name": "foo", "remote": "create", "repository": "update", "sync": True,
+        "distribution": "update"}. Unchanged objects are left out.
+        """
+        self.prefetch_upstream_entities(upstream_distributions)
+        names = [upstream_distribution["name"] for upstream_distribution in upstream_distributions]
+        remotes = self.local_objects(self.remote_model, names)
+        repositories = self.local_objects(self.repository_model, names)
+        distributions = self.local_objects(self.distribution_model, names)
+        replicated = {
+            replicated_repository.repository_id: replicated_repository
+            for replicated_repository in ReplicatedRepository.objects.filter(
+                repository__in=repositories.values()
+            )
+        }
+
+        plan = []
+        for upstream_distribution in upstream_distributions:
+            name = upstream_distribution["name"]
+            distro = distributions.get(name)
+            actions = {"name": name}
+            plan.append(actions)
+            if not upstream_distribution["repository"] and not upstream_distribution["publication"]:
+                distribution = self.distribution_data(upstream_distribution)
+                if distro is not None and not is_up_to_date(distro, distribution):
+                    actions["distribution"] = "clear"
+                continue
+
+            # Changes are only made in memory, nothing is saved
+            fields = self.remote_fields(upstream_distribution)
+            remote = remotes.get(name)
+            resync = False
+            if remote is None:
+                actions["remote"] = "create"
+                remote = self.remote_model(name=name, **fields)
+            else:
+                changed = update_fields(remote, fields)
+                if changed:
+                    actions["remote"] = "update"
+                    resync = self.needs_resync(remote, changed)
+
+            fields = self.repository_extra_fields(remote)
+            repository = repositories.get(name)
+            if repository is None:
+                actions["repository"] = "create"
+            elif update_fields(repository, dict(remote_id=remote.pk, **fields)):
+                actions["repository"] = "update"
+
+            replicated_repository = replicated.get(repository.pk) if repository else None
+            if (
+                force
+                or resync
+                or replicated_repository is None
+                or replicated_repository.server_id != self.server.pk
+                or replicated_repository.upstream_content_href
+                != self.upstream_content_href(upstream_distribution)
+            ):
+                actions["sync"] = True
+
+            if distro is None:
+                actions["distribution"] = "create"
+            elif repository is None or not is_up_to_date(
+                distro, self.distribution_data(upstream_distribution, repository)
+            ):
+                actions["distribution"] = "update"
+        return plan
+
+    def needs_resync(self, remote, changed):
+        """
+        Check whether the changed fields of a remote require syncing its repository again.
+
+        This is the case when the policy changed to immediate, to download the artifacts the
+        deferred syncs skipped.
+        """
+        return "policy" in changed and remote.policy == Remote.IMMEDIATE
+
+    def count_change(self, kind, existing, changed):
+        """Count a remote or repository as created, updated or unchanged."""
+        if not existing:
+            self.metrics.add(f"{kind}_created")
+        elif changed:
+            self.metrics.add(f"{kind}_updated")
+        else:
+            self.metrics.add(f"{kind}_unchanged")
+
+    def replicate(self, upstream_distributions, force=False):
+        """
+        Reconcile the local objects with a batch of upstream distributions.
+
+        The local remotes, repositories and distributions are looked up with one query per model,
+        and all changes are written in a single transaction. Only rows whose fields changed are
+        updated, using one bulk update per model. Distribution changes are applied by one task per
+        batch, which is only dispatched if at least one distribution is out of date.
+
+        A repository is only synced if the upstream content it was last synced from changed,
+        unless `force` is set or the download policy of its remote changed to immediate. It is not
+        synced while a task that holds or waits for the repository, e.g. a previous sync, is not
+        finished yet.
+        """
+        self.prefetch_upstream_entities(upstream_distributions)
+        names = [upstream_distribution["name"] for upstream_distribution in upstream_distributions]
+        with self.metrics.timer("upsert"):
+            remotes = self.local_objects(self.remote_model, names)
+            repositories = self.local_objects(self.repository_model, names)
+            distributions = self.local_objects(self.distribution_model, names)
+
+        with transaction.atomic():
+            with self.metrics.timer("upsert"):
+                serving = {}
+                resync = set()
+                changes = []
+                for upstream_distribution in upstream_distributions:
+                    name = upstream_distribution["name"]
+                    remote, changed = self.create_or_update_remote(
+                        upstream_distribution, remotes.get(name)
+                    )
+                    if remote:
+                        serving[name] = remote
+                        changes.append((remote, changed))
+                        self.count_change("remotes", name in remotes, changed)
+                        if self.needs_resync(remote, changed):
+                            resync.add(name)
+                bulk_update_fields(self.remote_model, changes)
+
+                changes = []
+                for name, remote in serving.items():
+                    existing = name in repositories
+                    repository, changed = self.create_or_update_repository(
+                        remote, repositories.get(name)
+                    )
+                    repositories[name] = repository
+                    changes.append((repository, changed))
+                    self.count_change("repositories", existing, changed)
+                bulk_update_fields(self.repository_model, changes)
+                replicated = self.get_replicated_repositories(
+                    [repositories[name] for name in serving]
+                )
+
+            syncs = []
+            distribution_changes = []
+            needs_update = False
+            for upstream_distribution in upstream_distributions:
+                name = upstream_distribution["name"]
+                distro = distributions.get(name)
+                if name not in serving:
+                    # The upstream distribution is not serving any content, cleanup an existing
+                    # local distribution
+                    if distro is not None:
+                        distribution = self.distribution_data(upstream_distribution)
+                        distribution_changes.append(distribution)
+                        needs_update = needs_update or not is_up_to_date(distro, distribution)
+                    continue
+                # Dispatch a sync task if the upstream content changed since the last sync
+                repository = repositories[name]
+                replicated_repository = replicated[repository.pk]
+                upstream_content_href = self.upstream_content_href(upstream_distribution)
+                if (
+                    force
+                    or name in resync
+                    or replicated_repository.upstream_content_href != upstream_content_href
+                ):
+                    syncs.append(
+                        (
+                            repository,
+                            replicated_repository,
+                            upstream_content_href,
+                            self.upstream_version_href(upstream_distribution),
+                            not force and name not in resync,
+                        )
+                    )
+                distribution = self.distribution_data(upstream_distribution, repository)
+                distribution_changes.append(distribution)
+                needs_update = needs_update or not distro or not is_up_to_date(distro, distribution)
+            # A sync still waiting or running only records its upstream content once it is done
+            syncing = locked_resources(get_url(sync[0]) for sync in syncs)
+            for repository, replicated_repository, content_href, version_href, delta in syncs:
+                if get_url(repository) in syncing:
+                    self.metrics.add("syncs_in_progress")
+                    continue
+                self.sync(repository, replicated_repository, content_href, version_href, delta)
+            if needs_update:
+                self.create_or_update_distributions(distribution_changes)
+
+    def stale_repositories(self, names):
+        """
+        Return the repositories replicated from the server whose upstream distribution is gone.
+
+        Upstream distributions the server's filters no longer select count as gone.
+        :param names: Names of all the selected upstream distributions
+        """
+        replicated = ReplicatedRepository.objects.filter(server=self.server).values("repository_id")
+        return [
+            repository
+            for repository in self.repository_model.objects.filter(pk__in=replicated).only(
+                "pk", "name"
+            )
+            if repository.name not in names
+        ]
+
+    def remove_stale(self, names):
+        """
+        Dispatch a task removing the objects replicated from upstream distributions that are gone.
+
+        What is removed depends on the server's `stale_policy`. The task waits for the syncs of
+        the stale repositories and for the distribution updates to finish.
+
+        Nothing is removed if the upstream selected no distribution at all, or if more than
+        `REPLICATION_STALE_MAX_FRACTION` of the replicated repositories would be removed, as
+        that is more likely a change of the upstream permissions or filters than deletions.
+        :param names: Names of all the selected upstream distributions
+        """
+        if self.server.stale_policy == Server.KEEP:
+            return
+        repositories = self.stale_repositories(names)
+        if not repositories:
+            return
+        max_fraction = settings.REPLICATION_STALE_MAX_FRACTION
+        replicated = ReplicatedRepository.objects.filter(
+            server=self.server, repository__pulp_type=self.repository_model.get_pulp_type()
+        ).count()
+        if not names or (
+            max_fraction is not None and len(repositories) > max_fraction * replicated
+        ):
+            log.warning(
+                _(
+                    "Not removing {stale} of the {replicated} {plugin} repositories replicated "
+                    "from {server}, as their upstream distributions seem to be gone."
+                ).format(
+                    stale=len(repositories),
+                    replicated=replicated,
+                    plugin=self.app_label,
+                    server=self.server.name,
+                )
+            )
+            self.metrics.add("removals_skipped")
+            return
+        with self.metrics.timer("dispatch"):
+            dispatch(
+                remove_stale,
+                task_group=self.task_group,
+                exclusive_resources=["/api/v3/distributions/", *repositories],
+                kwargs={
+                    "app_label": self.app_label,
+                    "repository_pks": [str(repository.pk) for repository in repositories],
+                    "distribution_type": self.distribution_model.get_pulp_type(),
+                    "remote_type": self.remote_model.get_pulp_type(),
+                    "delete_repositories": self.server.stale_policy == Server.DELETE,
+                },
+            )
+        self.metrics.add("removals_dispatched")
+
+    def sync_params(self, repository):
+        """This method returns a dict that will be passed as kwargs to the sync task."""
+        raise NotImplementedError("Each replicator must supply its own sync params.")
+
+    def sync(
+        self,
+        repository,
+        replicated_repository,
+        upstream_content_href,
+        upstream_version_href=None,
+        delta=False,
+    ):
+        """
+        Dispatch a task syncing a repository with its upstream content.
+
+        If `delta` is set and the server replicates deltas, the task only applies the content
+        changed upstream since the last sync, if the replicator supports it.
+        """
+        kwargs = {
+            "sync_task": f"{self.sync_task.__module__}.{self.sync_task.__name__}",
+            "replicated_repository_pk": str(replicated_repository.pk),
+            "upstream_content_href": upstream_content_href,
+            "sync_kwargs": self.sync_params(repository),
+            "upstream_version_href": upstream_version_href,
+            "app_label": self.app_label,
+            "server_pk": str(self.server.pk),
+        }
+        task = synchronize
+        if (
+            delta
+            and self.server.delta_replication
+            and self.delta_content_types
+            and replicated_repository.upstream_version_href
+            and upstream_version_href
+        ):
+            task = synchronize_changes
+        with self.metrics.timer("dispatch"):
+            dispatch(
+                task,
+                task_group=self.task_group,
+                shared_resources=[repository.remote],
+                exclusive_resources=[repository],
+                kwargs=kwargs,
+            )
+        self.metrics.add("syncs_dispatched")
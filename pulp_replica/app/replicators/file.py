@@ -0,0 +1,187 @@
+import asyncio
+import csv
+import tempfile
+from functools import reduce
+from gettext import gettext as _
+from logging import getLogger
+from operator import or_
+from urllib.parse import urljoin
+
+from django.conf import settings
+from django.core.files import File
+from django.db.models import Q
+
+from pulpcore.cli.file.context import (
+    PulpFileDistributionContext,
+    PulpFilePublicationContext,
+    PulpFileRemoteContext,
+    PulpFileRepositoryContext,
+)
+
+from pulpcore.plugin.models import Artifact, PublishedMetadata, Remote
+from pulpcore.plugin.stages import (
+    ContentAssociation,
+    DeclarativeArtifact,
+    DeclarativeContent,
+    DeclarativeVersion,
+    EndStage,
+    Stage,
+    create_pipeline,
+)
+
+from pulp_file.app.models import (
+    FileContent,
+    FileDistribution,
+    FilePublication,
+    FileRemote,
+    FileRepository,
+)
+from pulp_file.app.tasks import publish as file_publish
+from pulp_file.app.tasks import synchronize as file_synchronize
+
+from pulp_replica.app.replicators.base import Replicator
+
+log = getLogger(__name__)
+
+
+class FileChangesFirstStage(Stage):
+    """The first stage of a pipeline adding the files added upstream to a repository version."""
+
+    def __init__(self, remote, added, artifacts):
+        """
+        :param remote: FileRemote of the repository
+        :param added: (relative_path, sha256) of the files added upstream
+        :param artifacts: The local artifacts of the added files, keyed by sha256
+        """
+        super().__init__()
+        self.remote = remote
+        self.added = added
+        self.artifacts = artifacts
+
+    async def run(self):
+        deferred_download = self.remote.policy != Remote.IMMEDIATE
+        for relative_path, digest in self.added:
+            d_artifact = DeclarativeArtifact(
+                artifact=self.artifacts.get(digest) or Artifact(sha256=digest),
+                url=urljoin(self.remote.url, relative_path),
+                relative_path=relative_path,
+                remote=self.remote,
+                deferred_download=deferred_download,
+            )
+            content = FileContent(relative_path=relative_path, digest=digest)
+            await self.put(DeclarativeContent(content=content, d_artifacts=[d_artifact]))
+
+
+class FileReplicator(Replicator):
+    def __init__(self, pulp_ctx, task_group, server):
+        super().__init__(pulp_ctx, task_group, server)
+        self.remote_ctx = PulpFileRemoteContext
+        self.repository_ctx = PulpFileRepositoryContext
+        self.distribution_ctx = PulpFileDistributionContext
+        self.publication_ctx = PulpFilePublicationContext
+        self.app_label = "file"
+        self.remote_model = FileRemote
+        self.repository_model = FileRepository
+        self.distribution_model = FileDistribution
+        self.serializer_name = "FileDistributionSerializer"
+        self.sync_task = file_synchronize
+        self.needs_upstream_entities = True
+        self.delta_content_types = ("file.file",)
+        self.artifact_fields = {"file.file": ["sha256"]}
+
+    def url(self, upstream_distribution):
+        # The manifest name is set on the repository or publication served by the distribution
+        upstream_entity = self.upstream_entity(upstream_distribution)
+        if not upstream_entity:
+            # This distribution doesn't serve any content
+            return None
+
+        return f"{upstream_distribution['base_url']}{upstream_entity['manifest']}"
+
+    def repository_extra_fields(self, remote):
+        # A mirror sync publishes the upstream manifest, only publish locally if it isn't used
+        return dict(
+            manifest=remote.url.split("/")[-1],
+            autopublish=not self.server.passthrough_publications,
+        )
+
+    def content_key(self, content):
+        return content["relative_path"], content["sha256"]
+
+    def artifact_checksum(self, content_type, content):
+        return content["sha256"]
+
+    def apply_changes(self, repository, added, removed, artifacts=None):
+        # Like DeclarativeVersion.create(), with the removed files left out of the new version
+        remote = repository.remote.cast()
+        first_stage = FileChangesFirstStage(remote, added, artifacts or {})
+        declarative_version = DeclarativeVersion(first_stage, repository)
+        removed = list(removed)
+        page_size = settings.REPLICATION_PAGE_SIZE
+        with tempfile.TemporaryDirectory(dir="."):
+            with repository.new_version() as new_version:
+                for i in range(0, len(removed), page_size):
+                    files = reduce(
+                        or_,
+                        (
+                            Q(relative_path=relative_path, digest=digest)
+                            for relative_path, digest in removed[i : i + page_size]
+                        ),
+                    )
+                    new_version.remove_content(FileContent.objects.filter(files))
+                stages = declarative_version.pipeline_stages(new_version)
+                stages.append(ContentAssociation(new_version, False))
+                stages.append(EndStage())
+                asyncio.get_event_loop().run_until_complete(create_pipeline(stages))
+        if not repository.autopublish:
+            self.publish_upstream_manifest(repository.latest_version())
+
+    def publish_upstream_manifest(self, repository_version):
+        """
+        Publish a repository version with the manifest of the upstream publication.
+
+        The manifest is only published if it lists exactly the files of the repository version,
+        with the same digests. Otherwise the manifest is generated locally.
+
+        :param repository_version: The FileRepositoryVersion to publish
+        """
+        if FilePublication.objects.filter(
+            repository_version=repository_version, complete=True
+        ).exists():
+            return
+
+        repository = repository_version.repository.cast()
+        remote = repository.remote.cast()
+        result = remote.get_downloader(url=remote.url).fetch()
+        with open(result.path, newline="") as manifest:
+            entries = {tuple(row[:2]) for row in csv.reader(manifest) if row}
+        files = set(
+            FileContent.objects.filter(pk__in=repository_version.content).values_list(
+                "relative_path", "digest"
+            )
+        )
+        if entries != files:
+            log.warning(
+                _("The manifest at {url} doesn't match {version}, publishing it locally.").format(
+                    url=remote.url, version=repository_version
+                )
+            )
+            file_publish(repository.manifest, repository_version.pk)
+            return
+
+        with FilePublication.create(repository_version, pass_through=True) as publication:
+            with open(result.path, "rb") as manifest:
+                PublishedMetadata.create_from_file(
+                    file=File(manifest),
+                    relative_path=repository.manifest,
+                    publication=publication,
+                )
+            publication.manifest = repository.manifest
+            publication.save()
+
+    def sync_params(self, repository):
+        return dict(
+            remote_pk=str(repository.remote.pk),
+            repository_pk=str(repository.pk),
+            mirror=True,
+        )
@@ -0,0 +1,49 @@
+from pulpcore.cli.rpm.context import (
+    PulpRpmDistributionContext,
+    PulpRpmPublicationContext,
+    PulpRpmRemoteContext,
+    PulpRpmRepositoryContext,
+)
+
+from pulp_rpm.app.models import RpmDistribution, RpmRemote, RpmRepository
+from pulp_rpm.app.tasks import synchronize as rpm_synchronize
+
+from pulp_replica.app.replicators.base import Replicator
+
+
+class RpmReplicator(Replicator):
+    def __init__(self, pulp_ctx, task_group, server):
+        super().__init__(pulp_ctx, task_group, server)
+        self.remote_ctx = PulpRpmRemoteContext
+        self.repository_ctx = PulpRpmRepositoryContext
+        self.distribution_ctx = PulpRpmDistributionContext
+        self.publication_ctx = PulpRpmPublicationContext
+        self.app_label = "rpm"
+        self.remote_model = RpmRemote
+        self.repository_model = RpmRepository
+        self.distribution_model = RpmDistribution
+        self.serializer_name = "RpmDistributionSerializer"
+        self.sync_task = rpm_synchronize
+        self.needs_upstream_entities = True
+        self.artifact_fields = {"rpm.package": ["pkgId", "checksum_type"]}
+
+    def repository_extra_fields(self, remote):
+        # TODO: determine which RPM repository fields should also be included
+        # A mirror_complete sync publishes the upstream repodata, only publish locally if it isn't
+        # used
+        return dict(autopublish=not self.server.passthrough_publications)
+
+    def artifact_checksum(self, content_type, content):
+        # The checksum of a package is the digest of its artifact
+        if content["checksum_type"] == "sha256":
+            return content["pkgId"]
+        return None
+
+    def sync_params(self, repository):
+        return dict(
+            remote_pk=repository.remote.pk,
+            repository_pk=repository.pk,
+            sync_policy="mirror_complete",
+            skip_types=[],
+            optimize=True,
+        )
@@ -1,16 +1,20 @@
+import re
 from gettext import gettext as _
 
 from rest_framework import fields, serializers
 from rest_framework.validators import UniqueValidator
 
-from pulpcore.app.serializers import HiddenFieldsMixin
+from pulpcore.app.serializers import HiddenFieldsMixin, NestedIdentityField
+from pulpcore.plugin.models import Remote
 from pulpcore.plugin.serializers import (
     IdentityField,
     ModelSerializer,
+    RelatedField,
 )
 
 
 from . import models
+from .replicators import get_replicator_labels
 
 
 class ServerSerializer(ModelSerializer, HiddenFieldsMixin):
@@ -65,10 +69,152 @@ class ServerSerializer(ModelSerializer, HiddenFieldsMixin):
         trim_whitespace=False,
         style={"input_type": "password"},
     )
+    max_concurrent_requests = serializers.IntegerField(
+        help_text=_(
+            "Maximum number of concurrent API requests each replication task makes to the Pulp "
+            "server. The tasks of a replication run in parallel, up to one per worker, so the Pulp "
+            "server can receive up to this number times the number of workers."
+        ),
+        required=False,
+        min_value=1,
+    )
+    download_concurrency = serializers.IntegerField(
+        help_text=_(
+            "Total number of simultaneous connections of each replicated remote. If not set, "
+            "the default of the remotes is used."
+        ),
+        required=False,
+        allow_null=True,
+        min_value=1,
+    )
+    rate_limit = serializers.IntegerField(
+        help_text=_(
+            "Limits requests per second of each replicated remote. If not set, the requests "
+            "are not limited."
+        ),
+        required=False,
+        allow_null=True,
+    )
+    total_timeout = serializers.FloatField(
+        help_text=_(
+            "aiohttp.ClientTimeout.total (q.v.) for download-connections of the replicated "
+            "remotes."
+        ),
+        required=False,
+        allow_null=True,
+        min_value=0.0,
+    )
+    connect_timeout = serializers.FloatField(
+        help_text=_(
+            "aiohttp.ClientTimeout.connect (q.v.) for download-connections of the replicated "
+            "remotes."
+        ),
+        required=False,
+        allow_null=True,
+        min_value=0.0,
+    )
+    sock_connect_timeout = serializers.FloatField(
+        help_text=_(
+            "aiohttp.ClientTimeout.sock_connect (q.v.) for download-connections of the "
+            "replicated remotes."
+        ),
+        required=False,
+        allow_null=True,
+        min_value=0.0,
+    )
+    sock_read_timeout = serializers.FloatField(
+        help_text=_(
+            "aiohttp.ClientTimeout.sock_read (q.v.) for download-connections of the replicated "
+            "remotes."
+        ),
+        required=False,
+        allow_null=True,
+        min_value=0.0,
+    )
+    base_path_filters = serializers.ListField(
+        child=serializers.CharField(),
+        help_text=_(
+            "Only replicate distributions whose base_path matches one of these shell-style "
+            "patterns, e.g. 'rhel/8/*'."
+        ),
+        required=False,
+        allow_null=True,
+    )
+    name_regex = serializers.CharField(
+        help_text=_("Only replicate distributions whose name matches this regular expression."),
+        required=False,
+        allow_null=True,
+    )
+    pulp_label_select = serializers.CharField(
+        help_text=_(
+            "Only replicate distributions with these labels, e.g. 'env=production,!internal'."
+        ),
+        required=False,
+        allow_null=True,
+    )
+    plugin_types = serializers.ListField(
+        child=serializers.CharField(),
+        help_text=_("Only replicate distributions of these plugins, e.g. ['file', 'rpm']."),
+        required=False,
+        allow_null=True,
+    )
+    policy = serializers.ChoiceField(
+        choices=Remote.POLICY_CHOICES,
+        help_text=_(
+            "The download policy of the replicated remotes. 'immediate' downloads all the "
+            "artifacts when syncing, 'on_demand' downloads and saves them when they are first "
+            "requested, 'streamed' streams them from upstream without saving them. Defaults to "
+            "'immediate'."
+        ),
+        required=False,
+    )
+    stale_policy = serializers.ChoiceField(
+        choices=models.Server.STALE_POLICY_CHOICES,
+        help_text=_(
+            "What happens to the local objects replicated from upstream distributions that are "
+            "gone. 'keep' keeps them, 'detach' removes the distributions and remotes but keeps the "
+            "repositories and their content, 'delete' also removes the repositories and cleans up "
+            "the orphaned content. Defaults to 'detach'."
+        ),
+        required=False,
+    )
+    delta_replication = serializers.BooleanField(
+        help_text=_(
+            "Replicate repositories by applying the content added and removed between the upstream "
+            "repository versions, instead of syncing them fully. Only supported for file "
+            "repositories, other repositories are always synced fully."
+        ),
+        required=False,
+    )
+    passthrough_publications = serializers.BooleanField(
+        help_text=_(
+            "Publish replicated repositories with the metadata of the upstream publication, e.g. "
+            "its manifest or repodata, instead of generating the metadata locally after each "
+            "sync."
+        ),
+        required=False,
+    )
     pulp_last_updated = serializers.DateTimeField(
         help_text="Timestamp of the most recent update of the remote.", read_only=True
     )
 
+    def validate_name_regex(self, value):
+        if value is not None:
+            try:
+                re.compile(value)
+            except re.error as e:
+                raise serializers.ValidationError(_("Invalid regular expression: {}").format(e))
+        return value
+
+    def validate_plugin_types(self, value):
+        if value is not None:
+            unknown = set(value) - set(get_replicator_labels())
+            if unknown:
+                raise serializers.ValidationError(
+                    _("No replicator is enabled for: {}").format(", ".join(sorted(unknown)))
+                )
+        return value
+
     class Meta:
         abstract = True
         model = models.Server
@@ -82,6 +228,204 @@ class ServerSerializer(ModelSerializer, HiddenFieldsMixin):
             "tls_validation",
             "username",
             "password",
+            "max_concurrent_requests",
+            "download_concurrency",
+            "rate_limit",
+            "total_timeout",
+            "connect_timeout",
+            "sock_connect_timeout",
+            "sock_read_timeout",
+            "base_path_filters",
+            "name_regex",
+            "pulp_label_select",
+            "plugin_types",
+            "policy",
+            "stale_policy",
+            "delta_replication",
+            "passthrough_publications",
             "pulp_last_updated",
             "hidden_fields",
         )
+
+
+class ReplicateSerializer(serializers.Serializer):
+    """
+    Serializer for the options of a replication.
+    """
+
+    force = serializers.BooleanField(
+        help_text=_(
+            "Sync every replicated repository, even if its upstream content did not change since "
+            "the last replication."
+        ),
+        required=False,
+        default=False,
+    )
+    resume = serializers.BooleanField(
+        help_text=_(
+            "Continue the previous replication if it did not complete, instead of starting over. "
+            "Distributions that were already reconciled are not reconciled again."
+        ),
+        required=False,
+        default=False,
+    )
+
+
+class ReplicationPlanOptionsSerializer(ReplicateSerializer):
+    """
+    Serializer for the options of a replication plan.
+    """
+
+    # A plan always considers a new replication
+    resume = None
+    full_diff = serializers.BooleanField(
+        help_text=_("Include the actions planned for every upstream distribution."),
+        required=False,
+        default=False,
+    )
+
+
+class ReplicationPlanSerializer(ModelSerializer):
+    """
+    Serializer for what a replication would do.
+    """
+
+    pulp_href = NestedIdentityField(
+        view_name="plans-detail", parent_lookup_kwargs={"server_pk": "server__pk"}
+    )
+    force = serializers.BooleanField(
+        help_text=_(
+            "Whether all repositories are synced, even if their upstream content did not change."
+        ),
+        read_only=True,
+    )
+    summary = serializers.DictField(
+        child=serializers.DictField(child=serializers.IntegerField()),
+        help_text=_(
+            "The number of planned actions per plugin type, e.g. 'remote_create', "
+            "'repository_update', 'distribution_clear', 'sync', 'unchanged' or 'stale_detach'."
+        ),
+        read_only=True,
+    )
+    diff = serializers.ListField(
+        child=serializers.DictField(),
+        help_text=_(
+            "The actions planned per upstream distribution, if 'full_diff' was requested. Upstream "
+            "distributions without any planned action are left out."
+        ),
+        read_only=True,
+        allow_null=True,
+    )
+
+    class Meta:
+        model = models.ReplicationPlan
+        fields = ModelSerializer.Meta.fields + ("force", "summary", "diff")
+
+
+class ReplicationRecordSerializer(ModelSerializer):
+    """
+    Serializer for a sync of a replicated distribution.
+    """
+
+    pulp_href = NestedIdentityField(
+        view_name="history-detail", parent_lookup_kwargs={"server_pk": "server__pk"}
+    )
+    task = RelatedField(
+        help_text=_("The task that synced the repository."),
+        view_name="tasks-detail",
+        read_only=True,
+    )
+    name = serializers.CharField(
+        help_text=_("The name of the distribution and its repository."), read_only=True
+    )
+    plugin = serializers.CharField(
+        help_text=_("The label of the plugin of the distribution."), read_only=True
+    )
+    upstream_version_href = serializers.CharField(
+        help_text=_("The upstream repository version synced."), read_only=True
+    )
+    started = serializers.DateTimeField(help_text=_("When the sync started."), read_only=True)
+    duration = serializers.FloatField(
+        help_text=_("How long the sync took, in seconds."), read_only=True
+    )
+    delta = serializers.BooleanField(
+        help_text=_("Whether the upstream changes were applied as a delta."), read_only=True
+    )
+    content_added = serializers.IntegerField(
+        help_text=_("The content added to the repository."), read_only=True
+    )
+    content_removed = serializers.IntegerField(
+        help_text=_("The content removed from the repository."), read_only=True
+    )
+    artifacts_added = serializers.IntegerField(
+        help_text=_("The artifacts downloaded by the sync."), read_only=True
+    )
+    bytes_downloaded = serializers.IntegerField(
+        help_text=_("The size of the artifacts downloaded by the sync."), read_only=True
+    )
+    result = serializers.CharField(
+        help_text=_("The state the sync finished in, 'completed' or 'failed'."), read_only=True
+    )
+
+    class Meta:
+        model = models.ReplicationRecord
+        fields = ModelSerializer.Meta.fields + (
+            "task",
+            "name",
+            "plugin",
+            "upstream_version_href",
+            "started",
+            "duration",
+            "delta",
+            "content_added",
+            "content_removed",
+            "artifacts_added",
+            "bytes_downloaded",
+            "result",
+        )
+
+
+class ReplicationStatsOptionsSerializer(serializers.Serializer):
+    """
+    Serializer for the options of the replication statistics.
+    """
+
+    group_by = serializers.ChoiceField(
+        choices=["server", "name", "plugin"],
+        help_text=_(
+            "Compute the statistics for the whole server, or per distribution or plugin, the "
+            "groups with the slowest syncs first. Defaults to 'server'."
+        ),
+        required=False,
+        default="server",
+    )
+
+
+class ReplicationStatsSerializer(serializers.Serializer):
+    """
+    Serializer for the statistics of the syncs of replicated distributions.
+    """
+
+    name = serializers.CharField(
+        help_text=_("The name of the distribution, if grouped by name."), required=False
+    )
+    plugin = serializers.CharField(
+        help_text=_("The label of the plugin, if grouped by plugin."), required=False
+    )
+    count = serializers.IntegerField(help_text=_("The number of syncs."))
+    failed = serializers.IntegerField(help_text=_("The number of failed syncs."))
+    duration_p50 = serializers.FloatField(
+        help_text=_("The median duration of the syncs, in seconds.")
+    )
+    duration_p95 = serializers.FloatField(
+        help_text=_("The 95th percentile of the duration of the syncs, in seconds.")
+    )
+    duration_max = serializers.FloatField(
+        help_text=_("The longest duration of the syncs, in seconds.")
+    )
+    bytes_downloaded = serializers.IntegerField(
+        help_text=_("The size of the artifacts downloaded by the syncs.")
+    )
+    artifacts_added = serializers.IntegerField(
+        help_text=_("The artifacts downloaded by the syncs.")
+    )
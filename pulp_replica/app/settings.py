@@ -4,3 +4,44 @@ Check `Plugin Writer's Guide`_ for more details.
 .. _Plugin Writer's Guide:
     https://docs.pulpproject.org/pulpcore/plugins/plugin-writer/index.html
 """
+
+# Number of upstream distributions requested per page while replicating
+REPLICATION_PAGE_SIZE = 100
+
+# Directory for caching data about upstream servers, e.g. their API schema. Defaults to
+# DEPLOY_ROOT/replica
+REPLICATION_CACHE_DIR = None
+
+# Seconds between replications of all the upstream distributions. Replications in between only
+# handle the upstream distributions that changed, if the upstream supports it
+REPLICATION_FULL_PASS_INTERVAL = 3600
+
+# Seconds between saves of the content request counts of a content app process
+REPLICATION_REQUEST_FLUSH_INTERVAL = 60
+
+# Number of the most requested paths whose artifacts are downloaded by a cache warming
+REPLICATION_WARM_LIMIT = 1000
+
+# Number of upstream distributions reconciled by each task of a replication
+REPLICATION_CHUNK_SIZE = 1000
+
+# If set, the upstream distributions are spread over this many buckets by a hash of their name, so
+# a distribution is always reconciled with the same others. Each bucket is dispatched as a chunk of
+# up to REPLICATION_CHUNK_SIZE distributions whenever it is full
+REPLICATION_CHUNKS = None
+
+# Whether full syncs downloading artifacts first look up the artifacts of the upstream repository
+# version the replica already has. Listing the upstream content costs one API call per page, the
+# delta syncs always look up the artifacts of the added content
+REPLICATION_PREFILTER_ARTIFACTS = False
+
+# Seconds after which the request count of a path that was not requested again is dropped
+REPLICATION_REQUEST_RETENTION = 7 * 24 * 3600
+
+# Seconds the replication history keeps the record of a sync for, None to keep all records
+REPLICATION_HISTORY_RETENTION = 90 * 24 * 3600
+
+# Largest fraction of the repositories replicated for a plugin that a full replication removes as
+# stale. Larger removals, and removals when the upstream selects no distribution at all, are skipped
+# with a warning. None removes any number of them
+REPLICATION_STALE_MAX_FRACTION = 0.5
@@ -1 +1,12 @@
-from .replication import replicate_distributions  # noqa
+from .distributing import update_distributions  # noqa
+from .replication import (  # noqa
+    finish_replication,
+    plan_replication,
+    reconcile_distributions,
+    replicate_distributions,
+    replicate_plugin,
+)
+from .removing import remove_stale  # noqa
+from .synchronizing import synchronize, synchronize_changes  # noqa
+from .updating import update_server  # noqa
+from .warming import warm_cache  # noqa
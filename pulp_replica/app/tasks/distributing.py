@@ -0,0 +1,105 @@
+from gettext import gettext as _
+from logging import getLogger
+
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+
+from pulpcore.app.apps import get_plugin_config
+
+from pulp_replica.app.metrics import ReplicationMetrics
+from pulp_replica.app.utils import bulk_update_fields, update_fields
+
+log = getLogger(__name__)
+
+
+def is_up_to_date(distro, distribution):
+    """
+    Check whether a local distribution already matches the requested state.
+
+    Args:
+        distro (pulpcore.plugin.models.Distribution): The local distribution.
+        distribution (dict): The requested state, as passed to `update_distributions`.
+    """
+    repository_pk = str(distro.repository_id) if distro.repository_id else None
+    if distribution["repository"] is None:
+        return repository_pk is None and distro.publication_id is None
+    return (
+        repository_pk == distribution["repository_pk"]
+        and distro.publication_id is None
+        and distro.base_path == distribution["base_path"]
+    )
+
+
+def update_distributions(app_label, serializer_name, distributions):
+    """
+    Create, update or clear the distributions of a plugin in a single transaction.
+
+    Creates and updates are validated by the plugin's distribution serializer. A distribution that
+    fails validation is skipped and logged without affecting the others. The number of created,
+    updated, unchanged and failed distributions is added to the replication metrics.
+
+    Args:
+        app_label (str): The label of the plugin providing the distributions.
+        serializer_name (str): The name of the plugin's distribution serializer.
+        distributions (list): Dicts with the "name", "base_path", "repository" href and
+            "repository_pk" each distribution should have. Existing distributions without a
+            repository are detached from their content.
+    """
+    metrics = ReplicationMetrics()
+    with metrics.collect(), metrics.timer("distributions"):
+        counts = _update_distributions(app_label, serializer_name, distributions)
+    for name, value in counts.items():
+        metrics.add(f"distributions_{name}", value)
+    metrics.save(app_label)
+
+
+def _update_distributions(app_label, serializer_name, distributions):
+    """Apply the distribution changes, returning the number of distributions per outcome."""
+    serializer_class = get_plugin_config(app_label).named_serializers[serializer_name]
+    model = serializer_class.Meta.model
+    existing = {
+        distro.name: distro
+        for distro in model.objects.filter(name__in=[d["name"] for d in distributions])
+    }
+    created = updated = unchanged = failed = 0
+    cleared = []
+
+    with transaction.atomic():
+        for distribution in distributions:
+            distro = existing.get(distribution["name"])
+            if distro is None and distribution["repository"] is None:
+                continue
+            if distro is not None and is_up_to_date(distro, distribution):
+                unchanged += 1
+                continue
+            if distribution["repository"] is None:
+                cleared.append(
+                    (distro, update_fields(distro, dict(repository_id=None, publication_id=None)))
+                )
+                continue
+
+            data = {
+                "name": distribution["name"],
+                "base_path": distribution["base_path"],
+                "repository": distribution["repository"],
+                "publication": None,
+            }
+            serializer = serializer_class(distro, data=data)
+            try:
+                with transaction.atomic():
+                    serializer.is_valid(raise_exception=True)
+                    serializer.save()
+            except ValidationError as e:
+                log.warning(
+                    _("Failed to replicate distribution '{name}': {error}").format(
+                        name=distribution["name"], error=e.detail
+                    )
+                )
+                failed += 1
+                continue
+            if distro is None:
+                created += 1
+            else:
+                updated += 1
+        updated += bulk_update_fields(model, cleared)
+    return dict(created=created, updated=updated, unchanged=unchanged, failed=failed)
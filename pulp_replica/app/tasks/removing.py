@@ -0,0 +1,57 @@
+from django.db import transaction
+
+from pulpcore.plugin.models import Distribution, Remote, Repository, TaskGroup
+from pulpcore.plugin.tasking import dispatch, orphan_cleanup
+
+from pulp_replica.app.metrics import ReplicationMetrics
+from pulp_replica.app.models import ReplicatedRepository
+
+
+def remove_stale(app_label, repository_pks, distribution_type, remote_type, delete_repositories):
+    """
+    Remove the local objects replicated from upstream distributions that are gone.
+
+    The distributions and remotes named like the repositories are deleted in bulk. The repositories
+    are either deleted as well, followed by an orphan cleanup, or no longer tracked as replicated.
+
+    Args:
+        app_label (str): The label of the plugin the objects belong to.
+        repository_pks (list): The pks of the stale replicated repositories.
+        distribution_type (str): The pulp_type of the plugin's distributions.
+        remote_type (str): The pulp_type of the plugin's remotes.
+        delete_repositories (bool): Delete the repositories instead of detaching them.
+    """
+    metrics = ReplicationMetrics()
+    with metrics.collect(), metrics.timer("remove"), transaction.atomic():
+        repositories = Repository.objects.filter(pk__in=repository_pks)
+        names = list(repositories.values_list("name", flat=True))
+        for name, model, queryset in (
+            (
+                "distributions_removed",
+                Distribution,
+                Distribution.objects.filter(pulp_type=distribution_type, name__in=names),
+            ),
+            (
+                "remotes_removed",
+                Remote,
+                Remote.objects.filter(pulp_type=remote_type, name__in=names),
+            ),
+        ):
+            metrics.add(name, queryset.delete()[1].get(model._meta.label, 0))
+        if delete_repositories:
+            metrics.add(
+                "repositories_removed", repositories.delete()[1].get(Repository._meta.label, 0)
+            )
+        else:
+            metrics.add(
+                "repositories_detached",
+                ReplicatedRepository.objects.filter(repository__in=repository_pks).delete()[0],
+            )
+    metrics.save(app_label)
+
+    if delete_repositories:
+        dispatch(
+            orphan_cleanup,
+            task_group=TaskGroup.current(),
+            exclusive_resources=["/pulp/api/v3/orphans/cleanup/"],
+        )
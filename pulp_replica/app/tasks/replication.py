@@ -1,257 +1,400 @@
-from pulp_replica.app.models import Server
-from pulpcore.cli.common.generic import PulpCLIContext
-from pulpcore.cli.file.context import (
-    PulpFileDistributionContext,
-    PulpFilePublicationContext,
-    PulpFileRemoteContext,
-    PulpFileRepositoryContext,
+import hashlib
+from collections import Counter, defaultdict
+from datetime import timedelta
+from gettext import gettext as _
+from logging import getLogger
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from pulp_replica.app.metrics import ReplicationMetrics, create_group_progress_reports
+from pulp_replica.app.models import (
+    ReplicationChunk,
+    ReplicationPlan,
+    ReplicationRecord,
+    ReplicationState,
+    Server,
 )
+from pulp_replica.app.replicators import get_pulp_ctx, get_replicator, get_replicator_labels
+from pulp_replica.app.utils import locked_resources
 
-from pulpcore.cli.rpm.context import (
-    PulpRpmDistributionContext,
-    PulpRpmPublicationContext,
-    PulpRpmRemoteContext,
-    PulpRpmRepositoryContext,
-)
+from pulpcore.plugin.models import CreatedResource, Task, TaskGroup
+from pulpcore.plugin.tasking import dispatch
+from pulpcore.plugin.util import get_url
 
+log = getLogger(__name__)
 
-from pulp_file.app.models import FileDistribution, FileRemote, FileRepository
-from pulp_file.app.tasks import synchronize as file_synchronize
 
-from pulp_rpm.app.models import RpmDistribution, RpmRemote, RpmRepository
-from pulp_rpm.app.tasks import synchronize as rpm_synchronize
+def get_replicated_plugins(server):
+    """Return the labels of the enabled replicators selected by a server."""
+    return [
+        app_label
+        for app_label in get_replicator_labels()
+        if not server.plugin_types or app_label in server.plugin_types
+    ]
 
-from pulpcore.plugin.models import Task, TaskGroup
-from pulpcore.plugin.tasking import dispatch  # , general_create, general_update
-from pulpcore.plugin.util import get_url
-from pulpcore.constants import TASK_FINAL_STATES, TASK_STATES
-
-from pulpcore.app import tasks
-
-
-class Replicator:
-    def __init__(self, pulp_ctx, task_group):
-        """
-        Override this method with instances of plugin specific instances of Remote, Repository, and Distribution contexts.
-        :param pulp_ctx: PulpReplicaContext
-        """
-        self.pulp_ctx = pulp_ctx
-        self.task_group = task_group
-        self.distribution_ctx = None
-        self.remote_ctx = None
-        self.repository_ctx = None
-        self.publication_ctx = None
-        self.remote_model = None
-        self.repository_model = None
-        self.distribution_model = None
-        self.distribution_serializer = None
-        self.app_label = None
-        self.sync_task = None
-
-    def get_upstream_distributions(self):
-        return self.distribution_ctx(self.pulp_ctx).list(1000, 0, {})
-
-    def url(self, upstream_distribution):
-        return upstream_distribution["base_url"]
-
-    def create_or_update_remote(self, upstream_distribution):
-
-        if not upstream_distribution["repository"] and not upstream_distribution["publication"]:
-
-            return None
-        url = self.url(upstream_distribution)
-        # Check if there is a remote pointing to this distribution
-        try:
-            remote = self.remote_model.objects.get(name=upstream_distribution["name"])
-            if remote.url != url:
-                remote.url = url
-                remote.save()
-        except self.remote_model.DoesNotExist:
-            # Create the remote
-            remote = self.remote_model(name=upstream_distribution["name"], url=url)
-            remote.save()
-
-        return remote
-
-    def repository_extra_fields(self, remote):
-        return {}
-
-    def create_or_update_repository(self, remote):
-        try:
-            repository = self.repository_model.objects.get(name=remote.name)
-            # Update the existing repository with latest values
-            repository.remote = remote
-            for field_name, value in self.repository_extra_fields(remote).items():
-                setattr(repository, field_name, value)
-            repository.save()
-        except self.repository_model.DoesNotExist:
-            repository = self.repository_model(
-                name=remote.name, remote=remote, **self.repository_extra_fields(remote)
-            )
-            repository.save()
-        return repository
-
-    def create_or_update_distribution(self, repository, upstream_distribution):
-        try:
-            distro = self.distribution_model.objects.get(name=upstream_distribution["name"])
-            # Check that the distribution has the right repository associated
-            if (
-                not distro.repository
-                or distro.repository.pk != repository.pk
-                or distro.base_path == upstream_distribution["base_path"]
-            ):
-                # Update the distribution
-                dispatch(
-                    tasks.base.general_update,
-                    task_group=self.task_group,
-                    exclusive_resources=["/api/v3/distributions/"],
-                    args=(distro.pk, self.app_label, self.serializer_name),
-                    kwargs={
-                        "data": {
-                            "name": upstream_distribution["name"],
-                            "base_path": upstream_distribution["base_path"],
-                            "repository": get_url(repository),
-                        }
-                    },
-                )
-        except self.distribution_model.DoesNotExist:
-            # Dispatch a task to create the distribution
-            dispatch(
-                tasks.base.general_create,
-                task_group=self.task_group,
-                exclusive_resources=["/api/v3/distributions/"],
-                args=(self.app_label, self.serializer_name),
-                kwargs={
-                    "data": {
-                        "name": upstream_distribution["name"],
-                        "base_path": upstream_distribution["base_path"],
-                        "repository": get_url(repository),
-                    }
-                },
-            )
 
-    def sync_params(self, repository):
-        """This method returns a dict that will be passed as kwargs to the sync task."""
-        raise NotImplementedError("Each replicator must supply its own sync params.")
+def plan_replication(server_pk, force=False, full_diff=False):
+    """
+    Compute what replicating a server would do, without changing the replicas or dispatching tasks.
 
-    def sync(self, repository):
-        dispatch(
-            self.sync_task,
-            task_group=self.task_group,
-            shared_resources=[repository.remote],
-            exclusive_resources=[repository],
-            kwargs=self.sync_params(repository),
-        )
+    All the selected upstream distributions are considered, as in a full replication, including
+    the local repositories whose upstream distribution is gone. The plan is saved as a
+    ReplicationPlan created by the task, replacing the previous plans of the server.
 
+    Args:
+        server_pk (str): The pk of the Server to replicate.
+        force (bool): Plan to sync all repositories, even if their upstream content did not change.
+        full_diff (bool): Include the actions planned for every upstream distribution.
+    """
+    server = Server.objects.get(pk=server_pk)
+    pulp_ctx = get_pulp_ctx(server)
+    summary = {}
+    diff = []
+    for app_label in get_replicated_plugins(server):
+        replicator = get_replicator(app_label)(pulp_ctx, None, server)
+        counts = Counter()
+        names = set()
+        for distros in replicator.get_upstream_distributions():
+            names.update(distro["name"] for distro in distros)
+            for actions in replicator.plan(distros, force=force):
+                for kind in ("remote", "repository", "distribution"):
+                    if kind in actions:
+                        counts[f"{kind}_{actions[kind]}"] += 1
+                if actions.get("sync"):
+                    counts["sync"] += 1
+                if len(actions) == 1:
+                    counts["unchanged"] += 1
+                elif full_diff:
+                    diff.append(dict(actions, plugin=app_label))
+        if server.stale_policy != Server.KEEP:
+            stale = replicator.stale_repositories(names)
+            if stale:
+                counts[f"stale_{server.stale_policy}"] = len(stale)
+            if full_diff:
+                diff.extend(
+                    {"name": repository.name, "plugin": app_label, "stale": server.stale_policy}
+                    for repository in stale
+                )
+        summary[app_label] = dict(counts)
 
-class FileReplicator(Replicator):
-    def __init__(self, pulp_ctx, task_group):
-        self.pulp_ctx = pulp_ctx
-        self.remote_ctx = PulpFileRemoteContext
-        self.repository_ctx = PulpFileRepositoryContext
-        self.distribution_ctx = PulpFileDistributionContext
-        self.publication_ctx = PulpFilePublicationContext
-        self.app_label = "file"
-        self.remote_model = FileRemote
-        self.repository_model = FileRepository
-        self.distribution_model = FileDistribution
-        self.serializer_name = "FileDistributionSerializer"
-        self.task_group = task_group
-        self.sync_task = file_synchronize
-
-    def url(self, upstream_distribution):
-        # Check if a distribution is repository or publication based
-        if upstream_distribution["repository"]:
-            manifest = self.repository_ctx(
-                self.pulp_ctx, upstream_distribution["repository"]
-            ).entity["manifest"]
-        elif upstream_distribution["publication"]:
-            manifest = self.publication_ctx(self.pulp_ctx, distro["publication"]).entity["manifest"]
-        else:
-            # This distribution doesn't serve any content
-            return None
-
-        return f"{upstream_distribution['base_url']}{manifest}"
-
-    def repository_extra_fields(self, remote):
-        return dict(manifest=remote.url.split("/")[-1], autopublish=True)
-
-    def sync_params(self, repository):
-        return dict(
-            remote_pk=str(repository.remote.pk),
-            repository_pk=str(repository.pk),
-            mirror=True,
+    with transaction.atomic():
+        ReplicationPlan.objects.filter(server=server).delete()
+        plan = ReplicationPlan.objects.create(
+            server=server, force=force, summary=summary, diff=diff if full_diff else None
         )
+        CreatedResource.objects.create(content_object=plan)
 
 
-class RpmReplicator(Replicator):
-    def __init__(self, pulp_ctx, task_group):
-        self.pulp_ctx = pulp_ctx
-        self.remote_ctx = PulpRpmRemoteContext
-        self.repository_ctx = PulpRpmRepositoryContext
-        self.distribution_ctx = PulpRpmDistributionContext
-        self.publication_ctx = PulpRpmPublicationContext
-        self.app_label = "rpm"
-        self.remote_model = RpmRemote
-        self.repository_model = RpmRepository
-        self.distribution_model = RpmDistribution
-        self.serializer_name = "RpmDistributionSerializer"
-        self.task_group = task_group
-        self.sync_task = rpm_synchronize
-
-    def repository_extra_fields(self, remote):
-        # TODO: determine which RPM repository fields should also be included
-        return dict(autopublish=True)
-
-    def sync_params(self, repository):
-        return dict(
-            remote_pk=repository.remote.pk,
-            repository_pk=repository.pk,
-            sync_policy="mirror_complete",
-            skip_types=[],
-            optimize=True,
-        )
+def chunk_of(name, chunks):
+    """Return the bucket an upstream distribution is reconciled in, by a stable hash of its name."""
+    return int(hashlib.sha256(name.encode()).hexdigest(), 16) % chunks
 
 
-def replicate_distributions(server_pk):
+def split_distributions(pages, chunks=None, chunk_size=1000, skipped=()):
+    """
+    Split pages of upstream distributions into chunks, yielding each chunk as soon as it is full.
+
+    Args:
+        pages (iterable): Lists of upstream distributions.
+        chunks (int): If set, the distributions are spread over this many buckets by a hash of
+            their name, and each bucket is yielded as a chunk whenever it is full.
+        chunk_size (int): The maximum number of distributions in a chunk.
+        skipped (set): The names of the upstream distributions to leave out.
+    """
+    buckets = defaultdict(list)
+    for distros in pages:
+        for distro in distros:
+            if distro["name"] in skipped:
+                continue
+            bucket = chunk_of(distro["name"], chunks) if chunks else 0
+            buckets[bucket].append(distro)
+            if len(buckets[bucket]) >= chunk_size:
+                yield buckets.pop(bucket)
+    for bucket in sorted(buckets):
+        yield buckets[bucket]
+
+
+def replication_locks(server, app_label):
+    """
+    Return the resources locked by the replication of a plugin type, as (listing, replication).
+
+    The listing task holds the listing lock, the reconcile tasks share the replication lock, and
+    the final task holds both.
+    """
+    lock = f"{get_url(server)}replicators/{app_label}/"
+    return f"{lock}listing/", lock
+
+
+def replication_in_progress(lock):
+    """Check whether tasks of a replication hold or wait for its replication lock."""
+    return bool(locked_resources([lock]))
+
+
+def replicate_plugin(server_pk, app_label, force=False, resume=False):
+    """
+    Replicate the distributions of one plugin type from an upstream server.
+
+    If the upstream supports it, only the distributions that changed since the previous
+    replication are replicated. A full replication is done at least every
+    REPLICATION_FULL_PASS_INTERVAL seconds, after the server was changed, or when forced.
+
+    The selected upstream distributions are listed and split into chunks, each reconciled by its
+    own task in the replication's task group, so they run in parallel on different workers while
+    the listing goes on. The chunks hold REPLICATION_CHUNK_SIZE distributions. If
+    REPLICATION_CHUNKS is set, the distributions are first spread over that many buckets by a hash
+    of their name, so a distribution is always reconciled with the same other distributions, and
+    each bucket is dispatched as a chunk whenever it is full. A final task waits for the reconcile
+    tasks and completes the replication. A replication is skipped while the tasks of the previous
+    one are not finished.
+
+    The chunks and the progress of their reconciliation are saved as a checkpoint of the
+    replication until it completes. With `resume`, a replication that did not complete is
+    continued: the chunks that were not fully reconciled are dispatched again, and the upstream
+    distributions that are not in a chunk yet are listed.
+
+    The time spent in each phase, the upstream API calls and the database queries are recorded as
+    progress reports of the task.
+
+    Args:
+        server_pk (str): The pk of the Server to replicate.
+        app_label (str): The label of the plugin whose distributions are replicated.
+        force (bool): Sync all repositories, even if their upstream content did not change.
+        resume (bool): Continue the previous replication if it did not complete.
+    """
     server = Server.objects.get(pk=server_pk)
-    api_kwargs = dict(
-        base_url=server.base_url,
-        username=server.username,
-        password=server.password,
-        user_agent="pulpcore-3.22",
-    )
-    ctx = PulpCLIContext(
-        api_root=server.api_root,
-        api_kwargs=api_kwargs,
-        format="json",
-        background_tasks=False,
-        timeout=0,
-    )
+    listing_lock, lock = replication_locks(server, app_label)
+    if replication_in_progress(lock):
+        log.warning(
+            _("The previous replication of {plugin} from {server} is in progress.").format(
+                plugin=app_label, server=server.name
+            )
+        )
+        return
+
+    metrics = ReplicationMetrics()
+    with metrics.timer("connect"):
+        pulp_ctx = get_pulp_ctx(server)
     task_group = TaskGroup.current()
-    supported_replicators = [FileReplicator(ctx, task_group), RpmReplicator(ctx, task_group)]
+    replicator = get_replicator(app_label)(pulp_ctx, task_group, server)
+    replicator.metrics = metrics
+    task_pks = [str(Task.current().pk)]
+
+    def dispatch_chunk(chunk):
+        with metrics.timer("dispatch"):
+            task = dispatch(
+                reconcile_distributions,
+                task_group=task_group,
+                # Shared with the other chunks, the final task waits for all of them
+                shared_resources=[lock],
+                kwargs={
+                    "server_pk": server_pk,
+                    "app_label": app_label,
+                    "chunk_pk": str(chunk.pk),
+                    "force": force,
+                },
+            )
+        task_pks.append(str(task.pk))
+        metrics.add("chunks_dispatched")
+
+    try:
+        with metrics.collect(replicator.session):
+            state, created = ReplicationState.objects.get_or_create(server=server, plugin=app_label)
+
+            # The names of the upstream distributions already in a chunk
+            chunked = set()
+            if resume and state.checkpoint_started is not None:
+                for chunk in state.chunks.all():
+                    chunked.update(distro["name"] for distro in chunk.distributions)
+                    if not chunk.reconciled:
+                        dispatch_chunk(chunk)
+            else:
+                state.chunks.all().delete()
+                started = timezone.now()
+                full_pass_due = started - timedelta(seconds=settings.REPLICATION_FULL_PASS_INTERVAL)
+                high_water_mark = None
+                if replicator.supports_incremental_replication():
+                    high_water_mark = replicator.upstream_high_water_mark()
+                incremental = (
+                    not force
+                    and high_water_mark is not None
+                    and state.high_water_mark is not None
+                    and state.last_full_pass is not None
+                    and state.last_full_pass
+                    > max(full_pass_due, server.pulp_last_updated or full_pass_due)
+                )
+                state.checkpoint_started = started
+                state.checkpoint_high_water_mark = high_water_mark
+                state.checkpoint_full_pass = not incremental
+                state.checkpoint_listed = False
+                state.save()
+
+            if not state.checkpoint_listed:
+                if state.checkpoint_full_pass:
+                    pages = replicator.get_upstream_distributions()
+                else:
+                    pages = replicator.get_changed_upstream_distributions(state.high_water_mark)
+                entities = {}
+
+                def listed_pages():
+                    for distros in pages:
+                        # The feed describes the upstream entities of the page being listed
+                        entities.update(replicator.feed_entities)
+                        yield distros
+
+                for distros in split_distributions(
+                    listed_pages(),
+                    chunks=settings.REPLICATION_CHUNKS,
+                    chunk_size=settings.REPLICATION_CHUNK_SIZE,
+                    skipped=chunked,
+                ):
+                    hrefs = {distro["repository"] or distro["publication"] for distro in distros}
+                    chunk = ReplicationChunk.objects.create(
+                        state=state,
+                        distributions=distros,
+                        entities={href: entities[href] for href in hrefs if href in entities},
+                    )
+                    dispatch_chunk(chunk)
+                state.checkpoint_listed = True
+                state.save()
+
+            with metrics.timer("dispatch"):
+                dispatch(
+                    finish_replication,
+                    task_group=task_group,
+                    # Runs once the reconcile tasks holding the shared lock are finished, and
+                    # the next listing waits for it
+                    exclusive_resources=[listing_lock, lock],
+                    kwargs={"server_pk": server_pk, "app_label": app_label, "task_pks": task_pks},
+                )
+    finally:
+        metrics.save(app_label)
 
-    for replicator in supported_replicators:
-        distros = replicator.get_upstream_distributions()
 
-        for distro in distros:
-            # Create remote
-            remote = replicator.create_or_update_remote(upstream_distribution=distro)
-            if not remote:
-                # The upstream distribution is not serving any content, cleanup an existing local distribution
-                try:
-                    local_distro = replicator.distribution_model.objects.get(name=distro["name"])
-                    local_distro.repository = None
-                    local_distro.publication = None
-                    local_distro.save()
-                    continue
-                except replicator.distribution_model.DoesNotExist:
-                    continue
-            # Check if there is already a repository
-            repository = replicator.create_or_update_repository(remote=remote)
-
-            # Dispatch a sync task
-            replicator.sync(repository)
-
-            # Get or create a distribution
-            replicator.create_or_update_distribution(repository, distro)
+def reconcile_distributions(server_pk, app_label, chunk_pk, force=False):
+    """
+    Reconcile the local objects with a chunk of the upstream distributions of one plugin type.
+
+    The number of distributions reconciled is saved after every page, so that a resumed
+    replication continues with the next page.
+
+    Args:
+        server_pk (str): The pk of the Server being replicated.
+        app_label (str): The label of the plugin whose distributions are replicated.
+        chunk_pk (str): The pk of the ReplicationChunk to reconcile.
+        force (bool): Sync all repositories, even if their upstream content did not change.
+    """
+    server = Server.objects.get(pk=server_pk)
+    chunk = ReplicationChunk.objects.get(pk=chunk_pk)
+    metrics = ReplicationMetrics()
+    with metrics.timer("connect"):
+        pulp_ctx = get_pulp_ctx(server)
+    replicator = get_replicator(app_label)(pulp_ctx, TaskGroup.current(), server)
+    replicator.metrics = metrics
+    replicator.feed_entities = chunk.entities
+    page_size = settings.REPLICATION_PAGE_SIZE
+    try:
+        with metrics.collect(replicator.session):
+            distributions = chunk.distributions
+            for i in range(chunk.position, len(distributions), page_size):
+                replicator.replicate(distributions[i : i + page_size], force=force)
+                chunk.position = min(i + page_size, len(distributions))
+                chunk.save(update_fields=["position", "pulp_last_updated"])
+            chunk.reconciled = True
+            chunk.save(update_fields=["reconciled", "pulp_last_updated"])
+    finally:
+        metrics.save(app_label)
+
+
+def prune_records(server, app_label):
+    """Delete the records of the syncs of a plugin older than `REPLICATION_HISTORY_RETENTION`."""
+    if settings.REPLICATION_HISTORY_RETENTION is None:
+        return
+    cutoff = timezone.now() - timedelta(seconds=settings.REPLICATION_HISTORY_RETENTION)
+    ReplicationRecord.objects.filter(server=server, plugin=app_label, started__lt=cutoff).delete()
+
+
+def finish_replication(server_pk, app_label, task_pks):
+    """
+    Complete the replication of one plugin type once all its reconcile tasks are finished.
+
+    The metrics of the replication's tasks are added up and recorded on this task. If all the
+    chunks of the replication were reconciled, the replication state is advanced and the
+    checkpoint is cleared. After a full replication, the local objects replicated from upstream
+    distributions that are gone are removed according to the server's `stale_policy`. Otherwise
+    the checkpoint is kept, so that the replication can be resumed. Either way, the records of the
+    replication history older than `REPLICATION_HISTORY_RETENTION` are deleted.
+
+    Args:
+        server_pk (str): The pk of the Server being replicated.
+        app_label (str): The label of the plugin whose distributions are replicated.
+        task_pks (list): The pks of the tasks listing and reconciling the distributions.
+    """
+    server = Server.objects.get(pk=server_pk)
+    metrics = ReplicationMetrics()
+    try:
+        with metrics.collect():
+            prune_records(server, app_label)
+            state = ReplicationState.objects.get(server=server, plugin=app_label)
+            if not state.checkpoint_listed or state.chunks.filter(reconciled=False).exists():
+                log.warning(
+                    _("The replication of {plugin} from {server} did not complete.").format(
+                        plugin=app_label, server=server.name
+                    )
+                )
+                return
+
+            if state.checkpoint_full_pass:
+                names = set()
+                for distributions in state.chunks.values_list("distributions", flat=True):
+                    names.update(distro["name"] for distro in distributions)
+                replicator = get_replicator(app_label)(None, TaskGroup.current(), server)
+                replicator.metrics = metrics
+                replicator.remove_stale(names)
+
+            with transaction.atomic():
+                state.high_water_mark = state.checkpoint_high_water_mark
+                if state.checkpoint_full_pass:
+                    state.last_full_pass = state.checkpoint_started
+                state.checkpoint_started = None
+                state.checkpoint_high_water_mark = None
+                state.checkpoint_full_pass = False
+                state.checkpoint_listed = False
+                state.save()
+                state.chunks.all().delete()
+    finally:
+        metrics.save(app_label, combined=ReplicationMetrics.from_tasks(task_pks))
+
+
+def replicate_distributions(server_pk, force=False, resume=False):
+    """
+    Replicate the distributions of an upstream server.
+
+    Every plugin type is replicated by its own task in the replication's task group, so they run
+    in parallel on different workers, and each of them splits its distributions into chunks
+    reconciled in parallel too. Replications of the same server and plugin type still exclude
+    each other. The metrics of all tasks are added up in group progress reports of the
+    task group.
+
+    Args:
+        server_pk (str): The pk of the Server to replicate.
+        force (bool): Sync all repositories, even if their upstream content did not change.
+        resume (bool): Continue the previous replication of each plugin type if it did not
+            complete.
+    """
+    server = Server.objects.get(pk=server_pk)
+    task_group = TaskGroup.current()
+    create_group_progress_reports(task_group)
+    for app_label in get_replicated_plugins(server):
+        dispatch(
+            replicate_plugin,
+            task_group=task_group,
+            exclusive_resources=[replication_locks(server, app_label)[0]],
+            kwargs={
+                "server_pk": server_pk,
+                "app_label": app_label,
+                "force": force,
+                "resume": resume,
+            },
+        )
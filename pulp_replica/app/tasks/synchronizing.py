@@ -0,0 +1,189 @@
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db.models import Count, Sum
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from pulp_replica.app.metrics import ReplicationMetrics
+from pulp_replica.app.models import ReplicatedRepository, ReplicationRecord, Server
+from pulp_replica.app.replicators import get_pulp_ctx, get_replicator
+
+from pulpcore.plugin.constants import TASK_STATES
+from pulpcore.plugin.models import Artifact, ContentArtifact, Remote, Task, TaskGroup
+
+
+def get_task_replicator(app_label, server_pk):
+    """Return the replicator of a plugin for a server, in a task of the replication."""
+    server = Server.objects.get(pk=server_pk)
+    return get_replicator(app_label)(get_pulp_ctx(server), TaskGroup.current(), server)
+
+
+def downloads_artifacts(repository):
+    """Check whether syncing a repository downloads the artifacts of its content."""
+    return repository.remote is not None and repository.remote.policy == Remote.IMMEDIATE
+
+
+def record_sync(replicated_repository, upstream_content_href, upstream_version_href, metrics):
+    """Record the upstream content a replicated repository was synced from, and the metrics."""
+    replicated_repository.upstream_content_href = upstream_content_href
+    replicated_repository.upstream_version_href = upstream_version_href
+    replicated_repository.save(
+        update_fields=["upstream_content_href", "upstream_version_href", "pulp_last_updated"]
+    )
+    metrics.save(replicated_repository.repository.pulp_type.split(".")[0])
+
+
+@contextmanager
+def recording(replicated_repository, upstream_version_href):
+    """
+    Record the sync of a replicated repository in the replication history, also if it fails.
+
+    The content added and removed are those of the repository version the sync created. The
+    artifacts of the added content that were created during the sync count as downloaded.
+    Yields the ReplicationRecord, which is saved when the sync is done.
+    """
+    repository = replicated_repository.repository
+    base_version = repository.latest_version()
+    record = ReplicationRecord(
+        server_id=replicated_repository.server_id,
+        task=Task.current(),
+        name=repository.name,
+        plugin=repository.pulp_type.split(".")[0],
+        upstream_version_href=upstream_version_href,
+        started=timezone.now(),
+        result=TASK_STATES.FAILED,
+    )
+    try:
+        yield record
+        record.result = TASK_STATES.COMPLETED
+    finally:
+        record.duration = (timezone.now() - record.started).total_seconds()
+        version = repository.latest_version()
+        if version is not None and version != base_version:
+            added = version.added(base_version=base_version)
+            record.content_added = added.count()
+            record.content_removed = version.removed(base_version=base_version).count()
+            artifacts = Artifact.objects.filter(
+                pk__in=ContentArtifact.objects.filter(content__in=added).values("artifact"),
+                pulp_created__gte=record.started,
+            ).aggregate(count=Count("pk"), size=Sum("size"))
+            record.artifacts_added = artifacts["count"]
+            record.bytes_downloaded = artifacts["size"] or 0
+        record.save()
+
+
+def synchronize(
+    sync_task,
+    replicated_repository_pk,
+    upstream_content_href,
+    sync_kwargs,
+    upstream_version_href=None,
+    app_label=None,
+    server_pk=None,
+):
+    """
+    Sync a replicated repository using the sync task of its plugin.
+
+    If the sync downloads artifacts and `REPLICATION_PREFILTER_ARTIFACTS` is set, the artifacts of
+    the upstream repository version the replica already has are looked up in bulk first, and
+    counted as saved downloads. The sync pipeline of the plugin only downloads the missing ones.
+
+    Once the sync succeeded, the upstream content it was synced from is recorded so that later
+    replications can skip the sync until the upstream content changes. The time the sync took is
+    added to the replication metrics, and the sync is recorded in the replication history.
+
+    Args:
+        sync_task (str): Import path of the plugin's sync task.
+        replicated_repository_pk (str): The pk of the ReplicatedRepository being synced.
+        upstream_content_href (str): The upstream publication or repository version being synced.
+        sync_kwargs (dict): The keyword arguments of the plugin's sync task.
+        upstream_version_href (str): The upstream repository version being synced.
+        app_label (str): The label of the plugin the repository belongs to.
+        server_pk (str): The pk of the Server the repository is replicated from.
+    """
+    replicated_repository = ReplicatedRepository.objects.select_related("repository__remote").get(
+        pk=replicated_repository_pk
+    )
+    metrics = ReplicationMetrics()
+    if (
+        settings.REPLICATION_PREFILTER_ARTIFACTS
+        and server_pk
+        and upstream_version_href
+        and downloads_artifacts(replicated_repository.repository)
+    ):
+        replicator = get_task_replicator(app_label, server_pk)
+        metrics = replicator.metrics
+        if replicator.artifact_fields:
+            with metrics.collect(replicator.session):
+                replicator.prefilter_artifacts(
+                    replicator.upstream_checksums(upstream_version_href),
+                    replicated_repository.repository.latest_version(),
+                )
+
+    with recording(replicated_repository, upstream_version_href), metrics.timer("sync"):
+        import_string(sync_task)(**sync_kwargs)
+    record_sync(replicated_repository, upstream_content_href, upstream_version_href, metrics)
+
+
+def synchronize_changes(
+    app_label,
+    server_pk,
+    sync_task,
+    replicated_repository_pk,
+    upstream_content_href,
+    sync_kwargs,
+    upstream_version_href,
+):
+    """
+    Apply the content changed upstream since the last sync of a replicated repository.
+
+    The content added and removed between the upstream repository version the repository was last
+    synced from and `upstream_version_href` is applied as one new repository version, so the work
+    scales with the size of the changes. Only the artifacts of the added content the replica
+    doesn't have yet are downloaded. The repository is synced fully with the sync task of its
+    plugin if the changes can't be replicated as a delta. The sync is recorded in the replication
+    history.
+
+    Args:
+        app_label (str): The label of the plugin the repository belongs to.
+        server_pk (str): The pk of the Server the repository is replicated from.
+        sync_task (str): Import path of the plugin's sync task.
+        replicated_repository_pk (str): The pk of the ReplicatedRepository being synced.
+        upstream_content_href (str): The upstream publication or repository version being synced.
+        sync_kwargs (dict): The keyword arguments of the plugin's sync task.
+        upstream_version_href (str): The upstream repository version being synced.
+    """
+    replicated_repository = ReplicatedRepository.objects.select_related("repository__remote").get(
+        pk=replicated_repository_pk
+    )
+    replicator = get_task_replicator(app_label, server_pk)
+    metrics = replicator.metrics
+    with metrics.collect(replicator.session), metrics.timer("sync"), recording(
+        replicated_repository, upstream_version_href
+    ) as record:
+        changes = replicator.upstream_changes(
+            replicated_repository.upstream_version_href, upstream_version_href
+        )
+        record.delta = changes is not None
+        if changes is None:
+            metrics.add("full_syncs")
+            import_string(sync_task)(**sync_kwargs)
+        else:
+            added, removed = changes
+            artifacts = {}
+            if downloads_artifacts(replicated_repository.repository):
+                artifacts = replicator.prefilter_artifacts(
+                    {
+                        replicator.artifact_checksum(content["pulp_type"], content)
+                        for content in added.values()
+                    }
+                    - {None},
+                    replicated_repository.repository.latest_version(),
+                )
+            replicator.apply_changes(
+                replicated_repository.repository.cast(), added, removed, artifacts
+            )
+            metrics.add("content_added", len(added))
+            metrics.add("content_removed", len(removed))
+    record_sync(replicated_repository, upstream_content_href, upstream_version_href, metrics)
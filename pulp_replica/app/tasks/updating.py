@@ -0,0 +1,19 @@
+from pulp_replica.app.models import Server
+from pulp_replica.app.serializers import ServerSerializer
+
+
+def update_server(server_pk, data, partial=False):
+    """
+    Update the settings of a server.
+
+    The replicated remotes get the new settings when the next replication reconciles them. Saving
+    the server makes that replication a full pass, so that every remote is reconciled.
+
+    Args:
+        server_pk (str): The pk of the Server to update.
+        data (dict): The fields of the server to update, as validated by the viewset.
+        partial (bool): When false, the fields missing from `data` get their default.
+    """
+    serializer = ServerSerializer(Server.objects.get(pk=server_pk), data=data, partial=partial)
+    serializer.is_valid(raise_exception=True)
+    serializer.save()
@@ -0,0 +1,161 @@
+import asyncio
+from collections import defaultdict
+from datetime import timedelta
+from gettext import gettext as _
+from logging import getLogger
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from pulpcore.plugin.models import (
+    Artifact,
+    ContentArtifact,
+    Distribution,
+    PublishedArtifact,
+    Remote,
+    RemoteArtifact,
+    Repository,
+)
+
+from pulp_replica.app.metrics import ReplicationMetrics
+from pulp_replica.app.models import ReplicatedRepository, RequestedPath
+
+log = getLogger(__name__)
+
+
+def hot_paths(base_paths, limit):
+    """
+    Return the most requested paths of some distributions, as RequestedPaths.
+
+    Args:
+        base_paths (list): The base paths of the distributions.
+        limit (int): The maximum number of paths to return.
+    """
+    return RequestedPath.objects.filter(base_path__in=base_paths).order_by("-count")[:limit]
+
+
+def missing_content_artifacts(repository_pk, relative_paths):
+    """
+    Return the content artifacts served at some paths of a repository that have no artifact yet.
+
+    The paths are looked up in the publications of the latest repository version, and as the
+    relative paths of its content for pass-through publications.
+    """
+    version = Repository.objects.get(pk=repository_pk).latest_version()
+    published = PublishedArtifact.objects.filter(
+        publication__repository_version=version,
+        publication__complete=True,
+        relative_path__in=relative_paths,
+    ).values("content_artifact")
+    return ContentArtifact.objects.filter(
+        Q(pk__in=published) | Q(content__in=version.content, relative_path__in=relative_paths),
+        artifact__isnull=True,
+    )
+
+
+def download(remote_artifacts):
+    """Download remote artifacts concurrently, returning their DownloadResults or exceptions."""
+    remotes = {}
+    downloaders = []
+    for remote_artifact in remote_artifacts:
+        if remote_artifact.remote_id not in remotes:
+            remotes[remote_artifact.remote_id] = remote_artifact.remote.cast()
+        remote = remotes[remote_artifact.remote_id]
+        downloaders.append(remote.get_downloader(remote_artifact=remote_artifact))
+
+    async def run():
+        # The downloaders of a remote share its download_concurrency limit
+        return await asyncio.gather(
+            *(downloader.run() for downloader in downloaders), return_exceptions=True
+        )
+
+    return asyncio.get_event_loop().run_until_complete(run())
+
+
+def save_artifact(result):
+    """Save a downloaded artifact, or return the existing one if it was saved meanwhile."""
+    artifact = Artifact(**result.artifact_attributes, file=result.path)
+    try:
+        with transaction.atomic():
+            artifact.save()
+    except IntegrityError:
+        artifact = Artifact.objects.get(artifact.q())
+    return artifact
+
+
+def warm(content_artifacts, metrics):
+    """Download the artifacts of a batch of content artifacts from one of their remotes."""
+    remote_artifacts = {}
+    for remote_artifact in RemoteArtifact.objects.filter(
+        content_artifact__in=content_artifacts
+    ).select_related("remote", "content_artifact"):
+        remote_artifacts.setdefault(remote_artifact.content_artifact_id, remote_artifact)
+    remote_artifacts = list(remote_artifacts.values())
+
+    warmed = []
+    for remote_artifact, result in zip(remote_artifacts, download(remote_artifacts)):
+        if isinstance(result, Exception):
+            log.warning(
+                _("Failed to download {url}: {error}").format(url=remote_artifact.url, error=result)
+            )
+            metrics.add("artifacts_warm_failed")
+            continue
+        content_artifact = remote_artifact.content_artifact
+        content_artifact.artifact = save_artifact(result)
+        warmed.append(content_artifact)
+        metrics.add("bytes_warmed", content_artifact.artifact.size)
+    ContentArtifact.objects.bulk_update(warmed, ["artifact"])
+    metrics.add("artifacts_warmed", len(warmed))
+
+
+def warm_cache(server_pk):
+    """
+    Download the artifacts of the most requested content replicated from a server.
+
+    The content app counts the requests per path of the replicated distributions whose remotes
+    use the on_demand policy. The most requested paths served by the distributions of the server,
+    up to `REPLICATION_WARM_LIMIT`, are resolved to their content, and the artifacts that were not
+    downloaded yet are downloaded. The rest of the content stays deferred. Streamed content is
+    not warmed, even if it was counted before its remote changed policy, since Pulp never saves
+    it.
+
+    The counts of the warmed paths are dropped so that the next warming picks the next paths, and
+    so are the counts of the paths not requested for `REPLICATION_REQUEST_RETENTION` seconds.
+
+    Args:
+        server_pk (str): The pk of the Server the repositories are replicated from.
+    """
+    replicated = ReplicatedRepository.objects.filter(server_id=server_pk).values("repository_id")
+    repositories = dict(
+        Distribution.objects.filter(
+            repository__in=replicated, repository__remote__policy=Remote.ON_DEMAND
+        ).values_list("base_path", "repository_id")
+    )
+    cutoff = timezone.now() - timedelta(seconds=settings.REPLICATION_REQUEST_RETENTION)
+    RequestedPath.objects.filter(last_requested__lt=cutoff).delete()
+    hot = list(hot_paths(list(repositories), settings.REPLICATION_WARM_LIMIT))
+    relative_paths = defaultdict(list)
+    for requested in hot:
+        relative_paths[repositories[requested.base_path]].append(requested.relative_path)
+
+    plugins = defaultdict(list)
+    for pk, pulp_type in Repository.objects.filter(pk__in=relative_paths).values_list(
+        "pk", "pulp_type"
+    ):
+        plugins[pulp_type.split(".")[0]].append(pk)
+
+    page_size = settings.REPLICATION_PAGE_SIZE
+    for app_label, repository_pks in plugins.items():
+        metrics = ReplicationMetrics()
+        with metrics.collect(), metrics.timer("warm"):
+            content_artifacts = [
+                content_artifact
+                for pk in repository_pks
+                for content_artifact in missing_content_artifacts(pk, relative_paths[pk])
+            ]
+            for i in range(0, len(content_artifacts), page_size):
+                warm(content_artifacts[i : i + page_size], metrics)
+        metrics.save(app_label)
+    RequestedPath.objects.filter(pk__in=[requested.pk for requested in hot]).delete()
@@ -0,0 +1,337 @@
+import json
+import os
+import ssl
+import tempfile
+import threading
+from contextlib import contextmanager
+from gettext import gettext as _
+from logging import getLogger
+from urllib.parse import urljoin
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.ssl_ import create_urllib3_context
+
+from pulpcore.cli.common.generic import PulpCLIContext
+from pulpcore.cli.common.openapi import OpenAPI
+
+log = getLogger(__name__)
+
+
+def write_cache_file(path, data):
+    """Replace a file in the cache atomically, so concurrent readers never see a partial file."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}"
+    with open(tmp_path, "wb") as tmp_file:
+        tmp_file.write(data)
+    os.replace(tmp_path, path)
+
+
+class ClientCertAdapter(HTTPAdapter):
+    """A transport adapter presenting the client certificate loaded into an SSL context."""
+
+    def __init__(self, ssl_context, **kwargs):
+        """
+        :param ssl_context: SSLContext holding the client certificate and key
+        """
+        self.ssl_context = ssl_context
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs["ssl_context"] = self.ssl_context
+        return super().init_poolmanager(*args, **kwargs)
+
+    def proxy_manager_for(self, *args, **kwargs):
+        kwargs["ssl_context"] = self.ssl_context
+        return super().proxy_manager_for(*args, **kwargs)
+
+
+def client_cert_context(server):
+    """
+    Return an SSL context holding the client certificate and key of a server, or None.
+
+    The key is only written to a private temporary directory while it is loaded, it is kept in
+    memory afterwards.
+    """
+    if not server.client_cert or not server.client_key:
+        return None
+    context = create_urllib3_context(
+        cert_reqs=ssl.CERT_REQUIRED if server.tls_validation else ssl.CERT_NONE
+    )
+    if server.tls_validation and not server.ca_cert:
+        # requests doesn't pass its CA bundle to connections using their own SSL context
+        context.load_verify_locations(requests.certs.where())
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cert_path = os.path.join(tmp_dir, "client_cert.pem")
+        key_path = os.path.join(tmp_dir, "client_key.pem")
+        for path, data in ((cert_path, server.client_cert), (key_path, server.client_key)):
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            with os.fdopen(fd, "w") as pem_file:
+                pem_file.write(data)
+        context.load_cert_chain(cert_path, key_path)
+    return context
+
+
+def get_tls_settings(server):
+    """
+    Return the `verify` setting of requests and the client certificate context of a server.
+
+    The CA certificate of the server is written to its cache directory when it changed, as
+    requests only accepts it as a file.
+    """
+    verify = server.tls_validation
+    if verify and server.ca_cert:
+        verify = os.path.join(server.cache_dir, "ca_cert.pem")
+        try:
+            with open(verify) as ca_file:
+                written = ca_file.read() == server.ca_cert
+        except OSError:
+            written = False
+        if not written:
+            write_cache_file(verify, server.ca_cert.encode())
+    return verify, client_cert_context(server)
+
+
+def configure_tls(session, verify, ssl_context):
+    """Apply the TLS settings returned by `get_tls_settings` to a requests session."""
+    session.verify = verify
+    if ssl_context is not None:
+        session.mount("https://", ClientCertAdapter(ssl_context))
+
+
+def get_component_versions(server, tls_settings=None):
+    """
+    Return the versions of the components installed on an upstream server.
+
+    Returns None if the status of the server cannot be retrieved.
+    """
+    url = urljoin(server.base_url, f"{server.api_root}api/v3/status/")
+    try:
+        with requests.Session() as session:
+            configure_tls(session, *(tls_settings or get_tls_settings(server)))
+            response = session.get(url, timeout=30)
+        response.raise_for_status()
+        versions = response.json()["versions"]
+    except (requests.RequestException, ValueError, KeyError) as e:
+        log.warning(_("Failed to get the status of {url}: {error}").format(url=url, error=e))
+        return None
+    return sorted(f"{version['component']}=={version['version']}" for version in versions)
+
+
+@contextmanager
+def schema_cache(server, tls_settings=None):
+    """
+    Cache the OpenAPI schema of an upstream server on disk until its component versions change.
+
+    Yields whether the cached schema is stale and needs to be downloaded again. The component
+    versions are only recorded once the block succeeded.
+    """
+    cache_dir = server.cache_dir
+    versions_path = os.path.join(cache_dir, "versions.json")
+    try:
+        with open(versions_path) as versions_file:
+            cached_versions = json.load(versions_file)
+    except (OSError, ValueError):
+        cached_versions = None
+    versions = get_component_versions(server, tls_settings)
+
+    yield versions is None or versions != cached_versions
+
+    if versions is not None and versions != cached_versions:
+        write_cache_file(versions_path, json.dumps(versions).encode())
+
+
+class UpstreamOpenAPI(OpenAPI):
+    """
+    The OpenAPI of an upstream server, with its schema cached in the directory of the server.
+
+    pulp-glue caches schemas under XDG_CACHE_HOME, which is global to the process. The session
+    also gets the TLS settings of the server before the schema is downloaded.
+    """
+
+    def __init__(self, *args, cache_path, verify=True, ssl_context=None, **kwargs):
+        """
+        :param cache_path: File the schema is cached in
+        :param verify: The `verify` setting of the requests session
+        :param ssl_context: SSLContext holding the client certificate, if any
+        """
+        self.cache_path = cache_path
+        self.verify = verify
+        self.ssl_context = ssl_context
+        super().__init__(*args, **kwargs)
+
+    def load_api(self, refresh_cache=False):
+        configure_tls(self._session, self.verify, self.ssl_context)
+        if not refresh_cache:
+            try:
+                with open(self.cache_path, "rb") as cache_file:
+                    self._parse_api(cache_file.read())
+                return
+            except Exception:
+                # A missing or invalid schema is downloaded again
+                pass
+        data = self._download_api()
+        self._parse_api(data)
+        write_cache_file(self.cache_path, data)
+
+
+class SessionAuth(requests.auth.AuthBase):
+    """
+    Authenticate API calls with a Django session of the upstream server instead of basic auth.
+
+    With basic auth the upstream runs its deliberately slow password hasher for every call. The
+    session is obtained by logging in once, and renewed when the upstream stops accepting it.
+    """
+
+    def __init__(self, server, session):
+        """
+        :param server: Server to authenticate against
+        :param session: requests.Session used for the API calls
+        """
+        self.server = server
+        self.session = session
+        self.login_url = urljoin(server.base_url, "/auth/login/")
+        self.session_id = None
+        self.lock = threading.Lock()
+
+    def _login(self):
+        with requests.Session() as session:
+            session.headers.update(self.session.headers)
+            session.verify = self.session.verify
+            adapter = self.session.get_adapter(self.login_url)
+            if isinstance(adapter, ClientCertAdapter):
+                session.mount("https://", ClientCertAdapter(adapter.ssl_context))
+            session.proxies = self.session.proxies
+            session.get(self.login_url, timeout=30).raise_for_status()
+            response = session.post(
+                self.login_url,
+                data={
+                    "username": self.server.username,
+                    "password": self.server.password,
+                    "csrfmiddlewaretoken": session.cookies.get("csrftoken"),
+                },
+                headers={"Referer": self.login_url},
+                allow_redirects=False,
+                timeout=30,
+            )
+            response.raise_for_status()
+            session_id = session.cookies.get("sessionid")
+        if not session_id:
+            raise requests.HTTPError(_("Login did not return a session."), response=response)
+        return session_id
+
+    def login(self, expired_session_id=None):
+        """Log in, unless another thread already replaced the expired session."""
+        with self.lock:
+            if self.session_id is None or self.session_id == expired_session_id:
+                self.session_id = self._login()
+            return self.session_id
+
+    @staticmethod
+    def session_rejected(response):
+        """
+        Check whether a response rejected the session, rather than denying a permission.
+
+        DRF answers requests whose session it doesn't accept as if they were anonymous, with a 401
+        or a 403 saying that no credentials were provided.
+        """
+        if response.status_code == 401:
+            return True
+        if response.status_code != 403:
+            return False
+        try:
+            detail = response.json().get("detail")
+        except (ValueError, AttributeError):
+            return False
+        return detail == "Authentication credentials were not provided."
+
+    def renew_expired_session(self, response, **kwargs):
+        """Log in again and retry the request once if the session was rejected."""
+        if not self.session_rejected(response):
+            return response
+        rejected_session_id = response.request.headers.get("Cookie", "").partition("sessionid=")[2]
+        try:
+            # Only the first rejection of a session logs in, the others reuse the new session
+            session_id = self.login(expired_session_id=rejected_session_id)
+        except requests.RequestException:
+            return response
+        if session_id == rejected_session_id:
+            return response
+
+        # Consume the rejected response so its connection can be reused
+        response.content
+        response.close()
+        request = response.request.copy()
+        request.headers["Cookie"] = f"sessionid={session_id}"
+        retry = response.connection.send(request, **kwargs)
+        retry.history.append(response)
+        retry.request = request
+        return retry
+
+    def __call__(self, request):
+        request.headers["Cookie"] = f"sessionid={self.session_id}"
+        request.register_hook("response", self.renew_expired_session)
+        return request
+
+
+def upstream_session(pulp_ctx):
+    """Return the requests session a pulp-glue context calls the upstream API with."""
+    # pulp-glue does not expose its requests session
+    return pulp_ctx.api._session
+
+
+def use_session_auth(server, pulp_ctx):
+    """
+    Make all API calls of `pulp_ctx` reuse one upstream session instead of basic auth.
+
+    Basic auth is kept if the upstream does not allow logging in.
+    """
+    session = upstream_session(pulp_ctx)
+    auth = SessionAuth(server, session)
+    try:
+        auth.login()
+    except requests.RequestException as e:
+        log.warning(
+            _("Failed to log in to {url}, using basic auth: {error}").format(
+                url=auth.login_url, error=e
+            )
+        )
+        return
+    session.auth = auth
+
+
+def get_pulp_ctx(server):
+    """
+    Return a context for calling the API of an upstream server.
+
+    The API schema is loaded from the on-disk cache of the server unless the upstream component
+    versions changed since it was downloaded. Calls are authenticated with a session of the
+    upstream server, if it has credentials.
+    """
+    api_kwargs = dict(
+        base_url=server.base_url,
+        username=server.username,
+        password=server.password,
+        user_agent="pulpcore-3.22",
+    )
+    verify, ssl_context = get_tls_settings(server)
+    with schema_cache(server, (verify, ssl_context)) as refresh_cache:
+        pulp_ctx = PulpCLIContext(
+            api_root=server.api_root,
+            api_kwargs=api_kwargs,
+            format="json",
+            background_tasks=False,
+            timeout=0,
+        )
+        # pulp-glue does not let the OpenAPI class be replaced
+        pulp_ctx._api = UpstreamOpenAPI(
+            doc_path=f"{server.api_root}api/v3/docs/api.json",
+            cache_path=os.path.join(server.cache_dir, "api.json"),
+            verify=verify,
+            ssl_context=ssl_context,
+            refresh_cache=refresh_cache,
+            **api_kwargs,
+        )
+    if server.username and server.password:
+        use_session_auth(server, pulp_ctx)
+    return pulp_ctx
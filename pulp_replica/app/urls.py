@@ -0,0 +1,12 @@
+from django.conf import settings
+from django.urls import path
+
+from .views import ReplicationFeedView
+
+urlpatterns = [
+    path(
+        f"{settings.V3_API_ROOT_NO_FRONT_SLASH}replica/feed/",
+        ReplicationFeedView.as_view(),
+        name="replica-feed",
+    ),
+]
@@ -0,0 +1,71 @@
+from django.db.models import Aggregate, FloatField
+from django.utils import timezone
+
+from pulpcore.plugin.constants import TASK_STATES
+from pulpcore.plugin.models import Task
+
+
+def update_fields(instance, fields):
+    """
+    Set `fields` on a model instance without saving it.
+
+    Returns the names of the fields whose value actually changed.
+    """
+    changed = [name for name, value in fields.items() if getattr(instance, name) != value]
+    for name in changed:
+        setattr(instance, name, fields[name])
+    return changed
+
+
+def bulk_update_fields(model, changes):
+    """
+    Save a list of (instance, changed_fields) pairs using a single bulk update.
+
+    Instances without changed fields are skipped. Returns the number of updated instances.
+    """
+    instances = [instance for instance, changed in changes if changed]
+    if not instances:
+        return 0
+    field_names = {
+        model._meta.get_field(name).name for instance, changed in changes for name in changed
+    }
+    # bulk_update() doesn't touch auto_now fields
+    now = timezone.now()
+    for instance in instances:
+        instance.pulp_last_updated = now
+    model.objects.bulk_update(instances, [*field_names, "pulp_last_updated"])
+    return len(instances)
+
+
+def locked_resources(resources):
+    """
+    Return the resources among `resources` that waiting or running tasks hold or wait for.
+
+    Uses a single query, whether the tasks reserve the resources exclusively or shared.
+    """
+    resources = set(resources)
+    if not resources:
+        return set()
+    records = Task.objects.filter(
+        state__in=[TASK_STATES.WAITING, TASK_STATES.RUNNING],
+        reserved_resources_record__overlap=[
+            *resources,
+            *(f"shared:{resource}" for resource in resources),
+        ],
+    ).values_list("reserved_resources_record", flat=True)
+    locked = set()
+    for record in records:
+        locked.update(resource.split("shared:", 1)[-1] for resource in record)
+    return locked & resources
+
+
+class Percentile(Aggregate):
+    """The continuous `percentile`, between 0 and 1, of an expression."""
+
+    function = "PERCENTILE_CONT"
+    name = "Percentile"
+    output_field = FloatField()
+    template = "%(function)s(%(percentile)s) WITHIN GROUP (ORDER BY %(expressions)s)"
+
+    def __init__(self, expression, percentile, **extra):
+        super().__init__(expression, percentile=float(percentile), **extra)
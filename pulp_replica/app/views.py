@@ -0,0 +1,150 @@
+import json
+from collections import defaultdict
+from functools import lru_cache
+from gettext import gettext as _
+from itertools import islice
+
+from django.apps import apps
+from django.conf import settings
+from django.db.models import Max
+from django.http import StreamingHttpResponse
+from drf_spectacular.utils import extend_schema
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.views import APIView
+
+from pulpcore.plugin.models import Distribution, Publication, Repository, RepositoryVersion
+from pulpcore.plugin.util import get_objects_for_user, get_url
+
+
+@lru_cache(maxsize=None)
+def detail_models(master_model):
+    """Return the installed detail models of a master model, keyed by pulp_type."""
+    return {
+        model.get_pulp_type(): model
+        for model in apps.get_models()
+        if issubclass(model, master_model) and model is not master_model
+    }
+
+
+def detail_instances(master_model, pks, select_related=()):
+    """Return the detail instances of a master model, keyed by pk, with one query per type."""
+    pks_by_type = defaultdict(list)
+    for pk, pulp_type in master_model.objects.filter(pk__in=pks).values_list("pk", "pulp_type"):
+        pks_by_type[pulp_type].append(pk)
+    models = detail_models(master_model)
+    instances = {}
+    for pulp_type, type_pks in pks_by_type.items():
+        queryset = models[pulp_type].objects.filter(pk__in=type_pks).select_related(*select_related)
+        instances.update((instance.pk, instance) for instance in queryset)
+    return instances
+
+
+def base_url(base_path):
+    """Return the URL a distribution serves its content at, like the distribution serializers."""
+    origin = settings.CONTENT_ORIGIN.strip("/")
+    prefix = settings.CONTENT_PATH_PREFIX.strip("/")
+    return f"{origin}/{prefix}/{base_path.strip('/')}/"
+
+
+def feed_entries(distributions):
+    """
+    Return the replication feed entries of a batch of distributions.
+
+    Their repositories, publications and latest repository versions are looked up with a few
+    queries for the whole batch.
+    """
+    publications = detail_instances(
+        Publication,
+        [distro.publication_id for distro in distributions if distro.publication_id],
+        select_related=["repository_version"],
+    )
+    repository_pks = {distro.repository_id for distro in distributions if distro.repository_id}
+    repository_pks.update(
+        publication.repository_version.repository_id for publication in publications.values()
+    )
+    repositories = detail_instances(Repository, repository_pks)
+    latest_versions = dict(
+        RepositoryVersion.objects.filter(repository__in=repository_pks, complete=True)
+        .values("repository")
+        .annotate(number=Max("number"))
+        .values_list("repository", "number")
+    )
+
+    entries = []
+    for distro in distributions:
+        entry = {
+            "pulp_href": get_url(distro),
+            "pulp_type": distro.pulp_type,
+            "pulp_last_updated": distro.pulp_last_updated.isoformat(),
+            "name": distro.name,
+            "base_path": distro.base_path,
+            "base_url": base_url(distro.base_path),
+            "repository": None,
+            "publication": None,
+            "latest_version_href": None,
+            "manifest": None,
+        }
+        if distro.repository_id in repositories:
+            repository = repositories[distro.repository_id]
+            version = latest_versions.get(repository.pk)
+            entry["repository"] = get_url(repository)
+            entry["manifest"] = getattr(repository, "manifest", None)
+        elif distro.publication_id in publications:
+            publication = publications[distro.publication_id]
+            repository = repositories[publication.repository_version.repository_id]
+            version = publication.repository_version.number
+            entry["publication"] = get_url(publication)
+            entry["manifest"] = getattr(publication, "manifest", None)
+        else:
+            version = None
+        if version is not None:
+            entry["latest_version_href"] = f"{get_url(repository)}versions/{version}/"
+        entries.append(entry)
+    return entries
+
+
+class ReplicationFeedView(APIView):
+    """
+    Streams every distribution with what a replica needs to replicate it, as NDJSON.
+
+    Every line holds the name, base_path, base_url, pulp_type, repository or publication href,
+    the href of the repository version being served as "latest_version_href", and the manifest of
+    the repository or publication if it has one. This replaces the list call per plugin type and
+    the repository or publication call per distribution a replica would otherwise make.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(exclude=True)
+    def get(self, request):
+        models = detail_models(Distribution)
+        pulp_type = request.query_params.get("pulp_type")
+        if pulp_type is not None and pulp_type not in models:
+            raise ValidationError(
+                {"pulp_type": _("Unknown distribution type: {}").format(pulp_type)}
+            )
+
+        querysets = []
+        for model_type, model in sorted(models.items()):
+            if pulp_type in (None, model_type):
+                meta = model._meta
+                querysets.append(
+                    get_objects_for_user(
+                        request.user,
+                        f"{meta.app_label}.view_{meta.model_name}",
+                        model.objects.order_by("pk"),
+                    )
+                )
+
+        def lines():
+            for queryset in querysets:
+                distributions = queryset.iterator(chunk_size=settings.REPLICATION_PAGE_SIZE)
+                while True:
+                    batch = list(islice(distributions, settings.REPLICATION_PAGE_SIZE))
+                    if not batch:
+                        break
+                    for entry in feed_entries(batch):
+                        yield json.dumps(entry) + "\n"
+
+        return StreamingHttpResponse(lines(), content_type="application/x-ndjson")
@@ -4,15 +4,27 @@ Check `Plugin Writer's Guide`_ for more details.
 .. _Plugin Writer's Guide:
     https://docs.pulpproject.org/pulpcore/plugins/plugin-writer/index.html
 """
+
 from . import models, serializers, tasks
+from .tasks.replication import get_replicated_plugins, replication_locks
+from .utils import Percentile
 
+from django.db.models import Count, Max, Q, Sum
 from drf_spectacular.utils import extend_schema
 from rest_framework import mixins
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 
+from pulpcore.app.viewsets.base import DATETIME_FILTER_OPTIONS
+from pulpcore.plugin.constants import TASK_STATES
 from pulpcore.plugin.models import TaskGroup
 from pulpcore.plugin.serializers import AsyncOperationResponseSerializer
-from pulpcore.plugin.viewsets import NamedModelViewSet, OperationPostponedResponse
+from pulpcore.plugin.viewsets import (
+    NAME_FILTER_OPTIONS,
+    BaseFilterSet,
+    NamedModelViewSet,
+    OperationPostponedResponse,
+)
 from pulpcore.tasking.tasks import dispatch
 
 
@@ -25,11 +37,42 @@ class ServerViewSet(
 ):
     queryset = models.Server.objects.all()
     endpoint_name = "servers"
+    router_lookup = "server"
     serializer_class = serializers.ServerSerializer
     ordering = "-pulp_created"
 
+    @extend_schema(
+        description="Trigger an asynchronous update task",
+        responses={202: AsyncOperationResponseSerializer},
+    )
+    def update(self, request, pk, **kwargs):
+        """
+        Dispatches a task updating the server once the tasks reserving it are finished.
+        """
+        partial = kwargs.pop("partial", False)
+        server = self.get_object()
+        serializer = self.get_serializer(server, data=request.data, partial=partial)
+        serializer.is_valid(raise_exception=True)
+
+        task = dispatch(
+            tasks.update_server,
+            exclusive_resources=[server],
+            kwargs={"server_pk": pk, "data": request.data, "partial": partial},
+        )
+
+        return OperationPostponedResponse(task, request)
+
+    @extend_schema(
+        description="Trigger an asynchronous partial update task",
+        responses={202: AsyncOperationResponseSerializer},
+    )
+    def partial_update(self, request, *args, **kwargs):
+        kwargs["partial"] = True
+        return self.update(request, *args, **kwargs)
+
     @extend_schema(
         description="Trigger an asynchronous repository replication task group.",
+        request=serializers.ReplicateSerializer,
         responses={202: AsyncOperationResponseSerializer},
     )
     @action(detail=True, methods=["post"])
@@ -38,13 +81,159 @@ class ServerViewSet(
         Triggers an asynchronous repository replication operation.
         """
         server = models.Server.objects.get(pk=pk)
+        serializer = serializers.ReplicateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
         task_group = TaskGroup.objects.create(description=f"Replication of {server.name}")
 
         task = dispatch(
             tasks.replicate_distributions,
-            exclusive_resources=["/pulp/api/v3/servers/"],
-            kwargs={"server_pk": pk},
+            exclusive_resources=[server],
+            kwargs={
+                "server_pk": pk,
+                "force": serializer.validated_data["force"],
+                "resume": serializer.validated_data["resume"],
+            },
             task_group=task_group,
         )
 
         return OperationPostponedResponse(task, request)
+
+    @extend_schema(
+        description="Trigger an asynchronous download of the most requested content replicated "
+        "with the on_demand policy.",
+        request=None,
+        responses={202: AsyncOperationResponseSerializer},
+    )
+    @action(detail=True, methods=["post"])
+    def warm(self, request, pk):
+        """
+        Downloads the artifacts of the most requested content the remotes didn't download yet.
+        """
+        server = models.Server.objects.get(pk=pk)
+
+        task = dispatch(
+            tasks.warm_cache,
+            exclusive_resources=[server],
+            kwargs={"server_pk": pk},
+        )
+
+        return OperationPostponedResponse(task, request)
+
+    @extend_schema(
+        description="Trigger an asynchronous task computing what a replication would do, without "
+        "changing anything.",
+        request=serializers.ReplicationPlanOptionsSerializer,
+        responses={202: AsyncOperationResponseSerializer},
+    )
+    @action(detail=True, methods=["post"])
+    def plan(self, request, pk):
+        """
+        Lists the changes a replication would make and the syncs it would dispatch.
+        """
+        server = models.Server.objects.get(pk=pk)
+        serializer = serializers.ReplicationPlanOptionsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        # The plan only reads the replicas. It waits for the reconcile tasks of replications of
+        # the server that are running, but not for the syncs they dispatched.
+        task = dispatch(
+            tasks.plan_replication,
+            exclusive_resources=[
+                replication_locks(server, app_label)[1]
+                for app_label in get_replicated_plugins(server)
+            ],
+            shared_resources=[server],
+            kwargs={
+                "server_pk": pk,
+                "force": serializer.validated_data["force"],
+                "full_diff": serializer.validated_data["full_diff"],
+            },
+        )
+
+        return OperationPostponedResponse(task, request)
+
+
+class ReplicationPlanViewSet(
+    NamedModelViewSet,
+    mixins.RetrieveModelMixin,
+    mixins.ListModelMixin,
+):
+    """
+    The plan of what replicating a server would do, computed by its plan task.
+    """
+
+    queryset = models.ReplicationPlan.objects.all()
+    endpoint_name = "plans"
+    serializer_class = serializers.ReplicationPlanSerializer
+    parent_viewset = ServerViewSet
+    parent_lookup_kwargs = {"server_pk": "server__pk"}
+    ordering = "-pulp_created"
+
+
+class ReplicationRecordFilter(BaseFilterSet):
+    class Meta:
+        model = models.ReplicationRecord
+        fields = {
+            "name": NAME_FILTER_OPTIONS,
+            "plugin": ["exact", "in"],
+            "result": ["exact", "in"],
+            "delta": ["exact"],
+            "started": DATETIME_FILTER_OPTIONS,
+            "duration": ["gt", "gte", "lt", "lte"],
+            "bytes_downloaded": ["gt", "gte", "lt", "lte"],
+        }
+
+
+class ReplicationRecordViewSet(
+    NamedModelViewSet,
+    mixins.RetrieveModelMixin,
+    mixins.ListModelMixin,
+):
+    """
+    The history of the syncs of the distributions replicated from a server.
+    """
+
+    queryset = models.ReplicationRecord.objects.all()
+    endpoint_name = "history"
+    serializer_class = serializers.ReplicationRecordSerializer
+    filterset_class = ReplicationRecordFilter
+    parent_viewset = ServerViewSet
+    parent_lookup_kwargs = {"server_pk": "server__pk"}
+    ordering = "-started"
+
+    @extend_schema(
+        description="Aggregate the duration and downloads of the syncs in the history.",
+        parameters=[serializers.ReplicationStatsOptionsSerializer],
+        filters=True,
+        responses={200: serializers.ReplicationStatsSerializer(many=True)},
+    )
+    @action(detail=False, methods=["get"])
+    def stats(self, request, server_pk):
+        """
+        Computes the duration percentiles and total downloads of the filtered syncs.
+        """
+        options = serializers.ReplicationStatsOptionsSerializer(data=request.query_params)
+        options.is_valid(raise_exception=True)
+        params = request.query_params.copy()
+        params.pop("group_by", None)
+        filterset = ReplicationRecordFilter(params, queryset=self.get_queryset(), request=request)
+        if not filterset.is_valid():
+            raise ValidationError(filterset.errors)
+
+        stats = (
+            filterset.qs.order_by()
+            .values(options.validated_data["group_by"])
+            .annotate(
+                count=Count("pk"),
+                failed=Count("pk", filter=Q(result=TASK_STATES.FAILED)),
+                duration_p50=Percentile("duration", 0.5),
+                duration_p95=Percentile("duration", 0.95),
+                duration_max=Max("duration"),
+                bytes_downloaded=Sum("bytes_downloaded"),
+                artifacts_added=Sum("artifacts_added"),
+            )
+            .order_by("-duration_p95")
+        )
+        page = self.paginate_queryset(stats)
+        serializer = serializers.ReplicationStatsSerializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
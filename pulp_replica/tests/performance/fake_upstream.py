@@ -0,0 +1,272 @@
+"""
+A stub of the upstream Pulp REST API the replication benchmarks replicate from.
+
+It serves the OpenAPI schema, status, distributions, repositories and publications the replicators
+use, for a configurable number of file and RPM distributions, with a configurable latency per
+request. Half of the distributions serve a publication, the other half a repository.
+
+Run it with `python -m pulp_replica.tests.performance.fake_upstream --distributions 1000`. It
+prints the port it listens on, and the number of requests it served at `/fake/requests/`.
+"""
+
+import argparse
+import itertools
+import json
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+API_ROOT = "/pulp/"
+API = f"{API_ROOT}api/v3/"
+PLUGINS = {"file": "1.12.0", "rpm": "3.19.0"}
+LIST_FILTERS = {
+    "limit": {"type": "integer"},
+    "offset": {"type": "integer"},
+    "ordering": {"type": "array", "items": {"type": "string"}},
+    "name": {"type": "string"},
+    "name__in": {"type": "array", "items": {"type": "string"}},
+    "name__startswith": {"type": "string"},
+    "base_path__in": {"type": "array", "items": {"type": "string"}},
+    "base_path__contains": {"type": "string"},
+    "pulp_label_select": {"type": "string"},
+    "pulp_last_updated__gte": {"type": "string", "format": "date-time"},
+}
+
+
+def api_schema():
+    """Return an OpenAPI schema with the operations the replicators call."""
+    paths = {}
+    for plugin, kind in itertools.product(
+        PLUGINS, ("distributions", "repositories", "publications", "remotes")
+    ):
+        prefix = f"{kind}_{plugin}_{plugin}"
+        href = f"{plugin}_{plugin}_{kind[:-1] if kind != 'repositories' else 'repository'}_href"
+        paths[f"{API}{kind}/{plugin}/{plugin}/"] = {
+            "get": {
+                "operationId": f"{prefix}_list",
+                "parameters": [
+                    dict(
+                        name=name,
+                        schema=schema,
+                        **{"in": "query"},
+                        **(
+                            {"style": "form", "explode": False} if schema["type"] == "array" else {}
+                        ),
+                    )
+                    for name, schema in LIST_FILTERS.items()
+                ],
+                "responses": {"200": {"description": ""}},
+            }
+        }
+        paths[f"{{{href}}}"] = {
+            "get": {
+                "operationId": f"{prefix}_read",
+                "parameters": [
+                    {"name": href, "in": "path", "required": True, "schema": {"type": "string"}}
+                ],
+                "responses": {"200": {"description": ""}},
+            }
+        }
+    return {
+        "openapi": "3.0.3",
+        "info": {
+            "title": "Pulp 3 API",
+            "version": "v3",
+            "x-pulp-app-versions": dict(core="3.22.0", **PLUGINS),
+        },
+        "paths": paths,
+        "components": {},
+    }
+
+
+class Upstream:
+    """The entities served by the fake upstream, keyed by plugin and kind."""
+
+    def __init__(self, base_url, distributions, plugins, prefix=""):
+        self.entities = {}
+        self.by_href = {}
+        updated = datetime(2022, 1, 1, tzinfo=timezone.utc)
+        for plugin in plugins:
+            distros, repositories, publications = [], [], []
+            for i in range(distributions):
+                updated += timedelta(seconds=1)
+                name = f"{prefix}{plugin}-{i}"
+                repository_href = f"{API}repositories/{plugin}/{plugin}/{uuid.uuid4()}/"
+                repository = {
+                    "pulp_href": repository_href,
+                    "name": name,
+                    "latest_version_href": f"{repository_href}versions/1/",
+                    "manifest": "PULP_MANIFEST",
+                    "pulp_last_updated": updated.isoformat(),
+                }
+                repositories.append(repository)
+                distro = {
+                    "pulp_href": f"{API}distributions/{plugin}/{plugin}/{uuid.uuid4()}/",
+                    "name": name,
+                    "base_path": f"{prefix}{plugin}/{i}",
+                    "base_url": f"{base_url}pulp/content/{prefix}{plugin}/{i}/",
+                    "pulp_labels": {},
+                    "repository": None,
+                    "publication": None,
+                    "pulp_last_updated": updated.isoformat(),
+                }
+                if i % 2:
+                    distro["repository"] = repository_href
+                else:
+                    publication = {
+                        "pulp_href": f"{API}publications/{plugin}/{plugin}/{uuid.uuid4()}/",
+                        "repository": repository_href,
+                        "repository_version": repository["latest_version_href"],
+                        "manifest": "PULP_MANIFEST",
+                    }
+                    publications.append(publication)
+                    distro["publication"] = publication["pulp_href"]
+                distros.append(distro)
+            for kind, entities in (
+                ("distributions", distros),
+                ("repositories", repositories),
+                ("publications", publications),
+                ("remotes", []),
+            ):
+                self.entities[f"{API}{kind}/{plugin}/{plugin}/"] = entities
+                self.by_href.update((entity["pulp_href"], entity) for entity in entities)
+
+    def list(self, path, query):
+        """Return a page of the entities listed at `path`, filtered like Pulp does."""
+        entities = self.entities[path]
+        values = {name: ",".join(value).split(",") for name, value in query.items()}
+        if "name__in" in values:
+            names = set(values["name__in"])
+            entities = [entity for entity in entities if entity["name"] in names]
+        if "name" in query:
+            entities = [entity for entity in entities if entity["name"] == query["name"][0]]
+        if "name__startswith" in query:
+            prefix = query["name__startswith"][0]
+            entities = [entity for entity in entities if entity["name"].startswith(prefix)]
+        if "base_path__in" in values:
+            base_paths = set(values["base_path__in"])
+            entities = [entity for entity in entities if entity["base_path"] in base_paths]
+        if "base_path__contains" in query:
+            part = query["base_path__contains"][0]
+            entities = [entity for entity in entities if part in entity["base_path"]]
+        if "pulp_last_updated__gte" in query:
+            since = datetime.fromisoformat(
+                query["pulp_last_updated__gte"][0].replace("Z", "+00:00")
+            )
+            entities = [
+                entity
+                for entity in entities
+                if datetime.fromisoformat(entity["pulp_last_updated"]) >= since
+            ]
+        if "-pulp_last_updated" in values.get("ordering", []):
+            entities = sorted(
+                entities, key=lambda entity: entity["pulp_last_updated"], reverse=True
+            )
+
+        offset = int(query.get("offset", ["0"])[0])
+        limit = int(query.get("limit", ["100"])[0])
+        more = offset + limit < len(entities)
+        return {
+            "count": len(entities),
+            "next": f"{path}?offset={offset + limit}&limit={limit}" if more else None,
+            "previous": None,
+            "results": entities[offset : offset + limit],
+        }
+
+
+def make_handler(upstream, latency):
+    """Return a request handler class serving `upstream` after `latency` seconds."""
+    schema = json.dumps(api_schema()).encode()
+    status = json.dumps(
+        {
+            "versions": [
+                {"component": component, "version": version}
+                for component, version in dict(core="3.22.0", **PLUGINS).items()
+            ]
+        }
+    ).encode()
+    counter = itertools.count(1)
+    requests = {"count": 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def send_json(self, body, code=200):
+            if not isinstance(body, bytes):
+                body = json.dumps(body).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            if url.path == "/fake/requests/":
+                self.send_json(requests)
+                return
+
+            requests["count"] = next(counter)
+            time.sleep(latency)
+            if url.path == f"{API}docs/api.json":
+                self.send_json(schema)
+            elif url.path == f"{API}status/":
+                self.send_json(status)
+            elif url.path in upstream.entities:
+                self.send_json(upstream.list(url.path, parse_qs(url.query)))
+            elif url.path in upstream.by_href:
+                self.send_json(upstream.by_href[url.path])
+            else:
+                self.send_json({"detail": "Not found."}, code=404)
+
+    return Handler
+
+
+def serve(distributions, latency=0.0, plugins=tuple(PLUGINS), prefix="", port=0):
+    """
+    Start a fake upstream in a background thread and return the server.
+
+    :param distributions: Number of distributions served per plugin
+    :param latency: Seconds every request takes before it is answered
+    :param plugins: Plugins whose distributions are served
+    :param prefix: Prefix of the names and base paths of the distributions
+    :param port: Port to listen on, any free port by default
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), None)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/"
+    server.RequestHandlerClass = make_handler(
+        Upstream(base_url, distributions, plugins, prefix), latency
+    )
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--distributions", type=int, default=100, help="Distributions per plugin")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds per request")
+    parser.add_argument("--plugins", default=",".join(PLUGINS), help="Comma separated plugins")
+    parser.add_argument("--prefix", default="", help="Prefix of the distribution names")
+    parser.add_argument("--port", type=int, default=0)
+    args = parser.parse_args()
+    server = serve(
+        args.distributions, args.latency, args.plugins.split(","), args.prefix, args.port
+    )
+    print(server.server_address[1], flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+        sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
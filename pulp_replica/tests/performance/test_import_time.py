@@ -0,0 +1,67 @@
+"""Benchmark the startup cost of the replication tasks."""
+
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+# Runs in a fresh interpreter, so that no module is already imported by the test runner.
+BENCHMARK = """
+import json
+import sys
+import time
+
+import django
+
+django.setup()
+
+start = time.perf_counter()
+import pulp_replica.app.tasks  # noqa
+tasks_import = time.perf_counter() - start
+deferred = [
+    module
+    for module in ("pulpcore.cli.common.generic", "pulpcore.cli.file", "pulpcore.cli.rpm")
+    if module in sys.modules
+]
+
+from pulp_replica.app.replicators import get_replicator, get_replicator_labels
+
+start = time.perf_counter()
+import pulp_replica.app.upstream  # noqa
+for app_label in get_replicator_labels():
+    get_replicator(app_label)
+replicators_import = time.perf_counter() - start
+
+print(
+    json.dumps(
+        {
+            "tasks_import": tasks_import,
+            "replicators_import": replicators_import,
+            "replicators": get_replicator_labels(),
+            "imported_at_startup": deferred,
+        }
+    )
+)
+"""
+
+
+class ImportTimeTestCase(unittest.TestCase):
+    """Measure what the lazy replicator registry saves at process startup."""
+
+    def run_benchmark(self):
+        env = dict(os.environ)
+        env.setdefault("DJANGO_SETTINGS_MODULE", "pulpcore.app.settings")
+        result = subprocess.run(
+            [sys.executable, "-c", BENCHMARK], env=env, check=True, capture_output=True
+        )
+        return json.loads(result.stdout.decode().splitlines()[-1])
+
+    def test_replicators_are_imported_lazily(self):
+        """Importing the tasks must not import pulp-glue or any replicator."""
+        timings = self.run_benchmark()
+        print(
+            "pulp_replica.app.tasks import: {tasks_import:.3f}s, deferred replicator imports "
+            "({replicators}): {replicators_import:.3f}s".format(**timings)
+        )
+        self.assertEqual(timings["imported_at_startup"], [])
@@ -0,0 +1,221 @@
+"""
+Benchmark replications of growing numbers of upstream distributions.
+
+The upstream is a fake Pulp API running in a subprocess, see `fake_upstream`. The tasks
+dispatched by the replication run inline, except for the syncs, which would download from the
+fake upstream. They are recorded as if they succeeded instead, so that a second replication finds
+the replica up to date. Peak memory is measured with tracemalloc, which also slows down the
+replication, so wall times are only comparable between runs of this benchmark.
+
+Besides recording the measurements, the benchmark checks that a replication makes at most one
+upstream request per distribution plus one per page, that the database queries grow linearly
+with the distributions, and that replicating again without upstream changes dispatches no syncs
+and makes a constant number of upstream requests.
+
+REPLICA_BENCHMARK_SIZES: Comma separated numbers of distributions per plugin (100,1000,10000)
+REPLICA_BENCHMARK_LATENCY: Seconds every upstream request takes (0.005)
+REPLICA_BENCHMARK_RESULTS: JSON file the results are written to (replication-benchmark.json)
+"""
+
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+
+import requests
+from django.conf import settings
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.utils.module_loading import import_string
+
+from pulp_replica.app import tasks
+from pulp_replica.app.models import ReplicatedRepository, Server
+from pulp_replica.app.replicators import get_replicator, get_replicator_labels
+
+from pulpcore.plugin.constants import TASK_STATES
+from pulpcore.plugin.models import Task, TaskGroup
+from pulpcore.plugin.tasking import dispatch
+
+SIZES = [int(size) for size in os.getenv("REPLICA_BENCHMARK_SIZES", "100,1000,10000").split(",")]
+LATENCY = float(os.getenv("REPLICA_BENCHMARK_LATENCY", "0.005"))
+RESULTS = os.getenv("REPLICA_BENCHMARK_RESULTS", "replication-benchmark.json")
+SKIPPED_TASKS = {
+    f"{task.__module__}.{task.__name__}" for task in (tasks.synchronize, tasks.synchronize_changes)
+}
+# Upstream requests a replication of one plugin makes besides listing the distributions and looking
+# up their repositories and publications, e.g. for the API schema, the status and the feed
+OVERHEAD_REQUESTS = 20
+
+
+def available_plugins():
+    """Return the labels of the replicators whose plugin is installed."""
+    plugins = []
+    for app_label in get_replicator_labels():
+        try:
+            get_replicator(app_label)
+        except ImportError:
+            continue
+        plugins.append(app_label)
+    return plugins
+
+
+def run_dispatched_tasks(task_group):
+    """
+    Run the waiting tasks of a task group inline, until it dispatched all its tasks.
+
+    The syncs are skipped, recording the upstream content of the repository like a sync does.
+    """
+    names = Counter()
+    while True:
+        waiting = list(
+            Task.objects.filter(task_group=task_group, state=TASK_STATES.WAITING).order_by(
+                "pulp_created"
+            )
+        )
+        if not waiting:
+            return names
+        for task in waiting:
+            names[task.name.rsplit(".", 1)[-1]] += 1
+            if task.name in SKIPPED_TASKS:
+                ReplicatedRepository.objects.filter(
+                    pk=task.kwargs["replicated_repository_pk"]
+                ).update(
+                    upstream_content_href=task.kwargs["upstream_content_href"],
+                    upstream_version_href=task.kwargs["upstream_version_href"],
+                )
+                Task.objects.filter(pk=task.pk).update(state=TASK_STATES.SKIPPED)
+                continue
+            os.environ["PULP_TASK_ID"] = str(task.pk)
+            try:
+                import_string(task.name)(*(task.args or []), **(task.kwargs or {}))
+            finally:
+                del os.environ["PULP_TASK_ID"]
+            Task.objects.filter(pk=task.pk).update(state=TASK_STATES.COMPLETED)
+
+
+class ReplicationScaleTestCase(TestCase):
+    """Measure the wall time, upstream requests, queries and memory of replications."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.plugins = available_plugins()
+        cls.results = []
+
+    @classmethod
+    def tearDownClass(cls):
+        with open(RESULTS, "w") as results_file:
+            json.dump(cls.results, results_file, indent=2)
+        super().tearDownClass()
+
+    def start_upstream(self, distributions, prefix):
+        upstream = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "pulp_replica.tests.performance.fake_upstream",
+                f"--distributions={distributions}",
+                f"--latency={LATENCY}",
+                f"--plugins={','.join(self.plugins)}",
+                f"--prefix={prefix}",
+            ],
+            stdout=subprocess.PIPE,
+        )
+        self.addCleanup(upstream.wait)
+        self.addCleanup(upstream.terminate)
+        return f"http://127.0.0.1:{int(upstream.stdout.readline())}/"
+
+    def replicate(self, server):
+        """Replicate a server like the replicate action does, returning the dispatched tasks."""
+        task_group = TaskGroup.objects.create(description=f"Replication of {server.name}")
+        dispatch(
+            tasks.replicate_distributions,
+            exclusive_resources=[server],
+            kwargs={"server_pk": str(server.pk), "force": False},
+            task_group=task_group,
+        )
+        return run_dispatched_tasks(task_group)
+
+    def upstream_requests(self, server):
+        return requests.get(f"{server.base_url}fake/requests/").json()["count"]
+
+    def benchmark(self, server, distributions, run):
+        """Replicate a server, returning the measurements of the replication."""
+        upstream_requests = self.upstream_requests(server)
+        queries = Counter()
+
+        def count_query(execute, sql, params, many, context):
+            queries["count"] += 1
+            return execute(sql, params, many, context)
+
+        with tempfile.TemporaryDirectory() as cache_dir, override_settings(
+            REPLICATION_CACHE_DIR=cache_dir
+        ), connection.execute_wrapper(count_query):
+            tracemalloc.start()
+            start = time.perf_counter()
+            dispatched = self.replicate(server)
+            wall_time = time.perf_counter() - start
+            peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+        result = {
+            "run": run,
+            "distributions_per_plugin": distributions,
+            "plugins": self.plugins,
+            "latency": LATENCY,
+            "wall_time": wall_time,
+            "upstream_requests": self.upstream_requests(server) - upstream_requests,
+            "db_queries": queries["count"],
+            "peak_memory": peak_memory,
+            "dispatched_tasks": dict(dispatched),
+        }
+        self.results.append(result)
+        print(json.dumps(result))
+        return result
+
+    def max_upstream_requests(self, distributions):
+        """Return the upstream requests a full replication may make, one lookup per distribution."""
+        pages = math.ceil(distributions / settings.REPLICATION_PAGE_SIZE)
+        return (distributions + pages + OVERHEAD_REQUESTS) * len(self.plugins)
+
+    def test_replication_scale(self):
+        """
+        Replicate each number of distributions from an empty local Pulp, then again without
+        upstream changes.
+        """
+        if not self.plugins:
+            self.skipTest("No replicated plugin is installed.")
+        queries_per_distribution = []
+        for distributions in SIZES:
+            with self.subTest(distributions=distributions):
+                prefix = f"bench{distributions}-"
+                server = Server.objects.create(
+                    name=f"benchmark-{distributions}",
+                    base_url=self.start_upstream(distributions, prefix),
+                    api_root="/pulp/",
+                )
+                total = distributions * len(self.plugins)
+
+                first = self.benchmark(server, distributions, "initial")
+                self.assertEqual(first["dispatched_tasks"].get("synchronize"), total)
+                self.assertLessEqual(
+                    first["upstream_requests"], self.max_upstream_requests(distributions)
+                )
+                queries_per_distribution.append(first["db_queries"] / total)
+
+                second = self.benchmark(server, distributions, "unchanged")
+                for name in ("synchronize", "synchronize_changes", "update_distributions"):
+                    self.assertNotIn(name, second["dispatched_tasks"])
+                self.assertLessEqual(
+                    second["upstream_requests"], OVERHEAD_REQUESTS * len(self.plugins)
+                )
+                self.assertLess(second["db_queries"], first["db_queries"])
+
+        # The queries grow linearly with the distributions, the first size also pays the warm up
+        for queries in queries_per_distribution[1:]:
+            self.assertLessEqual(queries, queries_per_distribution[0] * 1.5)
@@ -0,0 +1,147 @@
+import os
+import unittest
+import uuid
+from types import SimpleNamespace
+from unittest import mock
+
+from django.apps import apps
+from django.test import TestCase
+
+from pulp_replica.app.metrics import COUNTERS
+from pulp_replica.app.tasks.distributing import is_up_to_date, update_distributions
+
+from pulpcore.plugin.constants import TASK_STATES
+from pulpcore.plugin.models import ProgressReport, Task
+from pulpcore.plugin.util import get_url
+
+
+def distro(repository_id=None, publication_id=None, base_path="path"):
+    return SimpleNamespace(
+        repository_id=repository_id, publication_id=publication_id, base_path=base_path
+    )
+
+
+def requested(repository_pk=None, base_path="path"):
+    return {
+        "name": "name",
+        "base_path": base_path,
+        "repository": f"/repositories/{repository_pk}/" if repository_pk else None,
+        "repository_pk": repository_pk,
+    }
+
+
+class TestIsUpToDate(TestCase):
+    """Test which local distributions already match their upstream distribution."""
+
+    def test_same_repository(self):
+        """Test that a distribution of the same repository at the same path is up to date."""
+        pk = uuid.uuid4()
+        self.assertTrue(is_up_to_date(distro(pk), requested(str(pk))))
+
+    def test_other_repository(self):
+        """Test that a distribution of another repository is not up to date."""
+        self.assertFalse(is_up_to_date(distro(uuid.uuid4()), requested(str(uuid.uuid4()))))
+        self.assertFalse(is_up_to_date(distro(), requested(str(uuid.uuid4()))))
+
+    def test_other_base_path(self):
+        """Test that a distribution at another base path is not up to date."""
+        pk = uuid.uuid4()
+        self.assertFalse(is_up_to_date(distro(pk, base_path="old"), requested(str(pk))))
+
+    def test_publication(self):
+        """Test that a distribution serving a publication is not up to date."""
+        pk = uuid.uuid4()
+        self.assertFalse(is_up_to_date(distro(pk, uuid.uuid4()), requested(str(pk))))
+
+    def test_cleared(self):
+        """Test that a distribution without content is up to date when it should be cleared."""
+        self.assertTrue(is_up_to_date(distro(), requested()))
+        self.assertFalse(is_up_to_date(distro(uuid.uuid4()), requested()))
+        self.assertFalse(is_up_to_date(distro(publication_id=uuid.uuid4()), requested()))
+
+
+@unittest.skipUnless(apps.is_installed("pulp_file.app"), "pulp_file is not installed")
+class TestUpdateDistributions(TestCase):
+    """Test the batched creation, update and clearing of the distributions of a replication."""
+
+    def setUp(self):
+        from pulp_file.app.models import FileDistribution, FileRepository
+
+        self.distribution_model = FileDistribution
+        self.repositories = [FileRepository.objects.create(name=f"repo-{i}") for i in range(2)]
+        self.task = Task.objects.create(name="update_distributions", state=TASK_STATES.RUNNING)
+        patcher = mock.patch.dict(os.environ, {"PULP_TASK_ID": str(self.task.pk)})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def distribution(self, name, repository=None, base_path=None):
+        return {
+            "name": name,
+            "base_path": base_path or name,
+            "repository": get_url(repository) if repository else None,
+            "repository_pk": str(repository.pk) if repository else None,
+        }
+
+    def update(self, *distributions):
+        """Update the distributions, returning the counts recorded on the task."""
+        ProgressReport.objects.filter(task=self.task).delete()
+        update_distributions("file", "FileDistributionSerializer", list(distributions))
+        return {
+            name: ProgressReport.objects.get(task=self.task, code=COUNTERS[name][0]).done
+            for name in (
+                "distributions_created",
+                "distributions_updated",
+                "distributions_unchanged",
+                "distributions_failed",
+            )
+        }
+
+    def assertCounts(self, counts, created=0, updated=0, unchanged=0, failed=0):
+        self.assertEqual(
+            counts,
+            {
+                "distributions_created": created,
+                "distributions_updated": updated,
+                "distributions_unchanged": unchanged,
+                "distributions_failed": failed,
+            },
+        )
+
+    def test_create_update_clear(self):
+        """Test that distributions are created, then left alone, updated and cleared."""
+        first, second = self.repositories
+        counts = self.update(self.distribution("a", first), self.distribution("b", second))
+        self.assertCounts(counts, created=2)
+        a = self.distribution_model.objects.get(name="a")
+        self.assertEqual(a.repository_id, first.pk)
+
+        counts = self.update(self.distribution("a", first), self.distribution("b", second))
+        self.assertCounts(counts, unchanged=2)
+        self.assertEqual(
+            self.distribution_model.objects.get(name="a").pulp_last_updated, a.pulp_last_updated
+        )
+
+        counts = self.update(self.distribution("a", second), self.distribution("b"))
+        self.assertCounts(counts, updated=2)
+        self.assertEqual(self.distribution_model.objects.get(name="a").repository_id, second.pk)
+        b = self.distribution_model.objects.get(name="b")
+        self.assertIsNone(b.repository_id)
+        self.assertIsNone(b.publication_id)
+
+    def test_not_created_without_content(self):
+        """Test that no distribution is created for an upstream distribution without content."""
+        counts = self.update(self.distribution("a"))
+        self.assertCounts(counts)
+        self.assertFalse(self.distribution_model.objects.filter(name="a").exists())
+
+    def test_failed(self):
+        """Test that an invalid distribution is skipped without affecting the others."""
+        first, second = self.repositories
+        counts = self.update(
+            self.distribution("a", first, base_path="shared"),
+            self.distribution("b", second, base_path="shared/nested"),
+            self.distribution("c", second),
+        )
+        self.assertCounts(counts, created=2, failed=1)
+        self.assertTrue(self.distribution_model.objects.filter(name="c").exists())
+        self.assertFalse(self.distribution_model.objects.filter(name="b").exists())
@@ -0,0 +1,92 @@
+import json
+import unittest
+
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from pulp_replica.app.views import ReplicationFeedView, base_url, feed_entries
+
+from pulpcore.plugin.util import get_url
+
+FEED_KEYS = {
+    "pulp_href",
+    "pulp_type",
+    "pulp_last_updated",
+    "name",
+    "base_path",
+    "base_url",
+    "repository",
+    "publication",
+    "latest_version_href",
+    "manifest",
+}
+
+
+@unittest.skipUnless(apps.is_installed("pulp_file.app"), "pulp_file is not installed")
+class TestReplicationFeed(TestCase):
+    """Test the entries of the replication feed and how they are streamed."""
+
+    def setUp(self):
+        from pulp_file.app.models import FileDistribution, FilePublication, FileRepository
+
+        self.repository = FileRepository.objects.create(name="repo", manifest="MANIFEST")
+        self.published = FileRepository.objects.create(name="published")
+        self.publication = FilePublication.objects.create(
+            repository_version=self.published.latest_version(),
+            manifest="PULP_MANIFEST",
+            complete=True,
+        )
+        self.distributions = [
+            FileDistribution.objects.create(name="a", base_path="a", repository=self.repository),
+            FileDistribution.objects.create(
+                name="b", base_path="nested/b", publication=self.publication
+            ),
+            FileDistribution.objects.create(name="c", base_path="c"),
+        ]
+
+    def test_entries(self):
+        """Test the entries of distributions of a repository, a publication and no content."""
+        a, b, c = feed_entries(self.distributions)
+        for entry, distribution in zip((a, b, c), self.distributions):
+            self.assertEqual(set(entry), FEED_KEYS)
+            self.assertEqual(entry["pulp_href"], get_url(distribution))
+            self.assertEqual(entry["pulp_type"], "file.file")
+            self.assertEqual(entry["name"], distribution.name)
+            self.assertEqual(entry["base_path"], distribution.base_path)
+            self.assertEqual(entry["base_url"], base_url(distribution.base_path))
+            self.assertEqual(entry["pulp_last_updated"], distribution.pulp_last_updated.isoformat())
+
+        self.assertEqual(a["repository"], get_url(self.repository))
+        self.assertIsNone(a["publication"])
+        self.assertEqual(a["latest_version_href"], f"{get_url(self.repository)}versions/0/")
+        self.assertEqual(a["manifest"], "MANIFEST")
+
+        self.assertIsNone(b["repository"])
+        self.assertEqual(b["publication"], get_url(self.publication))
+        self.assertEqual(b["latest_version_href"], f"{get_url(self.published)}versions/0/")
+        self.assertEqual(b["manifest"], "PULP_MANIFEST")
+
+        for key in ("repository", "publication", "latest_version_href", "manifest"):
+            self.assertIsNone(c[key])
+
+    def test_ndjson(self):
+        """Test that the feed streams one JSON entry per line, filtered by pulp_type."""
+        user = get_user_model().objects.create(username="admin", is_superuser=True)
+        view = ReplicationFeedView.as_view()
+
+        request = APIRequestFactory().get("/feed/", {"pulp_type": "file.file"})
+        force_authenticate(request, user=user)
+        response = view(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(
+            sorted((json.loads(line) for line in lines), key=lambda entry: entry["name"]),
+            feed_entries(self.distributions),
+        )
+
+        request = APIRequestFactory().get("/feed/", {"pulp_type": "file.unknown"})
+        force_authenticate(request, user=user)
+        self.assertEqual(view(request).status_code, 400)
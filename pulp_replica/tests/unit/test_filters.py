@@ -0,0 +1,127 @@
+import re
+
+from django.test import TestCase
+
+from pulp_replica.app.models import Server
+from pulp_replica.app.replicators.base import Replicator
+
+
+def gen_replicator(**filters):
+    """Return a replicator of a server with some filters, without an upstream."""
+    return Replicator(
+        None, None, Server(name="upstream", base_url="https://pulp.example", **filters)
+    )
+
+
+class TestUpstreamNameFilters(TestCase):
+    """Test the name filters sent to the upstream for a name_regex."""
+
+    def assertPrefix(self, name_regex, prefix):
+        parameters = gen_replicator(name_regex=name_regex).upstream_filters()
+        self.assertEqual(parameters.get("name__startswith"), prefix, name_regex)
+
+    def test_literal_prefix(self):
+        """Test that the literal prefix of an anchored expression is filtered on."""
+        self.assertPrefix("^rhel-8-.*", "rhel-8-")
+        self.assertPrefix("^foo$", "foo")
+        self.assertPrefix("^ubi/8 x", "ubi/8 x")
+
+    def test_quantified_last_character(self):
+        """Test that a quantified last character is left out of the prefix."""
+        self.assertPrefix("^foo*", "fo")
+        self.assertPrefix("^foo+", "fo")
+        self.assertPrefix("^foo?", "fo")
+        self.assertPrefix("^foo{2}", "fo")
+        self.assertPrefix("^f*", None)
+
+    def test_escaped_characters(self):
+        """Test that the prefix ends before escapes and character classes."""
+        self.assertPrefix(r"^foo\.bar", "foo")
+        self.assertPrefix(r"^foo\d+", "foo")
+        self.assertPrefix("^foo[ab]", "foo")
+        self.assertPrefix(r"^\d+", None)
+        self.assertPrefix(r"^\^foo", None)
+
+    def test_no_prefix(self):
+        """Test that expressions without a reliable prefix are not filtered on."""
+        self.assertPrefix("foo", None)
+        self.assertPrefix(".*foo", None)
+        self.assertPrefix("^a|^b", None)
+        self.assertPrefix("^foo|bar", None)
+        self.assertPrefix("^(foo|bar)", None)
+        self.assertPrefix("(?i)^foo", None)
+
+    def test_prefix_never_drops_selected_names(self):
+        """Test that every name the expression selects matches the prefix sent upstream."""
+        names = ["foo", "fo", "f", "foobar", "foo.bar", "foo1", "fooo", "bar-foo", "Foo"]
+        for name_regex in ["^foo*", "^foo?", "^foo{2}", r"^foo\.bar", "^foo$", "^fo+o"]:
+            replicator = gen_replicator(name_regex=name_regex)
+            prefix = replicator.upstream_filters().get("name__startswith", "")
+            for name in names:
+                if re.search(name_regex, name):
+                    self.assertTrue(name.startswith(prefix), (name_regex, name))
+
+    def test_label_select(self):
+        """Test that label selectors are passed to the upstream."""
+        parameters = gen_replicator(pulp_label_select="env=prod").upstream_filters()
+        self.assertEqual(parameters, {"pulp_label_select": "env=prod"})
+
+
+class TestUpstreamBasePathFilters(TestCase):
+    """Test the base_path filters sent to the upstream for base_path_filters."""
+
+    def upstream_filters(self, base_path_filters):
+        return gen_replicator(base_path_filters=base_path_filters).upstream_filters()
+
+    def test_literal_base_paths(self):
+        """Test that patterns without wildcards are filtered on exactly."""
+        self.assertEqual(
+            self.upstream_filters(["rhel/8", "ubi"]), {"base_path__in": ["rhel/8", "ubi"]}
+        )
+
+    def test_single_pattern(self):
+        """Test that the literal prefix of a single pattern is filtered on."""
+        self.assertEqual(self.upstream_filters(["rhel/8/*"]), {"base_path__contains": "rhel/8/"})
+        self.assertEqual(self.upstream_filters(["rhel/?"]), {"base_path__contains": "rhel/"})
+        self.assertEqual(self.upstream_filters(["rhel/[89]"]), {"base_path__contains": "rhel/"})
+
+    def test_no_filter(self):
+        """Test that patterns without a common literal part are not filtered on."""
+        self.assertEqual(self.upstream_filters(["*/8"]), {})
+        self.assertEqual(self.upstream_filters(["rhel/*", "ubi/*"]), {})
+        self.assertEqual(self.upstream_filters(["rhel/*", "ubi"]), {})
+
+
+class TestIsSelected(TestCase):
+    """Test the exact selection of upstream distributions."""
+
+    def assertSelected(self, replicator, name, base_path, selected=True):
+        distribution = {"name": name, "base_path": base_path}
+        self.assertEqual(replicator.is_selected(distribution), selected, distribution)
+
+    def test_no_filters(self):
+        """Test that every distribution is selected without filters."""
+        self.assertSelected(gen_replicator(), "anything", "any/path")
+
+    def test_base_path_filters(self):
+        """Test that base paths are matched as case sensitive shell patterns."""
+        replicator = gen_replicator(base_path_filters=["rhel/8/*", "ubi"])
+        self.assertSelected(replicator, "a", "rhel/8/baseos")
+        self.assertSelected(replicator, "b", "ubi")
+        self.assertSelected(replicator, "c", "ubi/8", selected=False)
+        self.assertSelected(replicator, "d", "RHEL/8/baseos", selected=False)
+        self.assertSelected(replicator, "e", "rhel/9/baseos", selected=False)
+
+    def test_name_regex(self):
+        """Test that names are searched with the expression."""
+        replicator = gen_replicator(name_regex="^rhel-[89]-")
+        self.assertSelected(replicator, "rhel-8-baseos", "a")
+        self.assertSelected(replicator, "rhel-10-baseos", "b", selected=False)
+        self.assertSelected(gen_replicator(name_regex="baseos"), "rhel-8-baseos", "c")
+
+    def test_all_filters(self):
+        """Test that a distribution must match all the filters."""
+        replicator = gen_replicator(base_path_filters=["rhel/*"], name_regex="^rhel-8")
+        self.assertSelected(replicator, "rhel-8-baseos", "rhel/8")
+        self.assertSelected(replicator, "rhel-8-baseos", "ubi/8", selected=False)
+        self.assertSelected(replicator, "rhel-9-baseos", "rhel/9", selected=False)
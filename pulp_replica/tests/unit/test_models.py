@@ -1,4 +1,9 @@
-from django.test import TestCase
+import os
+import tempfile
+
+from django.test import TestCase, override_settings
+
+from pulp_replica.app.models import Server
 
 
 class TestNothing(TestCase):
@@ -7,3 +12,20 @@ class TestNothing(TestCase):
     def test_nothing_at_all(self):
         """Test that the tests are running and that's it."""
         self.assertTrue(True)
+
+
+class TestServer(TestCase):
+    """Test the Server model."""
+
+    def test_cache_dir_removed(self):
+        """Test that the cache directory of a server is removed once the server is deleted."""
+        with tempfile.TemporaryDirectory() as cache_dir, override_settings(
+            REPLICATION_CACHE_DIR=cache_dir
+        ):
+            server = Server.objects.create(name="upstream", base_url="https://pulp.example")
+            server_cache_dir = server.cache_dir
+            self.assertEqual(server_cache_dir, os.path.join(cache_dir, str(server.pk)))
+            os.makedirs(server_cache_dir)
+            with self.captureOnCommitCallbacks(execute=True):
+                server.delete()
+            self.assertFalse(os.path.exists(server_cache_dir))
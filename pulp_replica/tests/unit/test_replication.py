@@ -0,0 +1,318 @@
+import os
+import uuid
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
+
+import requests
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from pulp_replica.app.models import (
+    ReplicationChunk,
+    ReplicationRecord,
+    ReplicationState,
+    Server,
+)
+from pulp_replica.app.tasks.replication import (
+    chunk_of,
+    finish_replication,
+    reconcile_distributions,
+    replicate_plugin,
+    split_distributions,
+)
+from pulp_replica.app.tasks.updating import update_server
+
+from pulpcore.plugin.constants import TASK_STATES
+from pulpcore.plugin.models import Task
+
+
+def distributions(*names):
+    return [{"name": name, "repository": None, "publication": None} for name in names]
+
+
+def names(chunks):
+    return [[distro["name"] for distro in chunk] for chunk in chunks]
+
+
+class TestSplitDistributions(TestCase):
+    """Test the split of the upstream distributions of a replication into chunks."""
+
+    def test_by_count(self):
+        """Test that chunks hold up to chunk_size distributions, across pages."""
+        pages = [distributions("a", "b", "c"), distributions("d", "e"), distributions("f")]
+        chunks = split_distributions(iter(pages), chunk_size=2)
+        self.assertEqual(names(chunks), [["a", "b"], ["c", "d"], ["e", "f"]])
+
+    def test_by_count_remainder(self):
+        """Test that the last chunk holds the remaining distributions."""
+        chunks = split_distributions([distributions("a", "b", "c")], chunk_size=2)
+        self.assertEqual(names(chunks), [["a", "b"], ["c"]])
+
+    def test_empty(self):
+        """Test that no chunk is made without distributions."""
+        self.assertEqual(list(split_distributions([], chunk_size=2)), [])
+        self.assertEqual(list(split_distributions([[], []], chunks=4, chunk_size=2)), [])
+
+    def test_chunks_are_yielded_while_listing(self):
+        """Test that a full chunk is yielded before the next page is listed."""
+        listed = []
+
+        def pages():
+            for page in (distributions("a", "b"), distributions("c")):
+                listed.append(page)
+                yield page
+
+        chunks = split_distributions(pages(), chunk_size=2)
+        self.assertEqual(names([next(chunks)]), [["a", "b"]])
+        self.assertEqual(len(listed), 1)
+
+    def test_by_hash(self):
+        """Test that distributions are spread over buckets by a stable hash of their name."""
+        all_names = [f"distribution-{i}" for i in range(50)]
+        chunks = list(split_distributions([distributions(*all_names)], chunks=4, chunk_size=100))
+        self.assertLessEqual(len(chunks), 4)
+        for chunk in chunks:
+            buckets = {chunk_of(distro["name"], 4) for distro in chunk}
+            self.assertEqual(len(buckets), 1)
+        self.assertCountEqual(sum(names(chunks), []), all_names)
+
+        again = list(split_distributions([distributions(*reversed(all_names))], chunks=4))
+        self.assertEqual(
+            sorted(sorted(chunk) for chunk in names(chunks)),
+            sorted(sorted(chunk) for chunk in names(again)),
+        )
+
+    def test_by_hash_full_buckets(self):
+        """Test that a bucket is yielded as a chunk whenever it reaches chunk_size."""
+        all_names = [f"distribution-{i}" for i in range(50)]
+        chunks = list(split_distributions([distributions(*all_names)], chunks=2, chunk_size=5))
+        self.assertTrue(all(len(chunk) <= 5 for chunk in chunks))
+        for chunk in chunks:
+            self.assertEqual(len({chunk_of(distro["name"], 2) for distro in chunk}), 1)
+        self.assertCountEqual(sum(names(chunks), []), all_names)
+
+    def test_skipped(self):
+        """Test that the distributions already in a chunk are left out."""
+        pages = [distributions("a", "b", "c", "d")]
+        chunks = split_distributions(pages, chunk_size=2, skipped={"b", "c"})
+        self.assertEqual(names(chunks), [["a", "d"]])
+
+
+class FakeReplicator:
+    """A replicator listing canned upstream distributions and recording the stale removals."""
+
+    pages = []
+    changed_pages = None
+    removed = []
+
+    def __init__(self, pulp_ctx, task_group, server):
+        self.feed_entities = {}
+        self.session = requests.Session()
+
+    def supports_incremental_replication(self):
+        return self.changed_pages is not None
+
+    def upstream_high_water_mark(self):
+        return timezone.now()
+
+    def get_upstream_distributions(self):
+        yield from self.pages
+
+    def get_changed_upstream_distributions(self, since):
+        yield from self.changed_pages
+
+    def remove_stale(self, names):
+        self.removed.append(names)
+
+
+class ReplicationTaskTestCase(TestCase):
+    """Run replication tasks as the current task, with a fake upstream and recorded dispatches."""
+
+    def setUp(self):
+        self.server = Server.objects.create(name="upstream", base_url="https://pulp.example")
+        task = Task.objects.create(name="replication", state=TASK_STATES.RUNNING)
+        self.dispatched = []
+        FakeReplicator.pages = []
+        FakeReplicator.changed_pages = None
+        FakeReplicator.removed = []
+        for patcher in (
+            mock.patch.dict(os.environ, {"PULP_TASK_ID": str(task.pk)}),
+            mock.patch("pulp_replica.app.tasks.replication.get_pulp_ctx"),
+            mock.patch(
+                "pulp_replica.app.tasks.replication.get_replicator", return_value=FakeReplicator
+            ),
+            mock.patch("pulp_replica.app.tasks.replication.dispatch", side_effect=self.dispatch),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def dispatch(self, func, **kwargs):
+        self.dispatched.append((func, kwargs["kwargs"]))
+        return SimpleNamespace(pk=uuid.uuid4())
+
+    def dispatched_chunks(self):
+        return [
+            ReplicationChunk.objects.get(pk=kwargs["chunk_pk"]).distributions
+            for func, kwargs in self.dispatched
+            if func is reconcile_distributions
+        ]
+
+    def create_checkpoint(self, chunks=(), listed=False, full_pass=True):
+        """Create a replication in progress, with chunks of (names, reconciled)."""
+        state = ReplicationState.objects.create(
+            server=self.server,
+            plugin="file",
+            high_water_mark=timezone.now() - timedelta(days=1),
+            last_full_pass=timezone.now() - timedelta(days=1),
+            checkpoint_started=timezone.now(),
+            checkpoint_high_water_mark=timezone.now(),
+            checkpoint_full_pass=full_pass,
+            checkpoint_listed=listed,
+        )
+        for chunk_names, reconciled in chunks:
+            ReplicationChunk.objects.create(
+                state=state, distributions=distributions(*chunk_names), reconciled=reconciled
+            )
+        return state
+
+
+class TestResumeReplication(ReplicationTaskTestCase):
+    """Test that resumed replications continue the checkpoint of the previous one."""
+
+    def test_resume_skips_chunked_names(self):
+        """Test that only unreconciled chunks and distributions not in a chunk are dispatched."""
+        state = self.create_checkpoint(chunks=[(["a", "b"], True), (["c"], False)])
+        FakeReplicator.pages = [distributions("a", "b", "c"), distributions("d", "e")]
+
+        replicate_plugin(str(self.server.pk), "file", resume=True)
+
+        self.assertEqual(names(self.dispatched_chunks()), [["c"], ["d", "e"]])
+        self.assertIs(self.dispatched[-1][0], finish_replication)
+        self.assertEqual(len(self.dispatched[-1][1]["task_pks"]), 3)
+        state.refresh_from_db()
+        self.assertTrue(state.checkpoint_listed)
+        self.assertEqual(state.chunks.count(), 3)
+
+    def test_resume_listed(self):
+        """Test that the upstream is not listed again once the listing completed."""
+        self.create_checkpoint(chunks=[(["a"], True), (["b"], False)], listed=True)
+        FakeReplicator.pages = [distributions("a", "b", "c")]
+
+        replicate_plugin(str(self.server.pk), "file", resume=True)
+
+        self.assertEqual(names(self.dispatched_chunks()), [["b"]])
+        self.assertIs(self.dispatched[-1][0], finish_replication)
+
+    def test_no_resume(self):
+        """Test that a new replication drops the checkpoint of the previous one."""
+        state = self.create_checkpoint(chunks=[(["a", "b"], True), (["c"], False)])
+        FakeReplicator.pages = [distributions("a", "b", "c")]
+
+        replicate_plugin(str(self.server.pk), "file")
+
+        self.assertEqual(names(self.dispatched_chunks()), [["a", "b", "c"]])
+        state.refresh_from_db()
+        self.assertEqual(state.chunks.count(), 1)
+        self.assertTrue(state.checkpoint_full_pass)
+
+
+class TestFullPass(ReplicationTaskTestCase):
+    """Test when a replication lists all the upstream distributions instead of the changed ones."""
+
+    def test_server_update(self):
+        """Test that the replication after an update of the server is a full pass."""
+        FakeReplicator.pages = [distributions("a", "b")]
+        FakeReplicator.changed_pages = [distributions("b")]
+        ReplicationState.objects.create(
+            server=self.server,
+            plugin="file",
+            high_water_mark=timezone.now(),
+            last_full_pass=timezone.now(),
+        )
+
+        replicate_plugin(str(self.server.pk), "file")
+        self.assertEqual(names(self.dispatched_chunks()), [["b"]])
+
+        update_server(str(self.server.pk), {"policy": "on_demand"}, partial=True)
+        self.dispatched.clear()
+        replicate_plugin(str(self.server.pk), "file")
+        self.assertEqual(names(self.dispatched_chunks()), [["a", "b"]])
+
+
+class TestFinishReplication(ReplicationTaskTestCase):
+    """Test that a replication only completes once all its distributions were reconciled."""
+
+    def assertNotAdvanced(self, state):
+        high_water_mark = state.high_water_mark
+        checkpoint_started = state.checkpoint_started
+        state.refresh_from_db()
+        self.assertEqual(state.high_water_mark, high_water_mark)
+        self.assertEqual(state.checkpoint_started, checkpoint_started)
+        self.assertTrue(state.chunks.exists())
+        self.assertEqual(FakeReplicator.removed, [])
+
+    def test_listing_incomplete(self):
+        """Test that the checkpoint is kept if the listing did not complete."""
+        state = self.create_checkpoint(chunks=[(["a"], True)])
+        finish_replication(str(self.server.pk), "file", [])
+        self.assertNotAdvanced(state)
+
+    def test_chunk_not_reconciled(self):
+        """Test that the checkpoint is kept if a chunk was not fully reconciled."""
+        state = self.create_checkpoint(chunks=[(["a"], True), (["b"], False)], listed=True)
+        finish_replication(str(self.server.pk), "file", [])
+        self.assertNotAdvanced(state)
+
+    def test_incremental(self):
+        """Test that a complete incremental replication advances the high water mark."""
+        state = self.create_checkpoint(chunks=[(["a"], True)], listed=True, full_pass=False)
+        checkpoint_high_water_mark = state.checkpoint_high_water_mark
+        last_full_pass = state.last_full_pass
+
+        finish_replication(str(self.server.pk), "file", [])
+
+        state.refresh_from_db()
+        self.assertEqual(state.high_water_mark, checkpoint_high_water_mark)
+        self.assertEqual(state.last_full_pass, last_full_pass)
+        self.assertIsNone(state.checkpoint_started)
+        self.assertFalse(state.checkpoint_listed)
+        self.assertFalse(state.chunks.exists())
+        self.assertEqual(FakeReplicator.removed, [])
+
+    def test_full_pass(self):
+        """Test that a complete full replication removes the stale objects."""
+        state = self.create_checkpoint(
+            chunks=[(["a", "b"], True), (["c"], True)], listed=True, full_pass=True
+        )
+        checkpoint_started = state.checkpoint_started
+
+        finish_replication(str(self.server.pk), "file", [])
+
+        state.refresh_from_db()
+        self.assertEqual(state.last_full_pass, checkpoint_started)
+        self.assertIsNone(state.checkpoint_started)
+        self.assertEqual(FakeReplicator.removed, [{"a", "b", "c"}])
+
+    def test_prune_records(self):
+        """Test that the records of the plugin's syncs past the retention are deleted."""
+        self.create_checkpoint(chunks=[(["a"], False)], listed=True)
+        now = timezone.now()
+        for plugin, days in (("file", 1), ("file", 3), ("rpm", 3)):
+            ReplicationRecord.objects.create(
+                server=self.server,
+                name=f"{plugin}-{days}",
+                plugin=plugin,
+                started=now - timedelta(days=days),
+                result=TASK_STATES.COMPLETED,
+            )
+
+        with override_settings(REPLICATION_HISTORY_RETENTION=None):
+            finish_replication(str(self.server.pk), "file", [])
+        self.assertEqual(ReplicationRecord.objects.count(), 3)
+
+        with override_settings(REPLICATION_HISTORY_RETENTION=2 * 24 * 3600):
+            finish_replication(str(self.server.pk), "file", [])
+        self.assertCountEqual(
+            ReplicationRecord.objects.values_list("name", flat=True), ["file-1", "rpm-3"]
+        )
@@ -0,0 +1,298 @@
+import os
+import uuid
+from types import SimpleNamespace
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from pulp_replica.app.models import ReplicatedRepository, Server
+from pulp_replica.app.replicators.file import FileReplicator
+from pulp_replica.app.tasks.removing import remove_stale
+from pulp_replica.app.tasks.synchronizing import synchronize
+from pulp_replica.app.tasks.updating import update_server
+from pulp_replica.app.utils import locked_resources
+from pulp_replica.app.viewsets import ServerViewSet
+
+from pulpcore.plugin.constants import TASK_STATES
+from pulpcore.plugin.models import Remote, Task, TaskGroup
+from pulpcore.plugin.util import get_url
+
+from pulp_file.app.models import FileDistribution, FileRemote, FileRepository
+
+REPOSITORY_HREF = "/pulp/api/v3/repositories/file/file/0123/"
+
+
+def upstream_distribution(name):
+    return {
+        "name": name,
+        "base_path": name,
+        "base_url": f"https://pulp.example/pulp/content/{name}/",
+        "repository": REPOSITORY_HREF,
+        "publication": None,
+    }
+
+
+class TestLockedResources(TestCase):
+    """Test the lookup of the resources held by unfinished tasks."""
+
+    def task(self, state, *resources):
+        return Task.objects.create(
+            name="task", state=state, reserved_resources_record=list(resources)
+        )
+
+    def test_locked_resources(self):
+        """Test that exclusive and shared reservations of waiting and running tasks count."""
+        self.task(TASK_STATES.WAITING, "/a/", "/other/")
+        self.task(TASK_STATES.RUNNING, "shared:/b/")
+        self.task(TASK_STATES.COMPLETED, "/c/")
+        self.task(TASK_STATES.FAILED, "shared:/d/")
+        self.assertEqual(locked_resources(["/a/", "/b/", "/c/", "/d/", "/e/"]), {"/a/", "/b/"})
+
+    def test_no_resources(self):
+        """Test that nothing is locked among no resources."""
+        self.assertEqual(locked_resources([]), set())
+
+
+class TestReplicateSyncs(TestCase):
+    """Test which repositories a replication dispatches syncs for."""
+
+    def setUp(self):
+        self.server = Server.objects.create(name="upstream", base_url="https://pulp.example")
+        self.dispatched = []
+        patcher = mock.patch(
+            "pulp_replica.app.replicators.base.dispatch",
+            side_effect=lambda func, **kwargs: self.dispatched.append(func),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def replicator(self, version):
+        """Return a replicator of an upstream repository serving a version of it."""
+        replicator = FileReplicator(None, None, self.server)
+        replicator.feed_entities = {
+            REPOSITORY_HREF: {
+                "pulp_href": REPOSITORY_HREF,
+                "latest_version_href": f"{REPOSITORY_HREF}versions/{version}/",
+                "manifest": "PULP_MANIFEST",
+            }
+        }
+        return replicator
+
+    def replicate(self, version):
+        """Replicate an upstream distribution serving a version of its repository."""
+        self.dispatched.clear()
+        replicator = self.replicator(version)
+        replicator.replicate([upstream_distribution("a")])
+        return replicator
+
+    def plan(self, version):
+        """Return the actions planned for an upstream distribution serving a version."""
+        (actions,) = self.replicator(version).plan([upstream_distribution("a")])
+        return actions
+
+    def syncs(self):
+        return self.dispatched.count(synchronize)
+
+    def synced(self, version):
+        """Record the sync of a version like a completed sync does."""
+        ReplicatedRepository.objects.filter(server=self.server).update(
+            upstream_content_href=f"{REPOSITORY_HREF}versions/{version}/"
+        )
+
+    def test_sync_when_changed(self):
+        """Test that a repository is only synced when its upstream content changed."""
+        self.replicate(1)
+        self.assertEqual(self.syncs(), 1)
+        self.synced(1)
+
+        self.replicate(1)
+        self.assertEqual(self.syncs(), 0)
+
+        self.replicate(2)
+        self.assertEqual(self.syncs(), 1)
+
+    def test_sync_in_progress(self):
+        """Test that a repository is not synced again while a previous sync is not finished."""
+        self.replicate(1)
+        repository = ReplicatedRepository.objects.get(server=self.server).repository
+        task = Task.objects.create(
+            name="synchronize",
+            state=TASK_STATES.RUNNING,
+            reserved_resources_record=[get_url(repository), f"shared:{get_url(repository.remote)}"],
+        )
+
+        replicator = self.replicate(2)
+        self.assertEqual(self.syncs(), 0)
+        self.assertEqual(replicator.metrics.counters["syncs_in_progress"], 1)
+
+        task.state = TASK_STATES.COMPLETED
+        task.save()
+        self.replicate(2)
+        self.assertEqual(self.syncs(), 1)
+
+    def test_resync_on_policy_change(self):
+        """Test that switching the policy to immediate plans and dispatches a sync."""
+        self.server.policy = Remote.ON_DEMAND
+        self.server.save()
+        self.replicate(1)
+        self.synced(1)
+        self.assertNotIn("sync", self.plan(1))
+
+        self.server.policy = Remote.IMMEDIATE
+        self.server.save()
+        self.assertTrue(self.plan(1)["sync"])
+        self.assertEqual(self.plan(1)["remote"], "update")
+        self.replicate(1)
+        self.assertEqual(self.syncs(), 1)
+
+        self.synced(1)
+        self.assertNotIn("sync", self.plan(1))
+        self.replicate(1)
+        self.assertEqual(self.syncs(), 0)
+
+    def test_server_update(self):
+        """Test that an updated server setting reaches the existing remotes."""
+        self.replicate(1)
+        self.synced(1)
+        update_server(str(self.server.pk), {"download_concurrency": 4}, partial=True)
+        self.server.refresh_from_db()
+
+        self.assertEqual(self.plan(1)["remote"], "update")
+        self.replicate(1)
+        remote = ReplicatedRepository.objects.get(server=self.server).repository.remote
+        self.assertEqual(remote.download_concurrency, 4)
+        self.assertEqual(self.syncs(), 0)
+
+
+class TestServerUpdate(TestCase):
+    """Test the update of a server through the API."""
+
+    def test_partial_update(self):
+        """Test that the update is validated, then dispatched in a task reserving the server."""
+        server = Server.objects.create(name="upstream", base_url="https://pulp.example")
+        user = get_user_model().objects.create(username="admin", is_superuser=True)
+        view = ServerViewSet.as_view({"patch": "partial_update"})
+
+        def patch(data):
+            request = APIRequestFactory().patch("/servers/", data, format="json")
+            force_authenticate(request, user=user)
+            return view(request, pk=str(server.pk))
+
+        with mock.patch(
+            "pulp_replica.app.viewsets.dispatch", return_value=SimpleNamespace(pk=uuid.uuid4())
+        ) as dispatch:
+            self.assertEqual(patch({"download_concurrency": 0}).status_code, 400)
+            dispatch.assert_not_called()
+
+            self.assertEqual(patch({"download_concurrency": 4}).status_code, 202)
+        dispatch.assert_called_once_with(
+            update_server,
+            exclusive_resources=[server],
+            kwargs={
+                "server_pk": str(server.pk),
+                "data": {"download_concurrency": 4},
+                "partial": True,
+            },
+        )
+
+
+class TestRemoveStale(TestCase):
+    """Test the removal of the objects replicated from upstream distributions that are gone."""
+
+    def setUp(self):
+        self.server = Server.objects.create(name="upstream", base_url="https://pulp.example")
+        self.other = Server.objects.create(name="other", base_url="https://other.example")
+        for name in ("a", "b", "c", "d"):
+            self.replicated(self.server, name)
+        self.replicated(self.other, "e")
+        task = Task.objects.create(
+            name="remove_stale",
+            state=TASK_STATES.RUNNING,
+            task_group=TaskGroup.objects.create(description="replication"),
+        )
+        self.dispatched = []
+        self.cleanups = []
+        for patcher in (
+            mock.patch.dict(os.environ, {"PULP_TASK_ID": str(task.pk)}),
+            mock.patch(
+                "pulp_replica.app.replicators.base.dispatch",
+                side_effect=lambda func, **kwargs: self.dispatched.append(kwargs),
+            ),
+            mock.patch(
+                "pulp_replica.app.tasks.removing.dispatch",
+                side_effect=lambda func, **kwargs: self.cleanups.append(func),
+            ),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def replicated(self, server, name):
+        remote = FileRemote.objects.create(name=name, url=f"{server.base_url}/{name}/")
+        repository = FileRepository.objects.create(name=name, remote=remote)
+        FileDistribution.objects.create(name=name, base_path=name, repository=repository)
+        ReplicatedRepository.objects.create(server=server, repository=repository)
+
+    def remove_stale(self, names, stale_policy=Server.DETACH):
+        """Remove the stale objects like the dispatched task would, returning its kwargs."""
+        self.server.stale_policy = stale_policy
+        replicator = FileReplicator(None, None, self.server)
+        replicator.remove_stale(set(names))
+        if not self.dispatched:
+            return None
+        kwargs = self.dispatched.pop()["kwargs"]
+        remove_stale(**kwargs)
+        return kwargs
+
+    def names(self, model):
+        return set(model.objects.values_list("name", flat=True))
+
+    def test_stale_repositories(self):
+        """Test that the repositories of the server without an upstream distribution are stale."""
+        replicator = FileReplicator(None, None, self.server)
+        stale = replicator.stale_repositories({"a", "b", "c", "e"})
+        self.assertEqual([repository.name for repository in stale], ["d"])
+        self.assertEqual(replicator.stale_repositories({"a", "b", "c", "d"}), [])
+
+    def test_detach(self):
+        """Test that detaching removes the distributions and remotes, but keeps the repositories."""
+        kwargs = self.remove_stale({"a", "b", "c"})
+        self.assertFalse(kwargs["delete_repositories"])
+        self.assertEqual(self.names(FileDistribution), {"a", "b", "c", "e"})
+        self.assertEqual(self.names(FileRemote), {"a", "b", "c", "e"})
+        self.assertEqual(self.names(FileRepository), {"a", "b", "c", "d", "e"})
+        self.assertFalse(ReplicatedRepository.objects.filter(repository__name="d").exists())
+        self.assertEqual(self.cleanups, [])
+
+    def test_delete(self):
+        """Test that deleting removes the repositories too, followed by an orphan cleanup."""
+        kwargs = self.remove_stale({"a", "b", "c"}, stale_policy=Server.DELETE)
+        self.assertTrue(kwargs["delete_repositories"])
+        self.assertEqual(self.names(FileDistribution), {"a", "b", "c", "e"})
+        self.assertEqual(self.names(FileRemote), {"a", "b", "c", "e"})
+        self.assertEqual(self.names(FileRepository), {"a", "b", "c", "e"})
+        self.assertEqual(len(self.cleanups), 1)
+
+    def test_keep(self):
+        """Test that nothing is removed if the server keeps the stale objects."""
+        self.assertIsNone(self.remove_stale({"a"}, stale_policy=Server.KEEP))
+        self.assertEqual(self.names(FileRepository), {"a", "b", "c", "d", "e"})
+
+    def test_empty_listing(self):
+        """Test that nothing is removed if the upstream selected no distribution at all."""
+        with override_settings(REPLICATION_STALE_MAX_FRACTION=None):
+            self.assertIsNone(self.remove_stale(set(), stale_policy=Server.DELETE))
+        self.assertEqual(self.names(FileDistribution), {"a", "b", "c", "d", "e"})
+        self.assertEqual(self.names(FileRepository), {"a", "b", "c", "d", "e"})
+
+    def test_max_fraction(self):
+        """Test that nothing is removed if too many repositories would be removed."""
+        with override_settings(REPLICATION_STALE_MAX_FRACTION=0.5):
+            self.assertIsNone(self.remove_stale({"a"}))
+            self.assertIsNotNone(self.remove_stale({"a", "b"}))
+        self.assertEqual(self.names(FileDistribution), {"a", "b", "e"})
+
+        with override_settings(REPLICATION_STALE_MAX_FRACTION=None):
+            self.assertIsNotNone(self.remove_stale({"a"}))
+        self.assertEqual(self.names(FileDistribution), {"a", "e"})
@@ -0,0 +1,78 @@
+from django.db.models import Count, Max, Q, Sum
+from django.test import TestCase
+from django.utils import timezone
+
+from pulp_replica.app.models import ReplicationRecord, Server
+from pulp_replica.app.utils import Percentile
+
+from pulpcore.plugin.constants import TASK_STATES
+
+
+class TestReplicationStats(TestCase):
+    """Test the aggregation of the replication history into statistics."""
+
+    def setUp(self):
+        self.server = Server.objects.create(name="upstream", base_url="https://pulp.example")
+        for name, durations in (("a", [1, 2, 3, 4]), ("b", [10, 20]), ("c", [5])):
+            for duration in durations:
+                self.record(name, duration)
+
+    def record(self, name, duration, result=TASK_STATES.COMPLETED, bytes_downloaded=0):
+        return ReplicationRecord.objects.create(
+            server=self.server,
+            name=name,
+            plugin="file",
+            started=timezone.now(),
+            duration=duration,
+            bytes_downloaded=bytes_downloaded,
+            result=result,
+        )
+
+    def test_percentiles(self):
+        """Test that the percentiles are interpolated between the durations."""
+        stats = ReplicationRecord.objects.filter(name="a").aggregate(
+            p50=Percentile("duration", 0.5), p95=Percentile("duration", 0.95)
+        )
+        self.assertAlmostEqual(stats["p50"], 2.5)
+        self.assertAlmostEqual(stats["p95"], 3.85)
+
+    def test_single_record(self):
+        """Test that the percentiles of a single duration are that duration."""
+        stats = ReplicationRecord.objects.filter(name="c").aggregate(
+            p50=Percentile("duration", 0.5), p95=Percentile("duration", 0.95)
+        )
+        self.assertEqual(stats, {"p50": 5, "p95": 5})
+
+    def test_no_records(self):
+        """Test that the percentiles of no durations are null."""
+        stats = ReplicationRecord.objects.filter(name="d").aggregate(
+            p50=Percentile("duration", 0.5)
+        )
+        self.assertIsNone(stats["p50"])
+
+    def test_group_by(self):
+        """Test the statistics per distribution, with the slowest syncs first, as served."""
+        self.record("b", 30, result=TASK_STATES.FAILED, bytes_downloaded=2**40)
+        self.record("b", 40, bytes_downloaded=2**40)
+        stats = list(
+            ReplicationRecord.objects.filter(server=self.server)
+            .order_by()
+            .values("name")
+            .annotate(
+                count=Count("pk"),
+                failed=Count("pk", filter=Q(result=TASK_STATES.FAILED)),
+                duration_p50=Percentile("duration", 0.5),
+                duration_p95=Percentile("duration", 0.95),
+                duration_max=Max("duration"),
+                bytes_downloaded=Sum("bytes_downloaded"),
+            )
+            .order_by("-duration_p95")
+        )
+        self.assertEqual([group["name"] for group in stats], ["b", "c", "a"])
+        b = stats[0]
+        self.assertEqual(b["count"], 4)
+        self.assertEqual(b["failed"], 1)
+        self.assertAlmostEqual(b["duration_p50"], 25)
+        self.assertAlmostEqual(b["duration_p95"], 38.5)
+        self.assertEqual(b["duration_max"], 40)
+        self.assertEqual(b["bytes_downloaded"], 2**41)
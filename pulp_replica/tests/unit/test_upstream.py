@@ -0,0 +1,201 @@
+import base64
+import json
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPMessage
+from types import SimpleNamespace
+from unittest import mock
+from urllib.parse import parse_qs, urlsplit
+
+import requests
+from django.test import TestCase
+
+from pulp_replica.app.models import Server
+from pulp_replica.app.upstream import SessionAuth, use_session_auth
+
+API_URL = "https://pulp.example/pulp/api/v3/status/"
+NOT_PROVIDED = "Authentication credentials were not provided."
+PERMISSION_DENIED = "You do not have permission to perform this action."
+
+
+class FakeUpstreamAdapter(requests.adapters.BaseAdapter):
+    """A transport adapter answering like the login view and the API of an upstream Pulp."""
+
+    def __init__(self, rejection=401, concurrent_rejections=1):
+        """
+        :param rejection: Status code the API answers requests with a rejected session with
+        :param concurrent_rejections: Number of rejected requests answered together
+        """
+        super().__init__()
+        self.rejection = rejection
+        self.barrier = threading.Barrier(concurrent_rejections, timeout=10)
+        self.lock = threading.Lock()
+        self.sessions = set()
+        self.logins = 0
+        self.login_fails = False
+        self.denied = False
+
+    def response(self, request, status, body=None, cookies=None):
+        message = HTTPMessage()
+        for name, value in (cookies or {}).items():
+            message["Set-Cookie"] = f"{name}={value}; Path=/"
+        response = requests.Response()
+        response.status_code = status
+        response.headers["Content-Type"] = "application/json"
+        response._content = json.dumps(body or {}).encode()
+        response._content_consumed = True
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        # Cookies are read from the headers of the original response of urllib3
+        response.raw = SimpleNamespace(_original_response=SimpleNamespace(msg=message))
+        requests.cookies.extract_cookies_to_jar(response.cookies, request, response.raw)
+        return response
+
+    def cookie(self, request, name):
+        cookies = request.headers.get("Cookie", "").split("; ")
+        return next((c.split("=", 1)[1] for c in cookies if c.startswith(f"{name}=")), None)
+
+    def login(self, request):
+        if self.login_fails:
+            return self.response(request, 500)
+        if request.method == "GET":
+            return self.response(request, 200, cookies={"csrftoken": "token"})
+        form = parse_qs(request.body)
+        if form != {
+            "username": ["admin"],
+            "password": ["password"],
+            "csrfmiddlewaretoken": [self.cookie(request, "csrftoken")],
+        }:
+            return self.response(request, 403)
+        session_id = uuid.uuid4().hex
+        with self.lock:
+            self.logins += 1
+            self.sessions.add(session_id)
+        return self.response(request, 302, cookies={"sessionid": session_id})
+
+    def api(self, request):
+        basic = base64.b64encode(b"admin:password").decode()
+        if request.headers.get("Authorization") != f"Basic {basic}":
+            if self.cookie(request, "sessionid") not in self.sessions:
+                self.barrier.wait()
+                detail = "Invalid session." if self.rejection == 401 else NOT_PROVIDED
+                return self.response(request, self.rejection, {"detail": detail})
+        if self.denied:
+            return self.response(request, 403, {"detail": PERMISSION_DENIED})
+        return self.response(request, 200, {"versions": []})
+
+    def send(self, request, **kwargs):
+        if urlsplit(request.url).path == "/auth/login/":
+            return self.login(request)
+        return self.api(request)
+
+    def close(self):
+        pass
+
+
+class TestSessionAuth(TestCase):
+    """Test the authentication of the API calls with a session of the upstream."""
+
+    def setUp(self):
+        self.server = Server(
+            name="upstream",
+            base_url="https://pulp.example",
+            username="admin",
+            password="password",
+        )
+        self.upstream = FakeUpstreamAdapter()
+        self.session = self.new_session()
+        self.session.auth = ("admin", "password")
+        # The login uses a session of its own
+        patcher = mock.patch.object(requests, "Session", side_effect=self.new_session)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def new_session(self):
+        session = requests.sessions.Session()
+        session.mount("https://", self.upstream)
+        return session
+
+    def use_session_auth(self):
+        use_session_auth(self.server, SimpleNamespace(api=SimpleNamespace(_session=self.session)))
+        return self.session.auth
+
+    def test_login(self):
+        """Test that the API calls use the session obtained by logging in once."""
+        auth = self.use_session_auth()
+        self.assertIsInstance(auth, SessionAuth)
+        self.assertIn(auth.session_id, self.upstream.sessions)
+
+        for _ in range(3):
+            response = self.session.get(API_URL)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn("Authorization", response.request.headers)
+        self.assertEqual(self.upstream.logins, 1)
+
+    def test_renew_after_401(self):
+        """Test that a rejected session is renewed and the request retried once."""
+        auth = self.use_session_auth()
+        expired_session_id = auth.session_id
+        self.upstream.sessions.clear()
+
+        response = self.session.get(API_URL)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r.status_code for r in response.history], [401])
+        self.assertEqual(self.upstream.logins, 2)
+        self.assertNotEqual(auth.session_id, expired_session_id)
+
+    def test_renew_after_403_not_provided(self):
+        """Test that a session answered as anonymous with a 403 is renewed."""
+        self.upstream.rejection = 403
+        self.use_session_auth()
+        self.upstream.sessions.clear()
+
+        response = self.session.get(API_URL)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.upstream.logins, 2)
+
+    def test_no_renewal_when_denied(self):
+        """Test that a permission denied to the session does not log in again."""
+        self.use_session_auth()
+        self.upstream.denied = True
+
+        response = self.session.get(API_URL)
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response.json()["detail"], PERMISSION_DENIED)
+        self.assertEqual(self.upstream.logins, 1)
+
+    def test_no_retry_when_login_fails(self):
+        """Test that the rejection is returned if logging in again fails."""
+        self.use_session_auth()
+        self.upstream.sessions.clear()
+        self.upstream.login_fails = True
+
+        response = self.session.get(API_URL)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.history, [])
+
+    def test_one_login_for_concurrent_rejections(self):
+        """Test that requests rejected at the same time share the session of one new login."""
+        threads = 4
+        self.upstream = FakeUpstreamAdapter(concurrent_rejections=threads)
+        self.session = self.new_session()
+        auth = self.use_session_auth()
+        self.upstream.sessions.clear()
+
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            responses = list(executor.map(lambda i: self.session.get(API_URL), range(threads)))
+        self.assertEqual([response.status_code for response in responses], [200] * threads)
+        self.assertEqual(self.upstream.logins, 2)
+        self.assertEqual(self.upstream.sessions, {auth.session_id})
+
+    def test_basic_auth_fallback(self):
+        """Test that basic auth is kept if the upstream does not allow logging in."""
+        self.upstream.login_fails = True
+        self.assertEqual(self.use_session_auth(), ("admin", "password"))
+
+        response = self.session.get(API_URL)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("Authorization", response.request.headers)
+        self.assertEqual(self.upstream.logins, 0)
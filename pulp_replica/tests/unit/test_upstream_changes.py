@@ -0,0 +1,180 @@
+from django.test import TestCase
+
+from pulp_replica.app.models import Server
+from pulp_replica.app.replicators.file import FileReplicator
+
+REPOSITORY_HREF = "/pulp/api/v3/repositories/file/file/0123/"
+
+
+def version_href(number, repository_href=REPOSITORY_HREF):
+    return f"{repository_href}versions/{number}/"
+
+
+def file(relative_path, sha256="0" * 64):
+    return {"relative_path": relative_path, "sha256": sha256}
+
+
+def content(*files):
+    """Return the content of a repository version, with some files that never change."""
+    return [file(f"unchanged-{i}") for i in range(10)] + list(files)
+
+
+class FakeUpstreamReplicator(FileReplicator):
+    """A file replicator listing canned upstream repository versions instead of an upstream."""
+
+    def __init__(self, versions, deleted=()):
+        """
+        :param versions: The content of each repository version, a list of lists of files
+        :param deleted: The numbers of the repository versions deleted upstream
+        """
+        super().__init__(None, None, Server(name="upstream", base_url="https://pulp.example"))
+        self.pages = {}
+        self.versions = []
+        previous = {}
+        for number, files in enumerate(versions):
+            present = {self.content_key(unit): unit for unit in files}
+            summary = {"added": {}, "removed": {}, "present": {}}
+            for kind, units in (
+                ("added", [unit for key, unit in present.items() if key not in previous]),
+                ("removed", [unit for key, unit in previous.items() if key not in present]),
+                ("present", list(present.values())),
+            ):
+                if units:
+                    href = f"{version_href(number)}{kind}/"
+                    self.pages[href] = units
+                    summary[kind]["file.file"] = {"count": len(units), "href": href}
+            if number not in deleted:
+                self.versions.append(
+                    {
+                        "pulp_href": version_href(number),
+                        "number": number,
+                        "content_summary": summary,
+                    }
+                )
+            previous = present
+
+    def iterate_upstream(self, href, params=None):
+        if href == f"{REPOSITORY_HREF}versions/":
+            return [
+                version
+                for version in self.versions
+                if int(params["number__gte"]) <= version["number"] <= int(params["number__lte"])
+            ]
+        return iter(self.pages[href])
+
+
+class TestUpstreamChanges(TestCase):
+    """Test the net changes computed between two upstream repository versions."""
+
+    def assertChanges(self, changes, added, removed):
+        self.assertIsNotNone(changes)
+        self.assertEqual(sorted(changes[0]), sorted(added))
+        self.assertEqual(sorted(changes[1]), sorted(removed))
+
+    def test_successive_versions(self):
+        """Test the changes of a single version."""
+        replicator = FakeUpstreamReplicator(
+            [content(file("a"), file("b")), content(file("a"), file("c"))]
+        )
+        changes = replicator.upstream_changes(version_href(0), version_href(1))
+        self.assertChanges(changes, added=[("c", "0" * 64)], removed=[("b", "0" * 64)])
+        self.assertEqual(changes[0][("c", "0" * 64)]["pulp_type"], "file.file")
+
+    def test_add_then_remove(self):
+        """Test that content added then removed again is not changed."""
+        replicator = FakeUpstreamReplicator(
+            [content(file("a")), content(file("a"), file("b")), content(file("a"))]
+        )
+        changes = replicator.upstream_changes(version_href(0), version_href(2))
+        self.assertChanges(changes, added=[], removed=[])
+
+    def test_remove_then_add(self):
+        """Test that content removed then added again is not changed."""
+        replicator = FakeUpstreamReplicator(
+            [content(file("a"), file("b")), content(file("a")), content(file("a"), file("b"))]
+        )
+        changes = replicator.upstream_changes(version_href(0), version_href(2))
+        self.assertChanges(changes, added=[], removed=[])
+
+    def test_add_remove_add(self):
+        """Test that content added, removed and added again across versions is added."""
+        replicator = FakeUpstreamReplicator(
+            [
+                content(file("a")),
+                content(file("a"), file("b")),
+                content(file("a")),
+                content(file("a"), file("b")),
+            ]
+        )
+        changes = replicator.upstream_changes(version_href(0), version_href(3))
+        self.assertChanges(changes, added=[("b", "0" * 64)], removed=[])
+
+    def test_remove_add_remove(self):
+        """Test that content removed, added and removed again across versions is removed."""
+        replicator = FakeUpstreamReplicator(
+            [
+                content(file("a"), file("b")),
+                content(file("a")),
+                content(file("a"), file("b")),
+                content(file("a")),
+            ]
+        )
+        changes = replicator.upstream_changes(version_href(0), version_href(3))
+        self.assertChanges(changes, added=[], removed=[("b", "0" * 64)])
+
+    def test_changed_checksum(self):
+        """Test that a file replaced at the same path is removed and added."""
+        replicator = FakeUpstreamReplicator([content(file("a")), content(file("a", "1" * 64))])
+        changes = replicator.upstream_changes(version_href(0), version_href(1))
+        self.assertChanges(changes, added=[("a", "1" * 64)], removed=[("a", "0" * 64)])
+
+    def test_deleted_intermediate_version(self):
+        """Test that the changes of a deleted version are still applied."""
+        versions = [
+            content(file("a")),
+            content(file("a"), file("b")),
+            content(file("a"), file("b"), file("c")),
+        ]
+        # Deleting version 1 squashes its changes into version 2
+        replicator = FakeUpstreamReplicator(versions, deleted=[1])
+        replicator.versions[-1]["content_summary"]["added"]["file.file"]["href"] = "squashed/"
+        replicator.versions[-1]["content_summary"]["added"]["file.file"]["count"] = 2
+        replicator.pages["squashed/"] = [file("b"), file("c")]
+        changes = replicator.upstream_changes(version_href(0), version_href(2))
+        self.assertChanges(changes, added=[("b", "0" * 64), ("c", "0" * 64)], removed=[])
+
+    def test_deleted_old_version(self):
+        """Test that a full sync is needed when the old version was deleted upstream."""
+        replicator = FakeUpstreamReplicator(
+            [content(file("a")), content(file("a"), file("b")), content(file("b"))], deleted=[0]
+        )
+        self.assertIsNone(replicator.upstream_changes(version_href(0), version_href(2)))
+
+    def test_missing_new_version(self):
+        """Test that a full sync is needed when the new version is not listed upstream."""
+        replicator = FakeUpstreamReplicator(
+            [content(file("a")), content(file("a"), file("b"))], deleted=[1]
+        )
+        self.assertIsNone(replicator.upstream_changes(version_href(0), version_href(1)))
+
+    def test_not_successive_versions(self):
+        """Test that a full sync is needed unless the new version follows the old one."""
+        replicator = FakeUpstreamReplicator([content(file("a")), content(file("a"), file("b"))])
+        self.assertIsNone(replicator.upstream_changes(version_href(1), version_href(0)))
+        self.assertIsNone(replicator.upstream_changes(version_href(1), version_href(1)))
+        self.assertIsNone(replicator.upstream_changes(None, version_href(1)))
+        self.assertIsNone(replicator.upstream_changes(version_href(0), REPOSITORY_HREF))
+        other_href = version_href(1, "/pulp/api/v3/repositories/file/file/4567/")
+        self.assertIsNone(replicator.upstream_changes(version_href(0), other_href))
+
+    def test_other_content_types(self):
+        """Test that a full sync is needed when content the replicator can't apply changed."""
+        replicator = FakeUpstreamReplicator([content(file("a")), content(file("a"), file("b"))])
+        summary = replicator.versions[1]["content_summary"]
+        summary["added"]["container.blob"] = summary["added"].pop("file.file")
+        self.assertIsNone(replicator.upstream_changes(version_href(0), version_href(1)))
+
+    def test_more_changes_than_content(self):
+        """Test that a full sync is needed when more content changed than the new version holds."""
+        replicator = FakeUpstreamReplicator([[file("a"), file("b")], [file("c")]])
+        self.assertIsNone(replicator.upstream_changes(version_href(0), version_href(1)))
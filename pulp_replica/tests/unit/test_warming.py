@@ -0,0 +1,55 @@
+import os
+from unittest import mock
+
+from django.test import TestCase
+
+from pulp_replica.app.content import warmable_base_paths
+from pulp_replica.app.models import ReplicatedRepository, RequestedPath, Server
+from pulp_replica.app.tasks.warming import warm_cache
+
+from pulpcore.plugin.constants import TASK_STATES
+from pulpcore.plugin.models import Remote, Task
+
+from pulp_file.app.models import FileDistribution, FileRemote, FileRepository
+
+
+class TestWarming(TestCase):
+    """Test which replicated content is counted and warmed."""
+
+    def setUp(self):
+        self.server = Server.objects.create(name="upstream", base_url="https://pulp.example")
+        self.repositories = {policy: self.replicated(policy) for policy, _ in Remote.POLICY_CHOICES}
+        task = Task.objects.create(name="warm_cache", state=TASK_STATES.RUNNING)
+        patcher = mock.patch.dict(os.environ, {"PULP_TASK_ID": str(task.pk)})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def replicated(self, policy):
+        remote = FileRemote.objects.create(
+            name=policy, url=f"{self.server.base_url}/{policy}/", policy=policy
+        )
+        repository = FileRepository.objects.create(name=policy, remote=remote)
+        FileDistribution.objects.create(name=policy, base_path=policy, repository=repository)
+        ReplicatedRepository.objects.create(server=self.server, repository=repository)
+        return repository
+
+    def test_warmable_base_paths(self):
+        """Test that only the requests of on_demand distributions are counted."""
+        self.assertEqual(warmable_base_paths(), {Remote.ON_DEMAND})
+
+    def test_streamed_not_warmed(self):
+        """Test that paths counted before a remote was switched to streamed are not warmed."""
+        for policy in (Remote.ON_DEMAND, Remote.STREAMED):
+            RequestedPath.objects.create(base_path=policy, relative_path="1.iso", count=1)
+
+        with mock.patch(
+            "pulp_replica.app.tasks.warming.missing_content_artifacts", return_value=[]
+        ) as missing_content_artifacts:
+            warm_cache(str(self.server.pk))
+
+        missing_content_artifacts.assert_called_once_with(
+            self.repositories[Remote.ON_DEMAND].pk, ["1.iso"]
+        )
+        self.assertEqual(
+            list(RequestedPath.objects.values_list("base_path", flat=True)), [Remote.STREAMED]
+        )